@@ -0,0 +1,195 @@
+"""Handler round-trip benchmark on synthetic Anki export files.
+
+Generates packages (see synth.py) over a matrix of note and media counts, and
+times Handler set-up, a no-op close, and the export after a single note edit,
+with raw and full repacking, for legacy (.anki21) and zstd (.anki21b)
+packages (the latter only with the zstd extra installed). Median seconds per
+case are written as JSON, and --compare reports (and fails on) regressions
+against an earlier result file.
+
+Usage: python benchmarks/roundtrip.py [--runs N] [--quick] [--json FILE]
+    [--compare BASELINE] [--tolerance FRACTION]
+"""
+import argparse
+import json
+import platform
+import shutil
+import statistics
+import subprocess  # noqa: S404 (runs git only)
+import sys
+from itertools import product
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Any
+
+from synth import make_package
+
+from anki_lu.anki import zstd
+from anki_lu.anki.conf import Configuration
+from anki_lu.anki.mgr import Handler
+
+#  (notes, media files) per package
+_matrix: list[tuple[int, int]] = [(1_000, 0), (1_000, 200), (20_000, 200)]
+_quick_matrix: list[tuple[int, int]] = [(500, 20)]
+_scenarios: tuple[str, ...] = ("open", "noop_close", "edit_raw", "edit_full")
+#  zstd packages (.anki21b) need the zstd extra, their cases are left out without
+_formats: tuple[str, ...] = ("anki21",) + (
+    ("anki21b",) if zstd.zstandard is not None else ()
+)
+
+
+def _edit(handler: Handler) -> None:
+    """Changes one note's fields, so that the deck must be re-exported."""
+    with handler.db.transaction() as conn:
+        conn.execute("UPDATE notes SET flds = flds || 'x', mod = mod + 1 WHERE id = 1")
+
+
+def time_scenario(pristine: Path, work: Path, scenario: str) -> float:
+    """Seconds spent on the timed part of one scenario run.
+
+    Args:
+        pristine: generated package, copied (untimed) before the run
+        work: empty directory for the package copy and work area
+        scenario: one of _scenarios
+
+    Returns:
+        Wall-clock seconds.
+    """
+    pkg: Path = work / pristine.name
+    shutil.copyfile(pristine, pkg)
+    conf: Configuration = Configuration(
+        zip_path=pkg,
+        deck_suffix="anki21",
+        repack="full" if scenario == "edit_full" else "raw",
+        work_dir=work,
+    )
+    start: float = perf_counter()
+    handler: Handler = Handler(conf)
+    opened: float = perf_counter()
+    if scenario.startswith("edit"):
+        _edit(handler)
+    closing: float = perf_counter()
+    handler.close()
+    closed: float = perf_counter()
+    return opened - start if scenario == "open" else closed - closing
+
+
+def measure(matrix: list[tuple[int, int]], runs: int) -> list[dict[str, Any]]:
+    """Median timings for each package size and scenario.
+
+    Args:
+        matrix: (notes, media files) of packages to generate
+        runs: timed runs per case
+
+    Returns:
+        One record per case, with package size and median seconds.
+    """
+    results: list[dict[str, Any]] = []
+    with TemporaryDirectory() as tmp:
+        for (notes, media), fmt in product(matrix, _formats):
+            pristine: Path = make_package(
+                Path(tmp) / f"synth_{notes}_{media}_{fmt}.apkg",
+                notes,
+                media,
+                zstd_format=fmt == "anki21b",
+            )
+            for scenario in _scenarios:
+                samples: list[float] = []
+                for run in range(runs):
+                    work: Path = Path(tmp) / f"run{run}_{scenario}"
+                    work.mkdir()
+                    samples.append(time_scenario(pristine, work, scenario))
+                    shutil.rmtree(work)
+                results.append(
+                    {
+                        "format": fmt,
+                        "notes": notes,
+                        "media": media,
+                        "package_bytes": pristine.stat().st_size,
+                        "scenario": scenario,
+                        "seconds": statistics.median(samples),
+                    }
+                )
+    return results
+
+
+def _case(record: dict[str, Any]) -> str:
+    """Key identifying a case across result files."""
+    size: str = f"{record['notes']}n/{record['media']}m"
+    return f"{record['scenario']} {record.get('format', 'anki21')} {size}"
+
+
+def compare(
+    baseline: list[dict[str, Any]],
+    current: list[dict[str, Any]],
+    tolerance: float,
+) -> list[str]:
+    """Prints time ratios of cases in both results.
+
+    Args:
+        baseline: records of an earlier run
+        current: records of this run
+        tolerance: slow-down fraction accepted as noise
+
+    Returns:
+        Cases slower than baseline by more than tolerance.
+    """
+    before: dict[str, float] = {_case(r): r["seconds"] for r in baseline}
+    regressions: list[str] = []
+    for record in current:
+        case: str = _case(record)
+        if case not in before:
+            continue
+        ratio: float = record["seconds"] / before[case]
+        print(f"{ratio:6.2f}x  {case}")
+        if ratio > 1 + tolerance:
+            regressions.append(f"{case} {ratio:.2f}x slower")
+    return regressions
+
+
+def _git_commit() -> str:
+    """Current commit, to tell result files apart."""
+    proc = subprocess.run(  # noqa: S603, S607
+        ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True
+    )
+    return proc.stdout.strip() or "unknown"
+
+
+def main() -> int:
+    """Runs benchmark, prints timings and any regressions."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--quick", action="store_true", help="small matrix only")
+    parser.add_argument("--json", type=Path, help="write results to file")
+    parser.add_argument("--compare", type=Path, help="earlier results file")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    if "anki21b" not in _formats:
+        print("anki21b cases skipped: zstd extra not installed", file=sys.stderr)
+
+    records: list[dict[str, Any]] = measure(
+        _quick_matrix if args.quick else _matrix, args.runs
+    )
+    for record in records:
+        print(f"{record['seconds'] * 1000:10.1f}ms  {_case(record)}")
+    result: dict[str, Any] = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "runs": args.runs,
+        "results": records,
+    }
+    if args.json:
+        args.json.write_text(json.dumps(result, indent=2))
+    if not args.compare:
+        return 0
+    baseline: dict[str, Any] = json.loads(args.compare.read_text())
+    failures: list[str] = compare(baseline["results"], records, args.tolerance)
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
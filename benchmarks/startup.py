@@ -0,0 +1,125 @@
+"""Start-up time benchmark for the anki-lu command-line entry point.
+
+Imports the CLI module in fresh interpreters with ``-X importtime``, records
+cumulative import time per module, and times ``anki-lu --version`` end to end.
+Fails (exit status 1) when a budget in startup_budget.json is exceeded, or a
+module the entry point must import lazily shows up at start-up.
+
+Usage: python benchmarks/startup.py [--runs N] [--json FILE]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess  # noqa: S404 (runs this interpreter only)
+import sys
+from pathlib import Path
+from time import perf_counter
+from typing import Any
+
+_budget_file: Path = Path(__file__).with_name("startup_budget.json")
+_entry_module: str = "anki_lu.__main__"
+_src_dir: Path = Path(__file__).parent.parent / "src"
+
+
+def _env() -> dict[str, str]:
+    """Environment for child interpreters, finding the source tree first."""
+    env: dict[str, str] = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in (str(_src_dir), env.get("PYTHONPATH", "")) if p
+    )
+    return env
+
+
+def import_times() -> dict[str, float]:
+    """Cumulative import time (ms) per module, for one cold import of the CLI."""
+    proc = subprocess.run(  # noqa: S603
+        [sys.executable, "-X", "importtime", "-c", f"import {_entry_module}"],
+        capture_output=True,
+        text=True,
+        env=_env(),
+        check=True,
+    )
+    times: dict[str, float] = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative) / 1000
+    return times
+
+
+def version_time() -> float:
+    """Wall-clock time (ms) of ``anki-lu --version``."""
+    start: float = perf_counter()
+    subprocess.run(  # noqa: S603
+        [sys.executable, "-m", "anki_lu", "--version"],
+        capture_output=True,
+        env=_env(),
+        check=True,
+    )
+    return (perf_counter() - start) * 1000
+
+
+def measure(runs: int) -> dict[str, Any]:
+    """Median timings over several runs.
+
+    Args:
+        runs: fresh interpreters started per measurement
+
+    Returns:
+        total and --version times, per-module import times (ms), and the
+        modules imported at start-up.
+    """
+    samples: list[dict[str, float]] = [import_times() for _ in range(runs)]
+    modules: dict[str, float] = {
+        name: statistics.median(s.get(name, 0) for s in samples) for name in samples[0]
+    }
+    return {
+        "total_ms": modules[_entry_module],
+        "version_ms": statistics.median(version_time() for _ in range(runs)),
+        "modules_ms": modules,
+    }
+
+
+def check(result: dict[str, Any], budget: dict[str, Any]) -> list[str]:
+    """Budget violations in result (empty if within budget)."""
+    failures: list[str] = [
+        f"{key} {result[key]:.1f}ms > {budget[key]}ms"
+        for key in ("total_ms", "version_ms")
+        if result[key] > budget[key]
+    ]
+    for name, limit in budget["modules_ms"].items():
+        spent: float = result["modules_ms"].get(name, 0)
+        if spent > limit:
+            failures.append(f"import {name} {spent:.1f}ms > {limit}ms")
+    failures.extend(
+        f"{name} imported at start-up"
+        for name in budget["forbidden"]
+        if name in result["modules_ms"]
+    )
+    return failures
+
+
+def main() -> int:
+    """Runs benchmark, prints slowest imports and any budget violations."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", type=Path, help="write results to file")
+    args = parser.parse_args()
+
+    result: dict[str, Any] = measure(args.runs)
+    slowest = sorted(result["modules_ms"].items(), key=lambda i: -i[1])[:10]
+    for name, spent in slowest:
+        print(f"{spent:8.1f}ms  {name}")
+    print(f"{result['version_ms']:8.1f}ms  anki-lu --version (wall clock)")
+    if args.json:
+        args.json.write_text(json.dumps(result, indent=2))
+    failures: list[str] = check(result, json.loads(_budget_file.read_text()))
+    for failure in failures:
+        print(f"OVER BUDGET: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""Generates synthetic Anki export files for benchmarks.
+
+Packages hold a real SQLite collection (notes, cards and review log) and media
+files with realistic sizes and compressibility: images and audio are random
+bytes behind their format's magic number, so they don't deflate, like the real
+thing. Packages can also be generated in the newer (Anki 2.1.50+) format, with
+zstd-compressed deck, media map and media.
+"""
+import json
+import random
+import sqlite3
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
+
+from anki_lu.anki import zstd
+from anki_lu.anki.schema import create_collection
+
+deck_name: str = "collection.anki21"
+model_id: int = 1342697561419
+deck_id: int = 1
+_model: dict[str, object] = {
+    "id": model_id,
+    "name": "Lëtzebuergesch",
+    "type": 0,
+    "sortf": 0,
+    "did": deck_id,
+    "flds": [
+        {"name": "Lëtzebuergesch", "ord": 0},
+        {"name": "English", "ord": 1},
+        {"name": "Audio", "ord": 2},
+        {"name": "Image", "ord": 3},
+    ],
+    "tmpls": [{"name": "LB > EN", "ord": 0}, {"name": "EN > LB", "ord": 1}],
+}
+_syllables: list[str] = "ge ech de en mo ien dd ë é ä schw ett aach la ss".split()
+#  (suffix, magic number, min size, max size) of generated media
+_media_kinds: list[tuple[str, bytes, int, int]] = [
+    ("jpg", b"\xff\xd8\xff\xe0", 20_000, 200_000),
+    ("mp3", b"ID3\x03", 10_000, 60_000),
+]
+_crt: int = 1_600_000_000
+
+
+def _word(rng: random.Random) -> str:
+    """Luxembourgish-looking word."""
+    return "".join(rng.choices(_syllables, k=rng.randint(2, 4))).capitalize()
+
+
+def make_deck(path: Path, notes: int, media_names: list[str], seed: int = 0) -> None:
+    """Creates collection with two cards and a few reviews per note.
+
+    Args:
+        path: SQLite file to create
+        notes: number of notes
+        media_names: media file names, referenced round-robin from notes
+        seed: random seed, same seed gives same deck
+    """
+    rng: random.Random = random.Random(seed)  # noqa: S311 (test data)
+    conn: sqlite3.Connection = sqlite3.connect(path)
+    create_collection(conn)
+    conn.execute(
+        "INSERT INTO col VALUES (1, ?, 0, 0, 11, 0, 0, 0, '{}', ?, ?, '{}', '{}')",
+        (
+            _crt,
+            json.dumps({str(model_id): _model}),
+            json.dumps({str(deck_id): {"id": deck_id, "name": "Default"}}),
+        ),
+    )
+    note_rows, card_rows, rev_rows = [], [], []
+    for nid in range(1, notes + 1):
+        lb: str = _word(rng)
+        media: str = media_names[nid % len(media_names)] if media_names else ""
+        flds: str = "\x1f".join(
+            (lb, f"word {nid}", f"[sound:{media}]" if media else "", "")
+        )
+        note_rows.append((nid, f"g{nid}", model_id, _crt, flds, lb, nid))
+        for ord_ in (0, 1):
+            cid: int = nid * 2 + ord_
+            card_rows.append((cid, nid, deck_id, ord_, rng.randint(0, 400)))
+            for r in range(rng.randint(0, 3)):
+                rev_id: int = (_crt * 1000) + cid * 10 + r
+                rev_rows.append((rev_id, cid, rng.randint(1, 4), r + 1))
+    conn.executemany(
+        "INSERT INTO notes VALUES (?, ?, ?, ?, 0, '', ?, ?, ?, 0, '')", note_rows
+    )
+    conn.executemany(
+        "INSERT INTO cards VALUES (?, ?, ?, ?, 0, 0, 2, 2, ?, 1, 2500, 1, 0, 0, 0, "
+        "0, 0, '')",
+        card_rows,
+    )
+    conn.executemany(
+        "INSERT INTO revlog VALUES (?, ?, 0, ?, ?, 0, 2500, 5000, 1)", rev_rows
+    )
+    conn.commit()
+    conn.close()
+
+
+def make_package(
+    path: Path, notes: int, media: int, seed: int = 0, zstd_format: bool = False
+) -> Path:
+    """Writes synthetic Anki export file.
+
+    Args:
+        path: .apkg file to create
+        notes: number of notes in collection
+        media: number of media files
+        seed: random seed, same seed gives same package
+        zstd_format: newer format, zstd deck (.anki21b), media map and media
+
+    Returns:
+        path, for convenience.
+    """
+    rng: random.Random = random.Random(seed)  # noqa: S311 (test data)
+    kinds = [_media_kinds[i % len(_media_kinds)] for i in range(media)]
+    names: dict[str, str] = {str(i): f"lb_{i}.{k[0]}" for i, k in enumerate(kinds)}
+    with TemporaryDirectory() as tmp, ZipFile(path, mode="w") as z:
+        deck: Path = Path(tmp) / deck_name
+        make_deck(deck, notes, list(names.values()), seed)
+        if zstd_format:
+            z.writestr(f"{deck_name}b", zstd.compress(deck.read_bytes()))
+            z.writestr("media", zstd.media_map(names))
+        else:
+            z.write(deck, arcname=deck_name, compress_type=ZIP_DEFLATED)
+            z.writestr("media", json.dumps(names), compress_type=ZIP_DEFLATED)
+        for i, (_, magic, low, high) in enumerate(kinds):
+            data: bytes = magic + rng.randbytes(rng.randint(low, high))
+            if zstd_format:
+                data = zstd.compress(data)
+            z.writestr(str(i), data, compress_type=ZIP_STORED)
+    return path
@@ -181,6 +181,21 @@ def coverage(session: Session) -> None:
     session.run("coverage", *args)
 
 
+@session(python=python_versions[0])
+def startup(session: Session) -> None:
+    """Check CLI start-up time against benchmarks/startup_budget.json."""
+    session.install(".")
+    session.run("python", "benchmarks/startup.py", *session.posargs)
+
+
+@session(python=python_versions[0])
+def benchmarks(session: Session) -> None:
+    """Time Handler round-trips on synthetic packages (see benchmarks/)."""
+    session.install(".")
+    args = session.posargs or ["--json", "benchmarks/roundtrip.json"]
+    session.run("python", "benchmarks/roundtrip.py", *args)
+
+
 @session(python=python_versions[0])
 def typeguard(session: Session) -> None:
     """Runtime type checking using Typeguard."""
@@ -1 +1,2 @@
 """Anki for Luxembourgish."""
+__version__: str = "0.0.0"  # kept in step with pyproject.toml
@@ -1,20 +1,430 @@
-"""Command-line interface."""
+"""Command-line interface.
+
+Only click is imported at module level: config, pydantic and archive handling
+are imported by the commands that use them, so e.g. --version starts fast. See
+benchmarks/startup.py for the import-time budget.
+"""
+from typing import TYPE_CHECKING, Optional
 
 import click
 
-from anki_lu.anki.mgr import Handler
-from anki_lu.conf import Configuration
-from anki_lu.conf_mgr import get_config_obj
+if TYPE_CHECKING:  # pragma: no cover
+    from anki_lu.anki.delta import DeltaSummary
+    from anki_lu.conf import Configuration
 
 
-@click.command()
+@click.group(invoke_without_command=True)
 @click.version_option()
-def main() -> None:
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="Print time and bytes spent per phase (config, open, export...).",
+)
+@click.option(
+    "--profile-json",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="Write per-phase profile to this JSON file.",
+)
+@click.pass_context
+def main(ctx: click.Context, profile: bool, profile_json: Optional[str]) -> None:
     """Anki for Luxembourgish."""
+    if profile or profile_json:
+        _profile(ctx, profile, profile_json)
+    if ctx.invoked_subcommand is not None:
+        return
+    from anki_lu.anki.mgr import Handler
+    from anki_lu.conf_mgr import get_config_obj
+
     # TODO refactor conf_mgr to simplify, also avoid assignment flag
     conf: Configuration = get_config_obj()  # type: ignore[assignment]
-    deck: Handler = Handler(conf.anki)
-    print(deck)
+    with Handler(conf.anki) as deck:
+        print(deck)
+
+
+def _profile(ctx: click.Context, table: bool, json_path: Optional[str]) -> None:
+    """Records profiling spans (see anki_lu.profiling), reported as command ends.
+
+    Spans of batch worker processes (for more than one package) aren't
+    included.
+
+    Args:
+        ctx: context of the group, reporting on close
+        table: whether to print a summary table (to stderr)
+        json_path: file to write the summary to, as JSON
+    """
+    from anki_lu.profiling import Recorder, add_hook, remove_hook
+
+    recorder: Recorder = Recorder()
+    add_hook(recorder)
+
+    def report() -> None:
+        remove_hook(recorder)
+        if table:
+            click.echo(recorder.table(), err=True)
+        if json_path:
+            with open(json_path, "w", encoding="utf-8") as f:
+                f.write(recorder.json())
+
+    ctx.call_on_close(report)
+
+
+@main.command()
+@click.argument("packages", nargs=-1, required=True)
+@click.option(
+    "-w",
+    "--workers",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Worker processes [default: one per core].",
+)
+def batch(packages: tuple[str, ...], workers: Optional[int]) -> None:
+    """Process many Anki export files (paths or glob patterns) in parallel."""
+    from anki_lu.batch import expand, run_batch
+    from anki_lu.conf_mgr import get_config_obj
+
+    conf: Configuration = get_config_obj()  # type: ignore[assignment]
+    results = run_batch(conf.anki, expand(packages), workers=workers)
+    for result in results:
+        status: str = "ok" if result.ok else "FAILED"
+        click.echo(f"{status:6} {result.path} ({result.seconds:.2f}s): {result.detail}")
+    failed: int = sum(not r.ok for r in results)
+    click.echo(f"{len(results) - failed} ok, {failed} failed")
+    if failed:
+        raise SystemExit(1)
+
+
+@main.command()
+@click.argument("packages", nargs=-1)
+@click.option(
+    "-w",
+    "--workers",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Threads checking members [default: one per core].",
+)
+def verify(packages: tuple[str, ...], workers: Optional[int]) -> None:
+    """Check Anki export files (default: configured one) before shipping them.
+
+    Members are checked against their CRCs, the deck with SQLite's
+    quick_check, and media referenced by notes against the media manifest.
+    Exits with 1 if any package has corrupt members, deck errors or missing
+    media (orphaned media is only reported).
+    """
+    from pathlib import Path
+
+    from anki_lu.anki.verify import verify as verify_package
+    from anki_lu.batch import expand
+    from anki_lu.conf_mgr import get_config_obj
+
+    conf: Configuration = get_config_obj()  # type: ignore[assignment]
+    paths: list[Path] = expand(packages) if packages else [conf.anki.zip_path]
+    failed: int = 0
+    for path in paths:
+        report = verify_package(conf.anki.copy(update={"zip_path": path}), workers)
+        failed += not report.ok
+        status: str = "ok" if report.ok else "FAILED"
+        click.echo(f"{status:6} {path} ({report.members} members)")
+        for kind in ("corrupt", "deck_errors", "missing", "orphaned"):
+            found: list[str] = getattr(report, kind)
+            if found:
+                click.echo(f"  {kind.replace('_', ' ')}: {', '.join(found)}")
+    if failed:
+        raise SystemExit(1)
+
+
+@main.command()
+@click.argument("packages", nargs=-1)
+@click.option(
+    "--interval",
+    type=click.FloatRange(min=0.01),
+    default=1.0,
+    show_default=True,
+    help="Seconds between polls.",
+)
+@click.option(
+    "--settle",
+    type=click.FloatRange(min=0),
+    default=2.0,
+    show_default=True,
+    help="Seconds a package must stay unchanged before it's re-read.",
+)
+def watch(packages: tuple[str, ...], interval: float, settle: float) -> None:
+    """Keep PACKAGES (default: configured one) open, re-read them when rewritten.
+
+    Only members whose CRC or size changed are re-read. Stop with Ctrl-C.
+    """
+    from pathlib import Path
+
+    from anki_lu.conf_mgr import get_config_obj
+    from anki_lu.watch import watch as watch_packages
+
+    conf: Configuration = get_config_obj()  # type: ignore[assignment]
+    paths = [Path(p) for p in packages] or [conf.anki.zip_path]
+    events = watch_packages(conf.anki, paths, interval=interval, settle=settle)
+    try:
+        for event in events:
+            status: str = "ok" if event.ok else "FAILED"
+            members: str = ", ".join(sorted(event.changed)) or "opened"
+            click.echo(
+                f"{status:6} {event.path} ({event.seconds:.2f}s, {members}): "
+                f"{event.detail}"
+            )
+    except KeyboardInterrupt:
+        events.close()
+
+
+@main.command()
+@click.argument("query")
+@click.option(
+    "-n",
+    "--limit",
+    type=click.IntRange(min=1),
+    default=20,
+    show_default=True,
+    help="Most notes shown.",
+)
+def search(query: str, limit: int) -> None:
+    """Find notes with all words of QUERY (a trailing * matches a prefix).
+
+    Spelling variants (ë/e, é, ä, n-rule forms like den/de) match each other.
+    The search index is brought up to date with the deck first.
+    """
+    from anki_lu.anki.mgr import Handler
+    from anki_lu.anki.search import SearchIndex
+    from anki_lu.conf_mgr import get_config_obj
+
+    conf: Configuration = get_config_obj()  # type: ignore[assignment]
+    with Handler(conf.anki) as handler, SearchIndex.for_package(conf.anki) as index:
+        index.update(handler.db)
+        for nid in index.search(query, limit):
+            note = handler.db.note(nid)
+            if note is not None:
+                click.echo(f"{nid}: {note['flds'].replace(chr(0x1F), ' | ')}")
+
+
+@main.command()
+@click.argument("original", type=click.Path(exists=True, dir_okay=False))
+@click.argument("modified", type=click.Path(exists=True, dir_okay=False))
+@click.argument("delta", type=click.Path(dir_okay=False, writable=True))
+def diff(original: str, modified: str, delta: str) -> None:
+    """Write DELTA of notes, cards and media taking ORIGINAL to MODIFIED."""
+    from pathlib import Path
+
+    from anki_lu.anki import delta as changeset
+    from anki_lu.conf_mgr import get_config_obj
+
+    conf: Configuration = get_config_obj()  # type: ignore[assignment]
+    summary = changeset.diff(
+        conf.anki.copy(update={"zip_path": Path(original)}),
+        conf.anki.copy(update={"zip_path": Path(modified)}),
+        Path(delta),
+    )
+    click.echo(_delta_report(summary))
+
+
+@main.command()
+@click.argument("delta", type=click.Path(exists=True, dir_okay=False))
+@click.argument("packages", nargs=-1, required=True)
+def apply(delta: str, packages: tuple[str, ...]) -> None:
+    """Apply DELTA (see diff) to copies of the original package."""
+    from pathlib import Path
+
+    from anki_lu.anki import delta as changeset
+    from anki_lu.conf_mgr import get_config_obj
+
+    conf: Configuration = get_config_obj()  # type: ignore[assignment]
+    for package in packages:
+        summary = changeset.apply(
+            conf.anki.copy(update={"zip_path": Path(package)}), Path(delta)
+        )
+        click.echo(f"{package}: {_delta_report(summary)}")
+
+
+def _delta_report(summary: "DeltaSummary") -> str:
+    """One-line description of delta size."""
+    return (
+        f"{summary.notes} notes and {summary.cards} cards added or updated, "
+        f"{summary.deleted} deleted, {summary.members} media members changed"
+    )
+
+
+@main.command()
+@click.option(
+    "--store",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="Media store directory [default: media_store of config].",
+)
+def gc(store: Optional[str]) -> None:
+    """Remove media store blobs that no package using the store holds."""
+    from pathlib import Path
+
+    from anki_lu.anki.media import MediaStore
+    from anki_lu.conf_mgr import get_config_obj
+
+    if store is None:
+        conf: Configuration = get_config_obj()  # type: ignore[assignment]
+        if conf.anki.media_store is None:
+            raise click.UsageError("no media store: set media_store, or use --store")
+        root: Path = conf.anki.media_store
+    else:
+        root = Path(store)
+    summary = MediaStore(root).gc()
+    click.echo(
+        f"{summary.blobs} blobs removed ({summary.bytes:,} bytes), "
+        f"{summary.packages} packages using store"
+    )
+
+
+@main.command()
+@click.option(
+    "--field",
+    type=click.IntRange(min=0),
+    default=0,
+    show_default=True,
+    help="Index of the field compared.",
+)
+@click.option("--all-fields", is_flag=True, help="Compare all fields of notes.")
+@click.option(
+    "--threshold",
+    type=click.FloatRange(min=0, max=1, min_open=True),
+    default=0.75,
+    show_default=True,
+    help="Similarity ratio of near duplicates.",
+)
+@click.option("--json", "as_json", is_flag=True, help="Write groups as JSON.")
+def dupes(field: int, all_fields: bool, threshold: float, as_json: bool) -> None:
+    """List groups of duplicate notes, then of near duplicates.
+
+    Fields are compared folded: case, diacritics, HTML, n-rule forms and
+    articles are ignored. Near duplicates are spelling variants, e.g. Kaz/Katz.
+    """
+    import json
+
+    from anki_lu.anki.duplicates import find_duplicates
+    from anki_lu.anki.mgr import Handler
+    from anki_lu.conf_mgr import get_config_obj
+
+    conf: Configuration = get_config_obj()  # type: ignore[assignment]
+    with Handler(conf.anki) as handler:
+        groups = find_duplicates(handler.db, None if all_fields else field, threshold)
+    if as_json:
+        click.echo(json.dumps([group._asdict() for group in groups], indent=2))
+        return
+    for group in groups:
+        ids: str = " ".join(map(str, group.note_ids))
+        click.echo(f"{group.kind:5} {ids}: {' | '.join(group.keys)}")
+
+
+@main.command()
+@click.argument("table", type=click.Choice(["notes", "cards", "revlog"]))
+@click.argument("output", type=click.Path(dir_okay=False))
+@click.option(
+    "--format",
+    "fmt",
+    type=click.Choice(["csv", "jsonl", "parquet"]),
+    help="Output format, by default taken from OUTPUT's suffix.",
+)
+@click.option("--model", help="Note type (name or id) of notes written.")
+def dump(table: str, output: str, fmt: Optional[str], model: Optional[str]) -> None:
+    """Write TABLE of deck to OUTPUT, e.g. notes.csv, for analytics.
+
+    Note fields get a column each, named after their note type's fields.
+    Rows are streamed, so memory use doesn't grow with the collection.
+    """
+    from pathlib import Path
+
+    from anki_lu.anki.mgr import Handler
+    from anki_lu.anki.tabular import export_table
+    from anki_lu.conf_mgr import get_config_obj
+
+    conf: Configuration = get_config_obj()  # type: ignore[assignment]
+    with Handler(conf.anki) as handler:
+        count: int = export_table(handler.db, table, Path(output), fmt, model)
+    click.echo(f"{count} {table} rows written to {output}")
+
+
+@main.command()
+@click.option(
+    "--threshold",
+    type=click.FloatRange(min=0, max=1),
+    help="Reclaimable share of deck needed, by default compact_threshold.",
+)
+@click.option(
+    "--page-size",
+    type=click.Choice([str(1 << n) for n in range(9, 17)]),
+    help="Bytes per page of compacted deck.",
+)
+def compact(threshold: Optional[float], page_size: Optional[str]) -> None:
+    """Compact deck (VACUUM), shrinking package after deletions or imports."""
+    from anki_lu.anki.mgr import Handler
+    from anki_lu.conf_mgr import get_config_obj
+
+    conf: Configuration = get_config_obj()  # type: ignore[assignment]
+    anki_conf = conf.anki
+    if page_size is not None:
+        anki_conf = anki_conf.copy(update={"compact_page_size": int(page_size)})
+    with Handler(anki_conf) as handler:
+        result = handler.compact(threshold)
+    if result.applied:
+        click.echo(
+            f"{result.saved} bytes saved "
+            f"({result.bytes_before} -> {result.bytes_after} bytes)"
+        )
+    else:
+        click.echo(f"not compacted: {result.free_ratio:.0%} reclaimable")
+
+
+@main.command()
+@click.option(
+    "--days",
+    type=click.IntRange(min=1),
+    default=30,
+    show_default=True,
+    help="Days of due forecast.",
+)
+@click.option(
+    "--top",
+    type=click.IntRange(min=0),
+    default=20,
+    show_default=True,
+    help="Notes with the highest lapse rates listed.",
+)
+@click.option(
+    "--format",
+    "fmt",
+    type=click.Choice(["json", "csv"]),
+    default="json",
+    show_default=True,
+)
+@click.option(
+    "--table",
+    type=click.Choice(["retention", "forecast", "notes"]),
+    default="retention",
+    show_default=True,
+    help="Table written as CSV (JSON holds all).",
+)
+def stats(days: int, top: int, fmt: str, table: str) -> None:
+    """Review statistics: retention by interval, due forecast, hardest notes."""
+    import csv
+    import json
+    import sys
+
+    from anki_lu.anki.mgr import Handler
+    from anki_lu.anki.stats import report
+    from anki_lu.conf_mgr import get_config_obj
+
+    conf: Configuration = get_config_obj()  # type: ignore[assignment]
+    with Handler(conf.anki) as handler:
+        tables = report(handler.db, days=days, top=top)
+    if fmt == "json":
+        click.echo(json.dumps(tables, indent=2))
+        return
+    rows = tables[table]
+    writer = csv.DictWriter(sys.stdout, fieldnames=list(rows[0]) if rows else [])
+    writer.writeheader()
+    writer.writerows(rows)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,194 @@
+"""Asyncio counterpart of Handler, for use in event-loop based services.
+
+All archive and SQLite work runs on a bounded thread pool, so it never blocks
+the event loop, and opening or exporting packages (the heavy zip work) is
+limited to a number of packages at a time. Cancelling a task using a handler
+discards its changes: work already running on a thread can't be interrupted,
+so its handler is cleaned up once it's done.
+
+Example::
+
+    async with AsyncHandler(conf) as handler:
+        rows = await handler.query("SELECT id FROM notes")
+"""
+import asyncio
+import os
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from functools import partial
+from types import TracebackType
+from typing import Any, Callable, Optional, TypeVar
+from weakref import WeakKeyDictionary
+
+from anki_lu.anki.conf import Configuration as AnkiConf
+from anki_lu.anki.mgr import Handler
+
+_T = TypeVar("_T")
+#  packages opened or exported at a time, per event loop, by default
+default_extractions: int = os.cpu_count() or 1
+_executor: Optional[ThreadPoolExecutor] = None
+_limits: "WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+    WeakKeyDictionary()
+)
+
+
+def _default_executor() -> ThreadPoolExecutor:
+    """Thread pool shared by handlers not given an executor."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(thread_name_prefix="anki_lu")
+    return _executor
+
+
+def _default_limit() -> asyncio.Semaphore:
+    """Extraction limit of running event loop, shared by its handlers."""
+    loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+    if loop not in _limits:
+        _limits[loop] = asyncio.Semaphore(default_extractions)
+    return _limits[loop]
+
+
+def _open(conf: AnkiConf) -> Handler:
+    """Opens handler, and its connection pool, so queries can share it."""
+    handler: Handler = Handler(conf)
+    handler.db  # noqa: B018 (creates pool)
+    return handler
+
+
+def _discard(future: "Future[Handler]", executor: Executor) -> None:
+    """Cleans up handler opened for a cancelled task, once it's opened."""
+    if future.cancelled() or future.exception() is not None:
+        return
+    try:
+        executor.submit(future.result().close, export=False)
+    except RuntimeError:  # executor shut down meanwhile
+        future.result().close(export=False)
+
+
+class AsyncHandler:
+    """Opens an Anki export file off the event loop, see Handler.
+
+    Use with async with: changes are exported when the block is left without
+    an exception, and discarded otherwise (including on cancellation).
+    """
+
+    def __init__(
+        self,
+        conf: AnkiConf,
+        executor: Optional[Executor] = None,
+        limit: Optional[asyncio.Semaphore] = None,
+    ) -> None:
+        """Sets up handler, the package is opened on entering async with.
+
+        Args:
+            conf: anki config, as for Handler
+            executor: runs blocking work, defaults to a shared thread pool
+            limit: caps packages opened or exported at a time, defaults to one
+                shared by the event loop's handlers (default_extractions)
+        """
+        self._conf: AnkiConf = conf
+        self._executor: Executor = executor or _default_executor()
+        self._limit: Optional[asyncio.Semaphore] = limit
+        self._handler: Optional[Handler] = None
+        self._lock: Optional[asyncio.Lock] = None  # made in loop, see run
+
+    @property
+    def handler(self) -> Handler:
+        """Underlying (blocking) handler, only to be used off the event loop.
+
+        Returns:
+            Handler of open package.
+
+        Raises:
+            RuntimeError: if package isn't open (outside async with).
+        """
+        if self._handler is None:
+            raise RuntimeError("AsyncHandler is used outside async with")
+        return self._handler
+
+    async def _call(self, fn: Callable[..., _T], *args: Any, **kwargs: Any) -> _T:
+        """Runs fn on executor."""
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(fn, *args, **kwargs))
+
+    async def __aenter__(self) -> "AsyncHandler":
+        """Opens package on executor, waiting for a free extraction slot."""
+        async with self._limit or _default_limit():
+            future: "Future[Handler]" = self._executor.submit(_open, self._conf)
+            try:
+                self._handler = await asyncio.wrap_future(future)
+            except asyncio.CancelledError:
+                future.add_done_callback(partial(_discard, executor=self._executor))
+                raise
+        self._lock = asyncio.Lock()
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc: Optional[BaseException],
+        tb: Optional[TracebackType],
+    ) -> None:
+        """Exports changes (unless block raised or was cancelled), cleans up.
+
+        Export runs to completion even if this task is cancelled meanwhile.
+        """
+        handler: Handler = self.handler
+        self._handler = None
+        closing: Optional["asyncio.Future[None]"] = None
+        try:
+            async with self._limit or _default_limit():
+                closing = asyncio.ensure_future(
+                    self._call(handler.close, export=exc_type is None)
+                )
+                await asyncio.shield(closing)
+        finally:
+            if closing is None:  # cancelled waiting for a slot
+                self._executor.submit(handler.close, export=False)
+
+    async def run(self, fn: Callable[[Handler], _T]) -> _T:
+        """Runs blocking fn on the handler, off the event loop.
+
+        Calls to run (and read, write) on one handler don't overlap.
+
+        Args:
+            fn: called with the (blocking) handler, e.g. importer.import_file
+
+        Returns:
+            fn's result.
+        """
+        async with self._lock or asyncio.Lock():
+            return await self._call(fn, self.handler)
+
+    async def read(self, name: str) -> bytes:
+        """Current content of archive member, see Handler.read.
+
+        Args:
+            name: member name in Anki export file
+
+        Returns:
+            Member content.
+        """
+        return await self.run(lambda h: h.read(name))
+
+    async def write(self, name: str, data: bytes) -> None:
+        """Replaces content of archive member, see Handler.write.
+
+        Args:
+            name: member name in Anki export file
+            data: new content
+        """
+        await self.run(lambda h: h.write(name, data))
+
+    async def query(self, sql: str, params: Any = ()) -> list[Any]:
+        """Runs query on deck's connection pool, see DeckDB.query.
+
+        Queries from one handler can run concurrently.
+
+        Args:
+            sql: SQL statement
+            params: statement parameters
+
+        Returns:
+            Result rows.
+        """
+        return await self._call(self.handler.db.query, sql, params)
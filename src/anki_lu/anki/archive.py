@@ -0,0 +1,96 @@
+"""Low-level helpers for re-packing Anki (zip) archives.
+
+The standard library ``zipfile`` only offers decompress/recompress access to
+members. These helpers copy a member's already-compressed bytes between
+archives, so unchanged members don't pay a full inflate/deflate round trip.
+Caches of content read from an archive are keyed on its file identity.
+"""
+import os
+import struct
+from copy import copy
+from zipfile import ZipFile, ZipInfo
+
+#  local file header layout, see APPNOTE.TXT section 4.3.7
+_local_header_fmt: str = "<4s2B4HL2L2H"
+_local_header_size: int = struct.calcsize(_local_header_fmt)
+_local_header_sig: bytes = b"PK\003\004"
+_fname_len_idx: int = 10
+_extra_len_idx: int = 11
+#  general purpose flag: sizes & crc follow data (in a data descriptor)
+_data_descriptor_flag: int = 0x08
+
+
+def identity(src: ZipFile) -> tuple[int, int, int, int]:
+    """Device, inode, size and mtime (ns) of the open archive's file.
+
+    A member's CRC and size only identify its content within one version of
+    one archive file: any rewrite or replacement of the file (keeping its name,
+    or even its members' CRCs) gives the file a new identity.
+
+    Args:
+        src: archive opened from a file
+
+    Returns:
+        File identity, for keys of data derived from the archive's content.
+    """
+    stat: os.stat_result = os.fstat(src.fp.fileno())  # type: ignore[union-attr]
+    return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def read_raw(src: ZipFile, info: ZipInfo) -> bytes:
+    """Reads a member's compressed bytes, exactly as stored in the archive.
+
+    Args:
+        src: archive opened for reading
+        info: entry (from src) to read
+
+    Returns:
+        Compressed member data, without local header or data descriptor.
+
+    Raises:
+        ValueError: if the local header for the member is malformed.
+    """
+    fp = src.fp
+    fp.seek(info.header_offset)  # type: ignore[union-attr]
+    header = fp.read(_local_header_size)  # type: ignore[union-attr]
+    fields = struct.unpack(_local_header_fmt, header)
+    if fields[0] != _local_header_sig:
+        raise ValueError(f"Bad local header for {info.filename} in archive")
+    fp.seek(  # type: ignore[union-attr]
+        fields[_fname_len_idx] + fields[_extra_len_idx], 1
+    )
+    return fp.read(info.compress_size)  # type: ignore[union-attr]
+
+
+def write_raw(dst: ZipFile, info: ZipInfo, data: bytes) -> None:
+    """Appends pre-compressed member data to an archive open for writing.
+
+    Args:
+        dst: archive opened in "w" or "a" mode
+        info: entry describing data (CRC, sizes, compression method set)
+        data: compressed bytes, matching info.compress_type
+    """
+    entry: ZipInfo = copy(info)
+    #  crc & sizes are known up front, so no trailing data descriptor needed
+    entry.flag_bits &= ~_data_descriptor_flag
+    entry.compress_size = len(data)
+    fp = dst.fp
+    fp.seek(dst.start_dir)  # type: ignore[union-attr]
+    entry.header_offset = fp.tell()  # type: ignore[union-attr]
+    fp.write(entry.FileHeader())  # type: ignore[union-attr]
+    fp.write(data)  # type: ignore[union-attr]
+    dst.start_dir = fp.tell()  # type: ignore[union-attr]
+    dst.filelist.append(entry)
+    dst.NameToInfo[entry.filename] = entry
+    dst._didModify = True  # type: ignore[attr-defined]
+
+
+def copy_raw(src: ZipFile, dst: ZipFile, info: ZipInfo) -> None:
+    """Copies a member between archives without re-compressing it.
+
+    Args:
+        src: archive opened for reading
+        dst: archive opened for writing
+        info: entry (from src) to copy
+    """
+    write_raw(dst, info, read_raw(src, info))
@@ -0,0 +1,123 @@
+"""Persistent cache of extracted decks, shared by Handler instances.
+
+Entries are keyed by a digest of the package file's identity (see
+archive.identity) and central directory (member names, CRCs, sizes and
+compression). As in the media store, CRCs are only trusted within the file
+version they were read from: a rewritten or replaced package gets a new key,
+and never sees a stale deck, even if its CRCs match. Repeat opens clone the
+cached deck into the work area (copy-on-write where the file system supports
+it) instead of inflating or decompressing it again. The cache is held under a
+size cap, evicting least recently used entries.
+"""
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import NamedTuple, Optional
+from zipfile import ZipFile, ZipInfo
+
+from anki_lu.anki.archive import identity
+from anki_lu.anki.work import WorkArea
+
+_cache_version: int = 2  # bump when entry layout (or key) changes
+_baseline_file: str = "baseline.json"
+_tmp_suffix: str = ".tmp"
+
+
+class CachedMember(NamedTuple):
+    """Cached member content, and its size and crc32 (see WorkArea.baseline)."""
+
+    path: Path
+    baseline: tuple[int, int]
+
+
+class ExtractCache:
+    """Directory of extracted members, one sub-directory per package digest."""
+
+    def __init__(self, root: Path, max_bytes: int) -> None:
+        """Uses (and creates, on first write) cache directory.
+
+        Args:
+            root: cache directory
+            max_bytes: total size that entries are evicted down to
+        """
+        self.root: Path = root
+        self._max_bytes: int = max_bytes
+
+    @staticmethod
+    def key(src: ZipFile) -> str:
+        """Digest of archive file's identity and central directory."""
+        entries: list[object] = [_cache_version, identity(src)]
+        entries.extend(
+            (i.filename, i.CRC, i.file_size, i.compress_type) for i in src.infolist()
+        )
+        return hashlib.sha256(repr(entries).encode("utf-8")).hexdigest()
+
+    def get(self, key: str, name: str) -> Optional[CachedMember]:
+        """Cached member, marked as recently used.
+
+        Args:
+            key: package digest, see key
+            name: member name
+
+        Returns:
+            Cached member, None on a miss.
+        """
+        entry: Path = self.root / key
+        try:
+            baselines: dict[str, list[int]] = json.loads(
+                (entry / _baseline_file).read_text()
+            )
+            size, crc = baselines[name]
+            os.utime(entry)
+        except (OSError, KeyError, ValueError):
+            return None
+        return CachedMember(entry / name, (size, crc))
+
+    def put(self, key: str, info: ZipInfo, area: WorkArea) -> None:
+        """Stores member as loaded into work area, then evicts old entries.
+
+        Failures (e.g. full or read-only disk) leave the cache without entry.
+
+        Args:
+            key: package digest, see key
+            info: archive entry of member, loaded into area
+            area: work area member is loaded into
+        """
+        name: str = info.filename
+        entry: Path = self.root / key
+        tmp: Path = self.root / f"{key}.{os.getpid()}{_tmp_suffix}"
+        try:
+            tmp.mkdir(parents=True)
+            area.copy_to(name, tmp / name)
+            baseline: dict[str, tuple[int, int]] = {name: area.baseline(info)}
+            (tmp / _baseline_file).write_text(json.dumps(baseline))
+            os.replace(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        self.evict(keep=key)
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """Removes least recently used entries, until cache fits its size cap.
+
+        Args:
+            keep: entry never evicted (e.g. the one just stored)
+        """
+        entries: list[tuple[float, int, Path]] = []
+        for entry in self.root.iterdir():
+            if entry.name.endswith(_tmp_suffix):
+                continue
+            try:
+                size: int = sum(f.stat().st_size for f in entry.iterdir())
+                entries.append((entry.stat().st_mtime, size, entry))
+            except OSError:
+                continue  # removed by another process meanwhile
+        total: int = sum(e[1] for e in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self._max_bytes:
+                break
+            if entry.name != keep:
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
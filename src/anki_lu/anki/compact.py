@@ -0,0 +1,135 @@
+"""Compaction of an edited deck before it's repacked.
+
+Deleting or re-importing notes leaves free pages, and half-empty ones, in the
+deck, which the export would compress and ship as they are. Compaction
+checkpoints the deck (should it be in WAL mode), refreshes the query planner's
+statistics (ANALYZE), and rewrites it with VACUUM INTO, optionally with a new
+page size. A deck on disk is vacuumed into a new file replacing it, so its
+pages are written once; a deck in memory is vacuumed in place.
+
+Vacuuming costs about a deck's size in writes, so it's only done when the
+estimated reclaimable share of the deck reaches a threshold. The estimate
+counts free pages, plus unused bytes of pages where SQLite has the dbstat
+table (else free pages alone).
+"""
+import os
+import sqlite3
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from anki_lu.anki.work import WorkArea
+
+_compact_suffix: str = ".compact"
+_unused_sql: str = "SELECT sum(unused) FROM dbstat"
+
+
+class CompactResult(NamedTuple):
+    """Outcome of compacting a deck."""
+
+    applied: bool  # whether the deck was rewritten
+    free_ratio: float  # estimated reclaimable share of the deck, before
+    bytes_before: int
+    bytes_after: int  # same as bytes_before when not applied
+
+    @property
+    def saved(self) -> int:
+        """Bytes the deck shrank by."""
+        return self.bytes_before - self.bytes_after
+
+
+def _pragma(conn: sqlite3.Connection, name: str) -> int:
+    """Integer value of pragma."""
+    return int(conn.execute(f"PRAGMA {name}").fetchone()[0])
+
+
+def deck_size(conn: sqlite3.Connection) -> int:
+    """Bytes of database pages, whether on disk or in memory.
+
+    Args:
+        conn: connection to deck
+
+    Returns:
+        Page count times page size.
+    """
+    return _pragma(conn, "page_count") * _pragma(conn, "page_size")
+
+
+def free_ratio(conn: sqlite3.Connection) -> float:
+    """Estimated share of deck that compaction would reclaim.
+
+    Args:
+        conn: connection to deck
+
+    Returns:
+        Free pages, and unused bytes of pages (if SQLite has dbstat), as a
+        share of the deck's size, from 0 to 1.
+    """
+    size: int = deck_size(conn)
+    if not size:
+        return 0.0
+    reclaimable: int = _pragma(conn, "freelist_count") * _pragma(conn, "page_size")
+    try:
+        reclaimable += conn.execute(_unused_sql).fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        pass  # no dbstat in this SQLite build
+    return min(reclaimable / size, 1.0)
+
+
+def compact_deck(
+    area: WorkArea,
+    name: str,
+    threshold: float = 0.0,
+    page_size: Optional[int] = None,
+    analyze: bool = True,
+) -> CompactResult:
+    """Compacts loaded deck, if its reclaimable share reaches threshold.
+
+    Connections to the deck (other than a work area's shared one) must be
+    closed first, as a deck on disk is replaced.
+
+    Args:
+        area: work area the deck is loaded into
+        name: member name of deck
+        threshold: reclaimable share (see free_ratio) compaction needs
+        page_size: bytes per page of compacted deck, unchanged if None
+        analyze: whether to refresh query planner statistics
+
+    Returns:
+        Whether the deck was compacted, and its size before and after.
+    """
+    conn: sqlite3.Connection = area.connect(name)
+    shared: bool = area.shared_connection
+    deck: Optional[Path] = area.path(name)
+    try:
+        ratio: float = free_ratio(conn)
+        before: int = deck_size(conn)
+        if ratio < threshold or not before:
+            return CompactResult(False, ratio, before, before)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        if analyze:
+            conn.execute("ANALYZE")
+            conn.commit()
+        if page_size is not None:
+            conn.execute(f"PRAGMA page_size = {int(page_size)}")
+        if deck is None:
+            conn.execute("VACUUM")
+            return CompactResult(True, ratio, before, deck_size(conn))
+        compacted: Path = _vacuum_into(conn, deck)
+    finally:
+        if not shared:  # pragma: no branch (shared decks are in memory)
+            conn.close()
+    after: int = compacted.stat().st_size
+    os.replace(compacted, deck)
+    return CompactResult(True, ratio, before, after)
+
+
+def _vacuum_into(conn: sqlite3.Connection, deck: Path) -> Path:
+    """Vacuums deck into a new file beside it (removed if that fails)."""
+    compacted: Path = deck.with_name(f".{deck.name}{_compact_suffix}")
+    compacted.unlink(missing_ok=True)
+    try:
+        conn.execute("VACUUM INTO ?", (str(compacted),))
+    except BaseException:
+        compacted.unlink(missing_ok=True)
+        raise
+    return compacted
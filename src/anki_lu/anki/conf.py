@@ -1,7 +1,23 @@
 """Configuration for anki_mgr."""
+import sqlite3
 from pathlib import Path
+from typing import Literal, Optional
 
-from pydantic import BaseModel, validator
+from pydantic import BaseModel, Field, validator
+
+_JournalMode = Literal["delete", "truncate", "persist", "memory", "wal", "off"]
+
+
+class SQLiteConf(BaseModel):
+    """Connection pool and pragma settings for work area deck access."""
+
+    #  work area deck is a scratch copy, durability comes from the archive
+    journal_mode: _JournalMode = "memory"
+    synchronous: Literal["off", "normal", "full", "extra"] = "off"
+    cache_size: int = -65536  # negative: KiB, so 64 MiB
+    mmap_size: int = 268435456  # bytes
+    pool_size: int = 4
+    cached_statements: int = 256  # prepared statements kept per connection
 
 
 class Configuration(BaseModel):
@@ -9,6 +25,52 @@ class Configuration(BaseModel):
 
     zip_path: Path
     deck_suffix: str  # without leading '.'
+    #  raw: unchanged members copied compressed, full: every member re-zipped
+    repack: Literal["raw", "full"] = "raw"
+    #  lazy: only deck extracted up front, full: every member extracted
+    extract: Literal["lazy", "full"] = "lazy"
+    #  crc-check every extracted member for changes, not only the deck
+    hash_members: bool = False
+    #  scratch storage for extracted members, see anki.work
+    work_area: Literal["disk", "memory"] = "disk"
+    work_dir: Optional[Path] = None  # disk work area parent (e.g. tmpfs)
+    db: SQLiteConf = SQLiteConf()
+    #  original kept on export as deck(old).apkg (hardlink), deck(old 2).apkg
+    #  ... up to backup_count (rotate), or not at all (none)
+    backup: Literal["none", "hardlink", "rotate"] = "hardlink"
+    backup_count: int = Field(3, ge=1)
+    #  directory of decks kept across runs (see anki.cache), None: no cache
+    extract_cache: Optional[Path] = None
+    extract_cache_bytes: int = 2 << 30  # cache size cap, LRU entries evicted
+    #  content-addressed media shared by packages (see anki.media), None: off
+    media_store: Optional[Path] = None
+    #  full-text index side db (see anki.search), None: .<package>.search beside it
+    search_index: Optional[Path] = None
+    #  compaction of an edited deck before export (see anki.compact): done when
+    #  its estimated reclaimable share reaches compact_threshold, None: never
+    compact_threshold: Optional[float] = Field(None, ge=0, le=1)
+    compact_page_size: Optional[int] = None  # bytes per page of compacted deck
+    compact_analyze: bool = True  # refresh query planner statistics
+    #  export: deflate level of deck & text members, see anki.pack
+    compress_level: int = Field(6, ge=0, le=9)
+    compress_workers: Optional[int] = None  # threads, defaults to one per core
+    zstd_level: int = Field(3, ge=1, le=22)  # zstd deck (.anki21b), see anki.zstd
+    #  media file types stored without re-compressing (names from manifest)
+    stored_suffixes: tuple[str, ...] = (
+        "jpg",
+        "jpeg",
+        "png",
+        "gif",
+        "webp",
+        "mp3",
+        "m4a",
+        "ogg",
+        "oga",
+        "opus",
+        "flac",
+        "mp4",
+        "webm",
+    )
 
     @validator("deck_suffix")
     def file_suffix_correct_formatting(
@@ -20,3 +82,21 @@ class Configuration(BaseModel):
             pass
         v = v.replace(".", "")
         return v
+
+    @validator("work_area")
+    def memory_area_supported(
+        cls, v: str  # noqa: B902,N805 (pydantic)
+    ) -> str:
+        """Memory work area loads decks with sqlite3 deserialize (Python 3.11+)."""
+        if v == "memory" and not hasattr(sqlite3.Connection, "deserialize"):
+            raise ValueError("memory work area needs Python 3.11 or later")
+        return v
+
+    @validator("compact_page_size")
+    def page_size_power_of_two(
+        cls, v: Optional[int]  # noqa: B902,N805 (pydantic)
+    ) -> Optional[int]:
+        """Page sizes SQLite supports: powers of two, from 512 to 65536 bytes."""
+        if v is not None and (v < 512 or v > 65536 or v & (v - 1)):
+            raise ValueError(f"page size {v} isn't a power of two in 512-65536")
+        return v
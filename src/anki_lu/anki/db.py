@@ -0,0 +1,167 @@
+"""Pooled, tuned SQLite access to the work area copy of an Anki deck.
+
+Connections are reused (so python's per-connection statement cache keeps the
+common notes/cards/revlog queries prepared) and each one gets the pragmas set in
+anki config. The work area deck is a scratch copy, the source archive stays
+untouched until export, so the defaults favour speed over durability.
+"""
+import sqlite3
+from collections.abc import Iterator
+from contextlib import contextmanager
+from queue import Empty, LifoQueue
+from threading import Lock, local
+from typing import Any, Callable, Optional
+
+from anki_lu.anki.conf import SQLiteConf
+
+_note_sql: str = "SELECT * FROM notes WHERE id = ?"
+_note_by_guid_sql: str = "SELECT * FROM notes WHERE guid = ?"
+_notes_of_model_sql: str = "SELECT * FROM notes WHERE mid = ? ORDER BY id"
+_cards_of_note_sql: str = "SELECT * FROM cards WHERE nid = ? ORDER BY ord"
+_revlog_of_card_sql: str = "SELECT * FROM revlog WHERE cid = ? ORDER BY id"
+_savepoint: str = "nested"  # transaction() within a transaction (stacks)
+
+
+class DeckDB:
+    """Small pool of tuned connections to one deck database."""
+
+    def __init__(
+        self,
+        connect: Callable[..., sqlite3.Connection],
+        conf: SQLiteConf,
+        shared: bool = False,
+    ) -> None:
+        """Sets up empty pool, connections are opened on first use.
+
+        Args:
+            connect: opens a connection to the deck, passing on sqlite3 kwargs
+            conf: pragmas and pool settings
+            shared: connect always gives the same connection (memory work area),
+                so pool holds just that one and never closes it
+        """
+        self._connect: Callable[..., sqlite3.Connection] = connect
+        self._conf: SQLiteConf = conf
+        self._shared: bool = shared
+        self._size: int = 1 if shared else max(conf.pool_size, 1)
+        self._idle: "LifoQueue[sqlite3.Connection]" = LifoQueue()
+        self._opened: list[sqlite3.Connection] = []
+        self._lock: Lock = Lock()
+        self._held: local = local()  # connection checked out by each thread
+
+    def _open(self) -> sqlite3.Connection:
+        """Opens and tunes new pool connection."""
+        conn: sqlite3.Connection = self._connect(
+            check_same_thread=False,
+            cached_statements=self._conf.cached_statements,
+        )
+        for pragma in ("journal_mode", "synchronous", "cache_size", "mmap_size"):
+            conn.execute(f"PRAGMA {pragma} = {getattr(self._conf, pragma)}")
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Checks out a pool connection, blocking while all are in use.
+
+        A thread that already holds a connection (e.g. inside transaction())
+        gets it again, so nesting never waits on itself and sees its writes.
+
+        Yields:
+            Connection, returned to pool on exit of outermost checkout.
+        """
+        held: Optional[sqlite3.Connection] = getattr(self._held, "conn", None)
+        if held is not None:
+            yield held
+            return
+        conn: Optional[sqlite3.Connection] = None
+        with self._lock:
+            try:
+                conn = self._idle.get_nowait()
+            except Empty:
+                if len(self._opened) < self._size:
+                    conn = self._open()
+                    self._opened.append(conn)
+        if conn is None:
+            conn = self._idle.get()
+        self._held.conn = conn
+        try:
+            yield conn
+        finally:
+            self._held.conn = None
+            self._idle.put(conn)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Runs block in one transaction, committed on success.
+
+        Nested in another transaction of the thread, the block runs in a
+        savepoint instead: on failure only its changes are rolled back, and on
+        success they're committed with the enclosing transaction.
+
+        Yields:
+            Connection with open transaction.
+
+        Raises:
+            BaseException: re-raised from block, after rolling back.
+        """
+        with self.connection() as conn:
+            if conn.in_transaction:
+                conn.execute(f"SAVEPOINT {_savepoint}")
+                try:
+                    yield conn
+                except BaseException:
+                    conn.execute(f"ROLLBACK TO {_savepoint}")
+                    raise
+                finally:
+                    conn.execute(f"RELEASE {_savepoint}")
+                return
+            conn.execute("BEGIN")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def query(self, sql: str, params: Any = ()) -> list[sqlite3.Row]:
+        """Runs (cached) statement on a pool connection.
+
+        Args:
+            sql: statement, kept prepared per connection when reused
+            params: statement parameters
+
+        Returns:
+            All result rows.
+        """
+        with self.connection() as conn:
+            cur: sqlite3.Cursor = conn.cursor()
+            cur.row_factory = sqlite3.Row
+            return cur.execute(sql, params).fetchall()
+
+    def note(self, nid: int) -> Optional[sqlite3.Row]:
+        """Note with id, or None."""
+        return next(iter(self.query(_note_sql, (nid,))), None)
+
+    def note_by_guid(self, guid: str) -> Optional[sqlite3.Row]:
+        """Note with globally unique id, or None."""
+        return next(iter(self.query(_note_by_guid_sql, (guid,))), None)
+
+    def notes(self, mid: int) -> list[sqlite3.Row]:
+        """Notes of note type (model) id."""
+        return self.query(_notes_of_model_sql, (mid,))
+
+    def cards(self, nid: int) -> list[sqlite3.Row]:
+        """Cards generated from note, in template order."""
+        return self.query(_cards_of_note_sql, (nid,))
+
+    def revlog(self, cid: int) -> list[sqlite3.Row]:
+        """Review log entries of card, oldest first."""
+        return self.query(_revlog_of_card_sql, (cid,))
+
+    def close(self) -> None:
+        """Closes pool connections (a shared connection is left open)."""
+        with self._lock:
+            if not self._shared:
+                for conn in self._opened:
+                    conn.close()
+            self._opened.clear()
+            self._idle = LifoQueue()
@@ -0,0 +1,188 @@
+"""Note-level changesets between two versions of an Anki package.
+
+A delta records the notes and cards added or updated (by id, and mod or usn
+differing) and deleted between an original and a modified package, and the
+non-deck members (media, media manifest) added, changed (by CRC) or removed.
+Applying it to another copy of the original package brings that copy's notes
+and cards to the modified state, so a small correction ships as a small file
+rather than a whole package.
+
+A delta is a zip archive holding delta.sqlite (note and card rows, deletions)
+and the changed members, copied still-compressed from the modified package.
+Card rows include scheduling, so applying updated cards resets their reviews.
+"""
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import NamedTuple
+from zipfile import ZIP_DEFLATED, ZipFile, ZipInfo
+
+from anki_lu.anki.archive import read_raw, write_raw
+from anki_lu.anki.conf import Configuration as AnkiConf
+from anki_lu.anki.mgr import Handler
+
+_delta_db: str = "delta.sqlite"
+_delta_version: int = 1
+#  run on the modified deck, with original attached as base, new delta as delta
+_diff_sql: tuple[str, ...] = (
+    "CREATE TABLE delta.notes AS SELECT * FROM main.notes WHERE 0",
+    "CREATE TABLE delta.cards AS SELECT * FROM main.cards WHERE 0",
+    "CREATE TABLE delta.deleted (tbl TEXT NOT NULL, id INTEGER NOT NULL)",
+    "CREATE TABLE delta.removed_members (name TEXT PRIMARY KEY)",
+    "INSERT INTO delta.notes SELECT n.* FROM main.notes AS n "
+    "LEFT JOIN base.notes AS b ON b.id = n.id "
+    "WHERE b.id IS NULL OR b.mod != n.mod OR b.usn != n.usn",
+    "INSERT INTO delta.cards SELECT c.* FROM main.cards AS c "
+    "LEFT JOIN base.cards AS b ON b.id = c.id "
+    "WHERE b.id IS NULL OR b.mod != c.mod OR b.usn != c.usn",
+    "INSERT INTO delta.deleted SELECT 'notes', id FROM base.notes "
+    "WHERE id NOT IN (SELECT id FROM main.notes)",
+    "INSERT INTO delta.deleted SELECT 'cards', id FROM base.cards "
+    "WHERE id NOT IN (SELECT id FROM main.cards)",
+    f"PRAGMA delta.user_version = {_delta_version}",
+)
+#  run on the target deck, with delta attached as delta
+_apply_sql: tuple[str, ...] = (
+    "INSERT OR REPLACE INTO main.notes SELECT * FROM delta.notes",
+    "INSERT OR REPLACE INTO main.cards SELECT * FROM delta.cards",
+    "DELETE FROM main.notes WHERE id IN "
+    "(SELECT id FROM delta.deleted WHERE tbl = 'notes')",
+    "DELETE FROM main.cards WHERE id IN "
+    "(SELECT id FROM delta.deleted WHERE tbl = 'cards')",
+)
+_touch_col_sql: str = "UPDATE main.col SET mod = ?"
+_removed_members_sql: str = "SELECT name FROM delta.removed_members"
+_count_sql: str = (
+    "SELECT (SELECT count() FROM delta.notes), (SELECT count() FROM delta.cards), "
+    "(SELECT count() FROM delta.deleted)"
+)
+
+
+class DeltaSummary(NamedTuple):
+    """Size of a delta."""
+
+    notes: int  # added or updated
+    cards: int  # added or updated
+    deleted: int  # notes and cards
+    members: int  # added, changed or removed
+
+
+def diff(original: AnkiConf, modified: AnkiConf, dst: Path) -> DeltaSummary:
+    """Writes delta taking original package to modified one.
+
+    Args:
+        original: anki config of original package
+        modified: anki config of modified package (same deck suffix)
+        dst: delta file to write
+
+    Returns:
+        Size of delta.
+    """
+    with Handler(_on_disk(original)) as base, Handler(
+        _on_disk(modified)
+    ) as new, TemporaryDirectory() as tmp:
+        db: Path = Path(tmp) / _delta_db
+        with new.db.connection() as conn:
+            conn.execute("ATTACH ? AS base", (str(base.deck),))
+            conn.execute("ATTACH ? AS delta", (str(db),))
+            try:
+                with conn:
+                    for sql in _diff_sql:
+                        conn.execute(sql)
+                    removed, changed = _member_changes(
+                        original.zip_path,
+                        modified.zip_path,
+                        {base.deck.name, new.deck.name},
+                    )
+                    conn.executemany(
+                        "INSERT INTO delta.removed_members VALUES (?)",
+                        ((name,) for name in removed),
+                    )
+                counts: tuple[int, int, int] = conn.execute(_count_sql).fetchone()
+            finally:
+                conn.execute("DETACH delta")
+                conn.execute("DETACH base")
+        with ZipFile(dst, "w") as delta, ZipFile(modified.zip_path) as src:
+            delta.write(db, _delta_db, compress_type=ZIP_DEFLATED)
+            for info in changed:
+                write_raw(delta, info, read_raw(src, info))
+    return DeltaSummary(*counts, len(removed) + len(changed))
+
+
+def apply(conf: AnkiConf, delta: Path) -> DeltaSummary:
+    """Applies delta to package, exporting it.
+
+    Notes and cards are replaced by id, so applying a delta twice is harmless.
+
+    Args:
+        conf: anki config of package to update
+        delta: delta file, see diff
+
+    Returns:
+        Size of delta.
+
+    Raises:
+        ValueError: if delta is of an unsupported (newer) version.
+    """
+    with ZipFile(delta) as src, TemporaryDirectory() as tmp, Handler(
+        _on_disk(conf)
+    ) as handler:
+        db: Path = Path(src.extract(_delta_db, tmp))
+        with handler.db.connection() as conn:
+            conn.execute("ATTACH ? AS delta", (str(db),))
+            try:
+                version: int = conn.execute("PRAGMA delta.user_version").fetchone()[0]
+                if version > _delta_version:
+                    raise ValueError(f"unsupported delta version {version}")
+                with conn:
+                    for sql in _apply_sql:
+                        conn.execute(sql)
+                    conn.execute(_touch_col_sql, (int(time.time() * 1000),))
+                counts: tuple[int, int, int] = conn.execute(_count_sql).fetchone()
+                removed: list[str] = [
+                    row[0] for row in conn.execute(_removed_members_sql)
+                ]
+            finally:
+                conn.execute("DETACH delta")
+        members: list[str] = [n for n in src.namelist() if n != _delta_db]
+        for name in members:
+            handler.write(name, src.read(name))
+        for name in removed:
+            try:
+                handler.extract(name).unlink()
+            except KeyError:
+                pass  # not in this copy
+    return DeltaSummary(*counts, len(members) + len(removed))
+
+
+def _on_disk(conf: AnkiConf) -> AnkiConf:
+    """Config using a disk work area, so the deck has a path to attach."""
+    return conf.copy(update={"work_area": "disk"})
+
+
+def _member_changes(
+    original: Path, modified: Path, decks: set[str]
+) -> tuple[list[str], list[ZipInfo]]:
+    """Non-deck members removed from, and added or changed (by CRC) in modified.
+
+    Args:
+        original: original package
+        modified: modified package
+        decks: deck member names, left out
+
+    Returns:
+        Names of removed members, and modified package entries of the others.
+    """
+    with ZipFile(original) as src:
+        old: dict[str, tuple[int, int]] = {
+            i.filename: (i.CRC, i.file_size) for i in src.infolist()
+        }
+    with ZipFile(modified) as src:
+        new: dict[str, ZipInfo] = {i.filename: i for i in src.infolist()}
+    removed: list[str] = [n for n in old if n not in new and n not in decks]
+    changed: list[ZipInfo] = [
+        info
+        for name, info in new.items()
+        if name not in decks and old.get(name) != (info.CRC, info.file_size)
+    ]
+    return removed, changed
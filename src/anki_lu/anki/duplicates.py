@@ -0,0 +1,276 @@
+"""Duplicate and near-duplicate notes, found without comparing every pair.
+
+Each note's key text (its first field, by default) is folded once: normalised
+as for search (case, diacritics, HTML, n-rule, see search.normalise), with
+articles dropped. Notes sharing a folded key are exact duplicates, so "den
+Hond", "<b>Hond</b>" and "d'Hond" are one group.
+
+Folded keys are hashed into buckets (locality-sensitive hashing), and only
+keys sharing a bucket are compared: short keys (words) by their single-letter
+deletions, so keys one edit apart (Kaz/Katz, Hond/Hund) meet, and longer keys
+(phrases, sentences) by bands of a MinHash sketch of their letter trigrams,
+so keys with most trigrams in common meet. Candidates are near duplicates when
+their similarity ratio (difflib) reaches the threshold. Each key is hashed
+once, so a deck is checked in about linear time.
+
+Example::
+
+    with Handler(conf) as handler:
+        for group in find_duplicates(handler.db):
+            print(group.kind, group.note_ids)
+"""
+import difflib
+from array import array
+from collections.abc import Iterable
+from hashlib import blake2b
+from typing import NamedTuple, Optional
+
+from anki_lu.anki.db import DeckDB
+from anki_lu.anki.search import normalise
+
+#  folded (see search.normalise) articles, dropped from keys unless alone
+_articles: frozenset[str] = frozenset(
+    {"d", "de", "dat", "dei", "di", "dem", "der", "e", "ee", "eng", "engem", "enger"}
+)
+#  keys up to _short letters are bucketed by deletions, from _short letters by
+#  MinHash, so keys of either kind near the boundary still meet
+_short: int = 12
+_min_deletions: int = 4  # shorter keys are only bucketed as themselves
+#  one 64 byte digest per trigram gives 16 32-bit min hashes, of which 15 are
+#  banded in threes: keys with trigram similarity s meet with chance
+#  1 - (1 - s³)^5, e.g. 0.97 for s = 0.8, 0.04 for s = 0.2
+_bands: int = 5
+_rows: int = 3
+#  buckets of more keys are left out (their keys still meet in others), so no
+#  bucket costs quadratic time
+_max_bucket: int = 100
+_field_sep: str = "\x1f"
+_notes_sql: str = "SELECT id, flds FROM notes ORDER BY id"
+
+
+class DuplicateGroup(NamedTuple):
+    """Notes that duplicate each other."""
+
+    kind: str  # exact: same folded key, near: similar folded keys
+    keys: tuple[str, ...]  # folded keys, sorted
+    note_ids: tuple[int, ...]  # sorted
+
+
+def fold(text: str) -> str:
+    """Key of note text: normalised words, without articles.
+
+    Args:
+        text: field content
+
+    Returns:
+        Space separated words, articles kept only if there's nothing else.
+    """
+    words: list[str] = normalise(text).split()
+    return " ".join([w for w in words if w not in _articles] or words)
+
+
+def _trigrams(key: str) -> set[str]:
+    """Letter trigrams of key, padded so first and last letters count."""
+    padded: str = f" {key} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class DuplicateIndex:
+    """Folded keys of notes, hashed for exact and near-duplicate lookups.
+
+    Keys are added (and hashed) once, however many notes share them.
+    """
+
+    def __init__(self, threshold: float = 0.75) -> None:
+        """Empty index.
+
+        Args:
+            threshold: similarity ratio of near duplicates (0 to 1), e.g. 0.75
+                for four letter words one letter apart
+
+        Raises:
+            ValueError: if threshold isn't in (0, 1].
+        """
+        if not 0 < threshold <= 1:
+            raise ValueError(f"similarity threshold {threshold} not in (0, 1]")
+        self._threshold: float = threshold
+        self._keys: list[str] = []
+        self._key_ids: dict[str, int] = {}
+        self._notes: list[list[int]] = []  # note ids, per key id
+        self._buckets: dict[int, list[int]] = {}  # bucket hash -> key ids
+        self._hashes: dict[str, array[int]] = {}  # min hash inputs, per trigram
+
+    @classmethod
+    def from_deck(
+        cls, db: DeckDB, field: Optional[int] = 0, threshold: float = 0.75
+    ) -> "DuplicateIndex":
+        """Index of every note of deck.
+
+        Args:
+            db: deck
+            field: index of field compared, None for all fields
+            threshold: see __init__
+
+        Returns:
+            Index.
+        """
+        index: DuplicateIndex = cls(threshold)
+        for row in db.query(_notes_sql):
+            index.add(row[0], _field_text(row[1], field))
+        return index
+
+    def add(self, nid: int, text: str) -> None:
+        """Indexes note, unless its key is empty (e.g. an image only).
+
+        Args:
+            nid: note id
+            text: key text of note, e.g. its first field
+        """
+        key: str = fold(text)
+        if not key:
+            return
+        key_id: Optional[int] = self._key_ids.get(key)
+        if key_id is None:
+            key_id = len(self._keys)
+            self._key_ids[key] = key_id
+            self._keys.append(key)
+            self._notes.append([])
+            for bucket in self._bucket_hashes(key):
+                self._buckets.setdefault(bucket, []).append(key_id)
+        self._notes[key_id].append(nid)
+
+    def match(self, text: str) -> list[int]:
+        """Indexed notes that text would duplicate, exactly or nearly.
+
+        Args:
+            text: key text, e.g. first field of a note about to be added
+
+        Returns:
+            Sorted note ids.
+        """
+        key: str = fold(text)
+        if not key:
+            return []
+        found: set[int] = set()
+        for bucket in self._bucket_hashes(key):
+            found.update(self._buckets.get(bucket, ()))
+        return sorted(
+            nid
+            for key_id in found
+            if self._similar(key, self._keys[key_id])
+            for nid in self._notes[key_id]
+        )
+
+    def groups(self) -> list[DuplicateGroup]:
+        """Exact duplicate groups, then near-duplicate ones.
+
+        Near-duplicate groups join keys linked by a chain of similar pairs,
+        so they may hold exact groups.
+
+        Returns:
+            Groups of each kind ordered by first note id.
+        """
+        parent: list[int] = list(range(len(self._keys)))
+
+        def root(key_id: int) -> int:
+            while parent[key_id] != key_id:
+                parent[key_id] = parent[parent[key_id]]
+                key_id = parent[key_id]
+            return key_id
+
+        for bucket in self._buckets.values():
+            if not 2 <= len(bucket) <= _max_bucket:
+                continue
+            for i, a in enumerate(bucket):
+                for b in bucket[i + 1 :]:
+                    root_a, root_b = root(a), root(b)
+                    if root_a != root_b and self._similar(self._keys[a], self._keys[b]):
+                        parent[root_b] = root_a
+        linked: dict[int, list[int]] = {}
+        for key_id in range(len(self._keys)):
+            linked.setdefault(root(key_id), []).append(key_id)
+
+        exact: list[DuplicateGroup] = [
+            self._group("exact", [key_id])
+            for key_id, nids in enumerate(self._notes)
+            if len(nids) > 1
+        ]
+        near: list[DuplicateGroup] = [
+            self._group("near", key_ids)
+            for key_ids in linked.values()
+            if len(key_ids) > 1
+        ]
+        return sorted(exact, key=_first_note) + sorted(near, key=_first_note)
+
+    def _group(self, kind: str, key_ids: Iterable[int]) -> DuplicateGroup:
+        """Group of notes with keys."""
+        ids: list[int] = list(key_ids)
+        return DuplicateGroup(
+            kind,
+            tuple(sorted(self._keys[k] for k in ids)),
+            tuple(sorted(nid for k in ids for nid in self._notes[k])),
+        )
+
+    def _bucket_hashes(self, key: str) -> set[int]:
+        """Buckets of key: deletions of short keys, MinHash bands of long ones."""
+        buckets: set[int] = set()
+        if len(key) <= _short + 1:
+            buckets.add(hash(key))
+            if len(key) >= _min_deletions:
+                buckets.update(hash(key[:i] + key[i + 1 :]) for i in range(len(key)))
+        if len(key) >= _short:
+            hashes: list[array[int]] = [self._hash(t) for t in _trigrams(key)]
+            sketch: list[int] = list(map(min, *hashes))  # at least 11 trigrams
+            buckets.update(
+                hash((band, *sketch[band * _rows : (band + 1) * _rows]))
+                for band in range(_bands)
+            )
+        return buckets
+
+    def _hash(self, trigram: str) -> "array[int]":
+        """Min hash inputs of trigram, one per hash function (cached)."""
+        hashes: Optional[array[int]] = self._hashes.get(trigram)
+        if hashes is None:
+            digest: bytes = blake2b(trigram.encode("utf-8"), digest_size=64).digest()
+            hashes = self._hashes[trigram] = array("I", digest)
+        return hashes
+
+    def _similar(self, a: str, b: str) -> bool:
+        """Whether keys reach the threshold's similarity ratio."""
+        if 2 * min(len(a), len(b)) < self._threshold * (len(a) + len(b)):
+            return False  # too different in length to be similar enough
+        matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+        return (
+            matcher.quick_ratio() >= self._threshold
+            and matcher.ratio() >= self._threshold
+        )
+
+
+def find_duplicates(
+    db: DeckDB, field: Optional[int] = 0, threshold: float = 0.75
+) -> list[DuplicateGroup]:
+    """Groups of exact and near-duplicate notes of deck.
+
+    Args:
+        db: deck, e.g. Handler.db
+        field: index of field compared, None for all fields
+        threshold: similarity ratio of near duplicates (0 to 1)
+
+    Returns:
+        Exact duplicate groups, then near-duplicate ones (see
+        DuplicateIndex.groups).
+    """
+    return DuplicateIndex.from_deck(db, field, threshold).groups()
+
+
+def _field_text(flds: str, field: Optional[int]) -> str:
+    """Text of a note's field, or all fields."""
+    values: list[str] = flds.split(_field_sep)
+    if field is None:
+        return " ".join(values)
+    return values[field] if field < len(values) else ""
+
+
+def _first_note(group: DuplicateGroup) -> int:
+    """Sort key of groups."""
+    return group.note_ids[0]
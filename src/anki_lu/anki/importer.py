@@ -0,0 +1,357 @@
+"""Bulk import of vocabulary rows (CSV, TSV or JSONL) into an Anki deck.
+
+Rows are streamed from file and written batch by batch, so memory holds one
+batch (plus a compact index of the note type's existing notes). Re-importing a
+word updates its note instead of adding a duplicate: rows are matched on guid
+when given, otherwise on the note's first field, and only replace the fields
+(and tags) they have columns for. Optionally, new rows whose
+first field duplicates a note's (spelling variants included, see
+anki.duplicates) are skipped.
+"""
+import csv
+import html
+import json
+import re
+import secrets
+import sqlite3
+import string
+from collections.abc import Iterable, Iterator, Mapping
+from hashlib import sha1
+from itertools import islice
+from pathlib import Path
+from time import time
+from typing import Any, NamedTuple, Optional
+from zlib import crc32
+
+from anki_lu.anki.db import DeckDB
+from anki_lu.anki.duplicates import DuplicateIndex
+
+#  row keys that aren't note fields
+tags_key: str = "tags"
+guid_key: str = "guid"
+_formats: dict[str, str] = {".csv": ",", ".tsv": "\t", ".txt": "\t"}
+_field_sep: str = "\x1f"
+_guid_chars: str = (
+    string.ascii_letters + string.digits + "!#$%&()*+,-./:;<=>?@[]^_`{|}~"
+)
+_img_re: re.Pattern[str] = re.compile(
+    r"<img[^>]+src=[\"']?([^\"'>]+)[\"']?[^>]*>", re.IGNORECASE
+)
+_tag_re: re.Pattern[str] = re.compile(r"<[^>]*>")
+_cloze_model: int = 1
+_new_card: int = 0  # card type (& queue, see _insert_card_sql)
+
+
+class ImportResult(NamedTuple):
+    """Counts of notes touched by an import."""
+
+    added: int
+    updated: int
+    unchanged: int
+    skipped: int = 0  # new rows duplicating a note, see skip_duplicates
+
+
+def read_rows(path: Path) -> Iterator[dict[str, str]]:
+    """Streams rows from CSV/TSV (with header row) or JSONL file.
+
+    Args:
+        path: data file, format taken from suffix (.csv, .tsv/.txt, .jsonl)
+
+    Yields:
+        One dict per row, keyed by column (field) name.
+
+    Raises:
+        ValueError: if file suffix isn't a supported format.
+    """
+    suffix: str = path.suffix.lower()
+    if suffix != ".jsonl" and suffix not in _formats:
+        raise ValueError(f"{path.name}: unsupported import format {suffix}")
+    with open(path, encoding="utf-8", newline="") as f:
+        if suffix == ".jsonl":
+            for line in f:
+                if line.strip():
+                    yield {k: str(v) for k, v in json.loads(line).items()}
+        else:
+            yield from csv.DictReader(f, delimiter=_formats[suffix])
+
+
+def strip_html(text: str) -> str:
+    """Text without HTML tags (image names kept) or entities, as Anki sorts it."""
+    text = _img_re.sub(r" \1 ", text)
+    return html.unescape(_tag_re.sub("", text)).strip()
+
+
+def field_checksum(text: str) -> int:
+    """Anki's duplicate-check checksum of a (first) field."""
+    digest: str = sha1(
+        strip_html(text).encode("utf-8"), usedforsecurity=False
+    ).hexdigest()
+    return int(digest[:8], 16)
+
+
+def guid64() -> str:
+    """Random globally unique note id, in Anki's base91 form."""
+    num: int = secrets.randbits(64)
+    chars: list[str] = []
+    while num:
+        num, rem = divmod(num, len(_guid_chars))
+        chars.append(_guid_chars[rem])
+    return "".join(reversed(chars)) or _guid_chars[0]
+
+
+class Importer:
+    """Maps rows onto notes (and their cards) of one note type."""
+
+    def __init__(
+        self,
+        db: DeckDB,
+        model: str,
+        deck_id: Optional[int] = None,
+        batch_size: int = 5000,
+        skip_duplicates: bool = False,
+    ) -> None:
+        """Reads note type definition from the collection.
+
+        Args:
+            db: deck database to import into
+            model: note type name (or id as string)
+            deck_id: deck that new cards go to, defaults to note type's deck
+            batch_size: rows written per executemany/transaction
+            skip_duplicates: skip new rows whose first field exactly or nearly
+                duplicates a note of the note type (see anki.duplicates)
+
+        Raises:
+            KeyError: if the note type isn't in the collection.
+            ValueError: if the note type is a cloze type (unsupported).
+        """
+        self._db: DeckDB = db
+        self._batch_size: int = batch_size
+        models: dict[str, Any] = json.loads(db.query("SELECT models FROM col")[0][0])
+        found: list[dict[str, Any]] = [
+            m for k, m in models.items() if model in (k, m["name"])
+        ]
+        if not found:
+            raise KeyError(f"note type {model} not in collection")
+        self._model: dict[str, Any] = found[0]
+        if self._model.get("type") == _cloze_model:
+            raise ValueError(f"cloze note type {model} can't be bulk imported")
+        self.mid: int = int(self._model["id"])
+        self.fields: list[str] = [
+            f["name"] for f in sorted(self._model["flds"], key=lambda f: f["ord"])
+        ]
+        self._sort_idx: int = int(self._model.get("sortf", 0))
+        self._ords: list[int] = [t["ord"] for t in self._model["tmpls"]]
+        self._did: int = deck_id or int(self._model.get("did") or 1)
+        #  first field key / guid -> (note id, crc32 of fields & tags)
+        self._by_key: dict[str, tuple[int, int]] = {}
+        self._by_guid: dict[str, tuple[int, int]] = {}
+        self._guard: Optional[DuplicateIndex] = (
+            DuplicateIndex() if skip_duplicates else None
+        )
+        self._next_id: int = 0
+        self._next_due: int = 0
+
+    def _index_existing(self) -> None:
+        """One pass over note type's notes, so re-imports become updates.
+
+        Notes are stepped through on a cursor, and only their keys and
+        fingerprints are kept, not their fields.
+        """
+        with self._db.connection() as conn:
+            notes: sqlite3.Cursor = conn.execute(_existing_notes_sql, (self.mid,))
+            for nid, guid, flds, tags in notes:
+                first: str = flds.split(_field_sep, 1)[0]
+                entry: tuple[int, int] = (nid, _fingerprint(flds, tags))
+                self._by_guid[guid] = entry
+                self._by_key[_key(first)] = entry
+                if self._guard is not None:
+                    self._guard.add(nid, first)
+        ids = self._db.query(
+            "SELECT max(id) FROM notes UNION ALL SELECT max(id) FROM cards "
+            "UNION ALL SELECT max(due) FROM cards WHERE type = ?",
+            (_new_card,),
+        )
+        self._next_id = max(int(time() * 1000), ids[0][0] or 0, ids[1][0] or 0) + 1
+        self._next_due = (ids[2][0] or 0) + 1
+
+    def _new_id(self) -> int:
+        """Unique note/card id (epoch ms based, as Anki's)."""
+        self._next_id += 1
+        return self._next_id - 1
+
+    def _note(
+        self, row: Mapping[str, str], current: Optional[tuple[str, str, str]] = None
+    ) -> tuple[list[str], str]:
+        """Ordered field values and tags for row.
+
+        Args:
+            row: imported row
+            current: guid, fields and tags of the note row updates, if any,
+                kept where row has no column (or value) for them
+
+        Returns:
+            Field values and tags.
+        """
+        values: list[str] = [""] * len(self.fields)
+        tags: Optional[str] = row.get(tags_key)
+        if current is not None:
+            kept: list[str] = current[1].split(_field_sep)[: len(values)]
+            values[: len(kept)] = kept
+            if tags is None:
+                return self._fields(row, values), current[2]
+        tags = (tags or "").strip()
+        return self._fields(row, values), f" {tags} " if tags else ""
+
+    def _fields(self, row: Mapping[str, str], values: list[str]) -> list[str]:
+        """Values with the fields row has a value for replaced."""
+        for i, name in enumerate(self.fields):
+            value: Optional[str] = row.get(name)
+            if value is not None:
+                values[i] = value
+        return values
+
+    def _match(self, row: Mapping[str, str]) -> Optional[tuple[int, int]]:
+        """Index entry of note that row updates: on guid, else first field."""
+        return self._by_guid.get(row.get(guid_key) or "") or self._by_key.get(
+            _key(row.get(self.fields[0]) or "")
+        )
+
+    def _current(self, nids: Iterable[int]) -> dict[int, tuple[str, str, str]]:
+        """Guid, fields and tags of existing notes, by id, in one query."""
+        rows: list[sqlite3.Row] = self._db.query(
+            _current_notes_sql, (json.dumps(sorted(set(nids))),)
+        )
+        return {row[0]: (row[1], row[2], row[3]) for row in rows}
+
+    def _write_batch(
+        self, batch: list[Mapping[str, str]], mod: int
+    ) -> tuple[int, int, int, int]:
+        """Upserts one batch of rows in a single transaction.
+
+        Rows matching a note only replace the fields (and tags) they have,
+        merged onto the note as it is, including changes by earlier rows.
+        """
+        new_notes: list[tuple[Any, ...]] = []
+        new_cards: list[tuple[Any, ...]] = []
+        updates: list[tuple[Any, ...]] = []
+        unchanged: int = 0
+        skipped: int = 0
+        #  note id -> guid, fields and tags, as of the rows handled so far
+        current: dict[int, tuple[str, str, str]] = self._current(
+            entry[0] for entry in map(self._match, batch) if entry is not None
+        )
+        for row in batch:
+            existing: Optional[tuple[int, int]] = self._match(row)
+            note: Optional[tuple[str, str, str]] = (
+                None if existing is None else current.get(existing[0])
+            )
+            values, tags = self._note(row, note)
+            flds: str = _field_sep.join(values)
+            sfld: str = strip_html(values[self._sort_idx])
+            csum: int = field_checksum(values[0])
+            if existing is not None and note is not None:
+                entry: tuple[int, int] = (existing[0], _fingerprint(flds, tags))
+                if existing[1] == entry[1]:
+                    unchanged += 1
+                    continue
+                updates.append((flds, sfld, csum, tags, mod, existing[0]))
+                current[existing[0]] = (note[0], flds, tags)
+                self._by_key[_key(values[0])] = self._by_guid[note[0]] = entry
+                continue
+            if self._guard is not None and self._guard.match(values[0]):
+                skipped += 1
+                continue
+            nid: int = self._new_id()
+            guid: str = row.get(guid_key) or guid64()
+            new_notes.append((nid, guid, self.mid, mod, flds, sfld, csum, tags))
+            new_cards.extend(
+                (self._new_id(), nid, self._did, ord_, mod, self._next_due)
+                for ord_ in self._ords
+            )
+            self._next_due += 1
+            current[nid] = (guid, flds, tags)
+            entry = (nid, _fingerprint(flds, tags))
+            self._by_key[_key(values[0])] = self._by_guid[guid] = entry
+            if self._guard is not None:
+                self._guard.add(nid, values[0])
+        with self._db.transaction() as conn:
+            conn.executemany(_insert_note_sql, new_notes)
+            conn.executemany(_insert_card_sql, new_cards)
+            conn.executemany(_update_note_sql, updates)
+        return len(new_notes), len(updates), unchanged, skipped
+
+    def run(self, rows: Iterable[Mapping[str, str]]) -> ImportResult:
+        """Imports rows, keyed by field name (plus optional tags and guid).
+
+        Args:
+            rows: e.g. from read_rows
+
+        Returns:
+            Counts of added, updated and unchanged notes, and skipped rows.
+        """
+        self._index_existing()
+        mod: int = int(time())
+        counts: list[int] = [0, 0, 0, 0]
+        it: Iterator[Mapping[str, str]] = iter(rows)
+        while batch := list(islice(it, self._batch_size)):
+            for i, n in enumerate(self._write_batch(batch, mod)):
+                counts[i] += n
+        if counts[0] or counts[1]:
+            with self._db.transaction() as conn:
+                conn.execute("UPDATE col SET mod = ?", (mod * 1000,))
+        return ImportResult(*counts)
+
+
+def import_file(
+    db: DeckDB,
+    path: Path,
+    model: str,
+    deck_id: Optional[int] = None,
+    skip_duplicates: bool = False,
+) -> ImportResult:
+    """Imports a CSV/TSV/JSONL vocabulary file into the deck.
+
+    Args:
+        db: deck database, e.g. Handler.db
+        path: data file, with columns named after the note type's fields
+        model: note type name (or id as string)
+        deck_id: deck for new cards, defaults to note type's deck
+        skip_duplicates: skip rows duplicating notes, see Importer
+
+    Returns:
+        Counts of added, updated and unchanged notes, and skipped rows.
+    """
+    return Importer(db, model, deck_id, skip_duplicates=skip_duplicates).run(
+        read_rows(path)
+    )
+
+
+def _key(first_field: str) -> str:
+    """Upsert key of a note without guid: its first field, as Anki compares."""
+    return strip_html(first_field)
+
+
+def _fingerprint(flds: str, tags: str) -> int:
+    """Cheap fingerprint to tell unchanged re-imported notes."""
+    return crc32(f"{flds}{_field_sep}{tags.strip()}".encode("utf-8"))
+
+
+#  usn -1: changed locally, not yet synced
+_insert_note_sql: str = (
+    "INSERT INTO notes (id, guid, mid, mod, usn, flds, sfld, csum, tags, flags, "
+    "data) VALUES (?, ?, ?, ?, -1, ?, ?, ?, ?, 0, '')"
+)
+_insert_card_sql: str = (
+    "INSERT INTO cards (id, nid, did, ord, mod, usn, type, queue, due, ivl, "
+    "factor, reps, lapses, left, odue, odid, flags, data) "
+    "VALUES (?, ?, ?, ?, ?, -1, 0, 0, ?, 0, 0, 0, 0, 0, 0, 0, 0, '')"
+)
+_existing_notes_sql: str = "SELECT id, guid, flds, tags FROM notes WHERE mid = ?"
+_current_notes_sql: str = (
+    "SELECT id, guid, flds, tags FROM notes "
+    "WHERE id IN (SELECT value FROM json_each(?))"
+)
+_update_note_sql: str = (
+    "UPDATE notes SET flds = ?, sfld = ?, csum = ?, tags = ?, mod = ?, usn = -1 "
+    "WHERE id = ?"
+)
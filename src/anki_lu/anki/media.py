@@ -0,0 +1,213 @@
+"""Content-addressed store of media members, shared by packages.
+
+Packages of one course often hold the same recordings and images. With a media
+store, a member is hashed (sha256) and kept once, the first time any package
+is opened with it. The digests of a package's members are recorded per package
+file version (see archive.identity), by member CRC and size, so later opens of
+that package link the stored blobs into the work area (hard links, on disk)
+instead of reading the archive. A CRC (easy to forge, or to hit by chance
+across many packages) only identifies a member within the file it was hashed
+from: a new or rewritten package is read, and hashed, once.
+
+Blobs are read-only, and never written through a link (see WorkArea.link_file).
+Packages opened with the store are recorded, and gc removes blobs none of the
+recorded packages (still) hold.
+"""
+import hashlib
+import os
+import shutil
+from pathlib import Path
+from tempfile import mkstemp
+from typing import IO, NamedTuple, Optional
+from zipfile import BadZipFile, ZipFile, ZipInfo
+
+from anki_lu.anki.archive import identity
+from anki_lu.anki.work import WorkArea
+
+_blob_dir: str = "blobs"
+_index_dir: str = "digests"  # package version, then member CRC and size
+_refs_dir: str = "refs"  # packages using store
+_tmp_suffix: str = ".tmp"
+_chunk: int = 1 << 20
+_blob_mode: int = 0o444
+
+
+class GcSummary(NamedTuple):
+    """Outcome of a garbage collection."""
+
+    blobs: int  # removed
+    bytes: int  # freed
+    packages: int  # still using store
+
+
+class MediaStore:
+    """Directory of media blobs, named by content digest."""
+
+    def __init__(self, root: Path) -> None:
+        """Uses (and creates, on first write) store directory.
+
+        Args:
+            root: store directory
+        """
+        self.root: Path = root
+
+    def add_ref(self, package: Path) -> None:
+        """Records package as using store, so gc keeps its blobs."""
+        path: str = str(package.resolve())
+        name: str = hashlib.sha256(path.encode("utf-8")).hexdigest()
+        ref: Path = self.root / _refs_dir / name
+        if not ref.exists():
+            ref.parent.mkdir(parents=True, exist_ok=True)
+            _write_atomic(ref, path.encode("utf-8"))
+
+    def get(self, src: ZipFile, info: ZipInfo) -> Optional[Path]:
+        """Blob of member, None if the member wasn't stored from this package.
+
+        The blob may since have been removed by gc.
+
+        Args:
+            src: archive opened for reading
+            info: member of src
+
+        Returns:
+            Path of blob, as recorded for this version of the package file.
+        """
+        try:
+            digest: str = self._index(src, info).read_text()
+        except OSError:
+            return None
+        return self._blob(digest)
+
+    def put(self, src: ZipFile, info: ZipInfo, area: WorkArea) -> None:
+        """Stores member as loaded into work area (once per content).
+
+        The member's digest is recorded for this version of the package file.
+        Failures (e.g. full or read-only disk) leave member out of the store.
+
+        Args:
+            src: archive member was loaded from
+            info: archive entry of member, loaded into area
+            area: work area member is loaded into
+        """
+        tmp: Optional[Path] = None
+        try:
+            (self.root / _blob_dir).mkdir(parents=True, exist_ok=True)
+            tmp = _temp_file(self.root / _blob_dir)
+            area.copy_to(info.filename, tmp)
+            with open(tmp, "rb") as f:
+                digest: str = _sha256(f)
+            blob: Path = self._blob(digest)
+            blob.parent.mkdir(exist_ok=True)
+            if blob.exists():  # same content, from another member or package
+                tmp.unlink()
+                area.link_file(info, blob, area.baseline(info))  # frees a copy
+            else:
+                tmp.chmod(_blob_mode)
+                os.replace(tmp, blob)
+            index: Path = self._index(src, info)
+            index.parent.mkdir(parents=True, exist_ok=True)
+            _write_atomic(index, digest.encode("ascii"))
+        except OSError:
+            if tmp is not None:
+                tmp.unlink(missing_ok=True)
+
+    def load(self, src: ZipFile, info: ZipInfo, area: WorkArea) -> None:
+        """Loads member into work area, from store if it's there (else stores it).
+
+        Args:
+            src: archive opened for reading
+            info: member to load
+            area: work area to load into
+        """
+        blob: Optional[Path] = self.get(src, info)
+        if blob is not None:
+            try:
+                area.link_file(info, blob, (info.file_size, info.CRC))
+                return
+            except OSError:
+                pass  # removed by gc
+        area.load(src, info)
+        self.put(src, info, area)
+
+    def gc(self) -> GcSummary:
+        """Removes blobs that no recorded package holds.
+
+        Packages that no longer exist are forgotten, as are digests recorded
+        for earlier versions of package files. Run it while no handler is using
+        the store, as blobs being stored may look unreferenced.
+
+        Returns:
+            Removed blobs, freed bytes, and packages still using store.
+        """
+        live: set[str] = set()
+        packages: int = 0
+        for ref in _files(self.root / _refs_dir):
+            try:
+                with ZipFile(ref.read_text()) as src:
+                    live.add(_package_name(src))
+                packages += 1
+            except (OSError, BadZipFile):
+                ref.unlink(missing_ok=True)
+        kept: set[str] = set()
+        index_root: Path = self.root / _index_dir
+        for version in index_root.iterdir() if index_root.is_dir() else []:
+            if version.name in live:
+                kept.update(index.read_text() for index in _files(version))
+            else:
+                shutil.rmtree(version, ignore_errors=True)
+        blobs: int = 0
+        freed: int = 0
+        for blob in _files(self.root / _blob_dir, nested=True):
+            if blob.name not in kept:
+                freed += blob.stat().st_size
+                blob.unlink()
+                blobs += 1
+        return GcSummary(blobs, freed, packages)
+
+    def _blob(self, digest: str) -> Path:
+        """Path of blob with digest."""
+        return self.root / _blob_dir / digest[:2] / digest
+
+    def _index(self, src: ZipFile, info: ZipInfo) -> Path:
+        """Path of digest recorded for member of this version of package."""
+        return self.root / _index_dir / _package_name(src) / _member_name(info)
+
+
+def _package_name(src: ZipFile) -> str:
+    """Index directory name of package file version, see archive.identity."""
+    return "-".join(map(str, identity(src)))
+
+
+def _member_name(info: ZipInfo) -> str:
+    """Index entry name of member: its CRC and size."""
+    return f"{info.CRC:08x}-{info.file_size}"
+
+
+def _sha256(f: IO[bytes]) -> str:
+    """Hex digest of (streamed) file content."""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: f.read(_chunk), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    """Writes file through a temp file, so readers never see it half-written."""
+    tmp: Path = _temp_file(path.parent)
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def _temp_file(directory: Path) -> Path:
+    """New empty temp file in directory (left out by gc)."""
+    fd, name = mkstemp(dir=directory, suffix=_tmp_suffix)
+    os.close(fd)
+    return Path(name)
+
+
+def _files(directory: Path, nested: bool = False) -> list[Path]:
+    """Files in directory (and its sub-directories), leaving out temp files."""
+    if not directory.is_dir():
+        return []
+    found = directory.glob("*/*") if nested else directory.iterdir()
+    return [p for p in found if p.is_file() and not p.name.endswith(_tmp_suffix)]
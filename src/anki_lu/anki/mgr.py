@@ -1,75 +1,589 @@
 """This module manages os-specific access and operations to Anki artifacts."""
+import json
 import os
 import shutil
+import sqlite3
+from collections.abc import Iterable
+from functools import partial
 from pathlib import Path
-from tempfile import mkdtemp
-from time import time
-from zipfile import ZIP_DEFLATED, ZipFile
+from tempfile import mkstemp
+from types import TracebackType
+from typing import Callable
+from typing import Optional
+from zipfile import BadZipFile
+from zipfile import ZipFile
+from zipfile import ZipInfo
 
+from anki_lu.anki import zstd
+from anki_lu.anki.archive import read_raw
+from anki_lu.anki.cache import CachedMember
+from anki_lu.anki.cache import ExtractCache
+from anki_lu.anki.compact import CompactResult
+from anki_lu.anki.compact import compact_deck
 from anki_lu.anki.conf import Configuration as AnkiConf
+from anki_lu.anki.db import DeckDB
+from anki_lu.anki.media import MediaStore
+from anki_lu.anki.pack import Packer
+from anki_lu.anki.pack import already_compressed
+from anki_lu.anki.pack import new_entry
+from anki_lu.anki.work import Decoder
+from anki_lu.anki.work import WorkArea
+from anki_lu.anki.work import areas
+from anki_lu.profiling import span
 
-_work_deck_prefix: str = "anki_temp"
-_work_deck_loc: Path = Path(__file__).parent
-#  original anki export file copied instead of over-written
+
+#  backup of original anki export file, see Configuration.backup
 _orig_pkg_flag: str = "(old)"
+_tmp_pkg_suffix: str = ".tmp"
+#  member mapping media member names ("0", "1", ...) to file names
+media_manifest: str = "media"
 
 
 class Handler:
-    """Creates object to manage access and manipulations on Anki artifacts."""
+    """Creates object to manage access and manipulations on Anki artifacts.
+
+    Use as a context manager: changes are exported when the with block is left
+    without an exception (see close), and discarded otherwise. Without one,
+    export happens on close, or at the latest when the handler is finalized.
+    """
 
     def __init__(self, conf: AnkiConf) -> None:
         """Includes file & dir changes to manage import/export workflow."""
         self._conf: AnkiConf = conf
-        self._work_dir: Path = Path(
-            mkdtemp(prefix=_work_deck_prefix, dir=_work_deck_loc)
-        )
         self._anki_export_file: Path = conf.zip_path
-        self._work_zip: Path = self._work_dir / conf.zip_path.name
-        self._zip_comp_lvl: int = 8  # re-zipping compression (deflate mode)
-        self.deck: Path = Path("not found")
-        self._deck_cr_time: float = 0
-        self._new_zip: Path = self._work_dir / "new_zip"
+        self._area: WorkArea = self._new_area()
+        self._deck_name: str = ""  # member name of deck, set up when found
+        self._members: dict[str, ZipInfo] = {}
+        self._zstd_deck: bool = False  # deck is zstd-compressed (.anki21b)
+        self._db: Optional[DeckDB] = None
+        self._media: Optional[MediaStore] = (
+            None if conf.media_store is None else MediaStore(conf.media_store)
+        )
+        #  outcome of the last compaction (see compact), None: not attempted
+        self.compaction: Optional[CompactResult] = None
+        self._cleaned: bool = False
         self._set_up()
 
     def _set_up(self) -> None:
-        """Prepare Anki export object for modification."""
-        shutil.copy(self._anki_export_file, self._work_zip)
-        with ZipFile(self._work_zip) as w_zip:
-            for file in w_zip.infolist():
-                w_zip.extract(file.filename, self._work_dir)
-                file_suffix: str = file.filename.split(".")[-1]
-                if file_suffix == self._conf.deck_suffix:
-                    self.deck = self._work_dir / file.filename
-                    self._deck_cr_time = time()
-                    self._zip_comp_lvl = file.compress_type
-        self._work_zip.unlink()
-        if self.deck == Path("not found"):
+        """Prepare Anki export object for modification.
+
+        The export file is read in place. Only the deck is extracted up front in
+        lazy mode, other members are extracted on first request (see extract).
+        A zstd-compressed deck (e.g. collection.anki21b of newer packages) is
+        preferred, and decompressed into the work area. Other members come from
+        the media store, if enabled.
+        """
+        self._deck_name = ""
+        try:
+            with span("open") as counters, ZipFile(self._anki_export_file) as src:
+                self._members = {file.filename: file for file in src.infolist()}
+                deck: Optional[ZipInfo] = self._find_deck()
+                for file in self._members.values():
+                    if file is deck:
+                        self._load_deck(src, file)
+                        self._deck_name = file.filename
+                    elif self._conf.extract == "full":
+                        self._load_member(src, file)
+                counters["bytes_loaded"] = sum(
+                    self._area.baseline(self._members[name])[0]
+                    for name in self._area.loaded()
+                )
+        except (OSError, BadZipFile):
+            self._clean_up()
+            raise
+        if not self._deck_name:
             self._clean_up()
             raise FileNotFoundError(
                 f"No {self._conf.deck_suffix} file found in "
-                "{self._work_zip.name} file"
+                f"{self._anki_export_file.name} file"
+            )
+        if self._media is not None:
+            self._media.add_ref(self._anki_export_file)
+
+    def _new_area(self) -> WorkArea:
+        """Empty work area of configured kind."""
+        return areas[self._conf.work_area](self._anki_export_file, self._conf.work_dir)
+
+    def refresh(self) -> set[str]:
+        """Catches up with a rewritten Anki export file, e.g. by a new export.
+
+        Only members whose CRC or size changed, and that were loaded, are read
+        again, and the deck's connections are kept unless the deck changed.
+        Changes made in the work area to those members are lost. If the deck
+        moved to another member, or members were removed, the handler is set
+        up again from scratch.
+
+        Returns:
+            Names of members changed, added or removed in the export file.
+        """
+        with ZipFile(self._anki_export_file) as src:
+            members: dict[str, ZipInfo] = {i.filename: i for i in src.infolist()}
+            changed: set[str] = {
+                name
+                for name, info in members.items()
+                if name not in self._members
+                or _entry_key(self._members[name]) != _entry_key(info)
+            }
+            removed: set[str] = self._members.keys() - members.keys()
+            if not changed and not removed:
+                return set()
+            deck_name: str = self._deck_name
+            self._members = members
+            deck: Optional[ZipInfo] = self._find_deck()
+            if removed or deck is None or deck.filename != deck_name:
+                self._close_db()
+                self._area.clean_up()
+                self._area = self._new_area()
+                self._set_up()
+                return changed | removed
+            with span("refresh") as counters:
+                for name in changed & set(self._area.loaded()):
+                    if name == deck_name:
+                        self._close_db()
+                        self._load_deck(src, deck)
+                    else:
+                        self._load_member(src, members[name])
+                    counters["bytes_loaded"] = (
+                        counters.get("bytes_loaded", 0) + members[name].file_size
+                    )
+        return changed
+
+    def _find_deck(self) -> Optional[ZipInfo]:
+        """Deck member, see find_deck."""
+        return find_deck(self._members.values(), self._conf.deck_suffix)
+
+    def _load_deck(self, src: ZipFile, deck: ZipInfo) -> None:
+        """Loads deck into work area, through the extraction cache if enabled.
+
+        A cache hit clones the cached deck, a miss stores the loaded one.
+        """
+        decoder: Optional[Decoder] = self._decoder(src, deck)
+        if self._conf.extract_cache is None:
+            self._area.load(src, deck, deck=True, decoder=decoder)
+            return
+        cache: ExtractCache = ExtractCache(
+            self._conf.extract_cache, self._conf.extract_cache_bytes
+        )
+        key: str = cache.key(src)
+        cached: Optional[CachedMember] = cache.get(key, deck.filename)
+        if cached is not None:
+            try:
+                self._area.load_file(deck, cached.path, cached.baseline, deck=True)
+                return
+            except OSError:
+                pass  # evicted meanwhile
+        self._area.load(src, deck, deck=True, decoder=decoder)
+        cache.put(key, deck, self._area)
+
+    def _decoder(self, src: ZipFile, deck: ZipInfo) -> Optional[Decoder]:
+        """Stream decompressor for deck, see deck_decoder."""
+        decoder: Optional[Decoder] = deck_decoder(src, deck)
+        self._zstd_deck = decoder is not None
+        return decoder
+
+    def _load(self, name: str) -> None:
+        """Loads archive member into work area, if it isn't already."""
+        if name not in self._members:
+            raise KeyError(f"{name} not in {self._anki_export_file.name}")
+        if name not in self._area.loaded():
+            with ZipFile(self._anki_export_file) as src:
+                self._load_member(src, self._members[name])
+
+    def _load_member(self, src: ZipFile, info: ZipInfo) -> None:
+        """Loads (non-deck) member, through the media store if enabled."""
+        if self._media is None:
+            self._area.load(src, info)
+        else:
+            self._media.load(src, info, self._area)
+
+    def extract(self, name: str) -> Path:
+        """Gives work dir path of archive member, extracting it if needed.
+
+        Like read, raises KeyError for names that aren't members.
+
+        Args:
+            name: member name in Anki export file (e.g. "media", "0")
+
+        Returns:
+            Path to the extracted member, which can be modified in place (a
+            member linked from the media store is copied first).
+        """
+        self._load(name)
+        path: Path = self._path(name)
+        self._area.unshare(name)
+        return path
+
+    @property
+    def deck(self) -> Path:
+        """Work dir path of the deck, e.g. for sqlite3.connect.
+
+        Returns:
+            Path to the deck, which can be modified in place.
+        """
+        return self._path(self._deck_name)
+
+    def _path(self, name: str) -> Path:
+        """Work dir path of loaded member.
+
+        Args:
+            name: member name in Anki export file
+
+        Returns:
+            Path to the member.
+
+        Raises:
+            RuntimeError: if the work area holds members in memory.
+        """
+        path: Optional[Path] = self._area.path(name)
+        if path is None:
+            raise RuntimeError(
+                f"{name} is held in memory (work_area memory) and has no path,"
+                " use read/write, or connect/db for the deck"
             )
+        return path
+
+    def read(self, name: str) -> bytes:
+        """Current content of archive member, loading it if needed.
+
+        Args:
+            name: member name in Anki export file (e.g. "media", "0")
+
+        Returns:
+            Member content, including any changes made in the work area.
+        """
+        self._load(name)
+        return self._area.read(name)
+
+    def write(self, name: str, data: bytes) -> None:
+        """Replaces content of archive member, or adds a new member.
+
+        Args:
+            name: member name in Anki export file (e.g. "media", "0")
+            data: new content, exported when handler shuts down
+        """
+        if name in self._members:
+            self._load(name)
+        self._area.write(name, data)
+
+    def connect(self) -> sqlite3.Connection:
+        """Gives SQLite connection to the work area copy of the deck.
+
+        Returns:
+            Connection to deck, shared by all callers for a memory work area,
+            so it mustn't be closed.
+        """
+        return self._area.connect(self._deck_name)
+
+    @property
+    def db(self) -> DeckDB:
+        """Pooled, tuned access to the deck (see anki.db), opened on first use."""
+        if self._db is None:
+            self._db = DeckDB(
+                partial(self._area.connect, self._deck_name),
+                self._conf.db,
+                shared=self._area.shared_connection,
+            )
+        return self._db
 
     def _clean_up(self) -> None:
         """Cleans up all dirs and files created by instance."""
-        shutil.rmtree(self._work_dir)
+        self._close_db()
+        if not self._cleaned:
+            self._area.clean_up()
+            self._cleaned = True
 
-    def __del__(self) -> None:
-        """Cleans-up temp files, and (if needed) exports updated Anki file."""
-        if os.stat(self.deck).st_mtime > self._deck_cr_time:
-            archived_stem: str = self._anki_export_file.stem + _orig_pkg_flag
-            os.rename(
-                self._anki_export_file,
-                self._anki_export_file.with_stem(archived_stem),
+    def _close_db(self) -> None:
+        """Closes pooled deck connections, so all writes are in the deck."""
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def compact(self, threshold: Optional[float] = None) -> CompactResult:
+        """Compacts deck, if its reclaimable share reaches threshold.
+
+        See anki.compact. Closing exports the compacted deck, as a changed
+        member. Called on close for an edited deck, when compact_threshold is
+        set.
+
+        Args:
+            threshold: share of deck (0 to 1), defaults to compact_threshold
+                (0, always compact, if that's unset)
+
+        Returns:
+            Whether the deck was compacted, and its size before and after.
+        """
+        self._close_db()
+        if threshold is None:
+            threshold = self._conf.compact_threshold or 0.0
+        with span("compact") as counters:
+            self.compaction = compact_deck(
+                self._area,
+                self._deck_name,
+                threshold,
+                self._conf.compact_page_size,
+                self._conf.compact_analyze,
             )
+            counters["bytes_before"] = self.compaction.bytes_before
+            counters["bytes_saved"] = self.compaction.saved
+        return self.compaction
+
+    def _changed_members(self) -> set[str]:
+        """Names of loaded members that were modified or removed.
+
+        The deck's content is always checked, see WorkArea.changed, other
+        members only when hash_members is set.
+        """
+        return {
+            name
+            for name in self._area.loaded()
+            if name in self._members
+            and (
+                self._area.removed(name)
+                or self._area.changed(
+                    self._members[name],
+                    name == self._deck_name or self._conf.hash_members,
+                )
+            )
+        }
+
+    def _export(self, dst: Path, changed: set[str]) -> None:
+        """Writes work area contents, as a new Anki export file.
+
+        In raw repack mode, unchanged members (including those never extracted)
+        are copied still-compressed from source, so only changed members are
+        re-compressed. Members removed from the work area are dropped, and new
+        members are appended after the original ones. Compressed media is
+        stored, everything else deflated on a thread pool (see anki.pack).
+
+        Args:
+            dst: file to write new archive to
+            changed: names of members modified or removed in work area
+        """
+        with ZipFile(self._anki_export_file) as src, ZipFile(
+            dst, mode="w"
+        ) as new_archive, Packer(
+            new_archive, self._conf.compress_level, self._conf.compress_workers
+        ) as packer:
+            media_names: dict[str, str] = self._media_names(src, changed)
+            for info in src.infolist():
+                name: str = info.filename
+                if name in changed:
+                    if not self._area.removed(name):
+                        data: bytes = self._area.read(name)
+                        store: bool = self._stored(name, data, media_names)
+                        entry: ZipInfo = new_entry(name, info)
+                        packer.add(entry, data, store, self._encoder(name))
+                elif self._conf.repack == "raw":
+                    packer.add_raw(info, read_raw(src, info))
+                else:
+                    data = src.read(info)
+                    packer.add(info, data, self._stored(name, data, media_names))
+            for name in self._area.added(self._members):
+                data = self._area.read(name)
+                store = self._stored(name, data, media_names)
+                packer.add(new_entry(name), data, store)
+
+    def _media_names(self, src: ZipFile, changed: set[str]) -> dict[str, str]:
+        """Media file names by member name, from (current) media manifest.
+
+        Args:
+            src: original archive
+            changed: names of members modified or removed in work area
+
+        Returns:
+            Mapping from manifest, empty if there is none or it isn't readable.
+        """
+        try:
+            if media_manifest in changed | set(self._area.added(self._members)):
+                manifest: bytes = self._area.read(media_manifest)
+            else:
+                manifest = src.read(media_manifest)
+            return media_names(manifest)
+        except (KeyError, OSError, RuntimeError, ValueError):
+            return {}
+
+    def _encoder(self, name: str) -> Optional[Callable[[bytes], bytes]]:
+        """Compressor of changed member, for a deck decompressed on loading."""
+        if name != self._deck_name or not self._zstd_deck:
+            return None
+        threads: int = self._conf.compress_workers or -1
+        return partial(zstd.compress, level=self._conf.zstd_level, threads=threads)
+
+    def _stored(self, name: str, data: bytes, media_names: dict[str, str]) -> bool:
+        """Whether member is compressed media, by file type or content."""
+        file_name: str = str(media_names.get(name, name))
+        suffix: str = file_name.rsplit(".", 1)[-1].lower() if "." in file_name else ""
+        return suffix in self._conf.stored_suffixes or already_compressed(data)
+
+    def close(self, export: bool = True) -> None:
+        """Exports changes (if any) to Anki export file, and cleans up.
+
+        The new archive is written to a temp file next to the original, synced
+        to disk, and then atomically replaces the original, after the original
+        is backed up (see Configuration.backup). A failed export leaves the
+        original untouched, and no partial archive behind. An edited deck is
+        compacted first, when compact_threshold is set (see compact). Closing
+        again does nothing.
+
+        Args:
+            export: whether to export changes, rather than discard them
+        """
+        if getattr(self, "_cleaned", True):  # already done, or init failed
+            return
+        try:
+            with span("close.db"):
+                self._close_db()
+            with span("detect") as counters:
+                changed: set[str] = self._changed_members()
+                counters["members"] = len(self._area.loaded())
+            if export and self._compact_on_export(changed):
+                self.compact()
+            if export and (changed or self._area.added(self._members)):
+                self._publish(changed)
+        finally:
+            self._clean_up()
+
+    def _compact_on_export(self, changed: set[str]) -> bool:
+        """Whether deck is compacted before export: configured, and edited."""
+        return (
+            self._conf.compact_threshold is not None
+            and self._deck_name in changed
+            and not self._area.removed(self._deck_name)
+        )
+
+    def _publish(self, changed: set[str]) -> None:
+        """Exports to temp file, and replaces original with it (see close)."""
+        target: Path = self._anki_export_file
+        fd, tmp_name = mkstemp(
+            prefix=f".{target.name}.", suffix=_tmp_pkg_suffix, dir=target.parent
+        )
+        os.close(fd)
+        tmp: Path = Path(tmp_name)
+        try:
+            with span("export.zip") as counters:
+                self._export(tmp, changed)
+                counters["bytes_read"] = target.stat().st_size
+                counters["bytes_written"] = tmp.stat().st_size
+            shutil.copymode(target, tmp)
+            with span("export.fsync"):
+                _fsync(tmp)
+            with span("export.publish"):
+                _backup(target, self._conf.backup, self._conf.backup_count)
+                os.replace(tmp, target)
+                _fsync(target.parent)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+
+    def __enter__(self) -> "Handler":
+        """Gives handler, changes are exported on leaving the with block."""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc: Optional[BaseException],
+        tb: Optional[TracebackType],
+    ) -> None:
+        """Exports changes, unless the with block raised, then cleans up."""
+        self.close(export=exc_type is None)
+
+    def __del__(self) -> None:
+        """Falls back to close, if handler wasn't closed (or used in with)."""
+        self.close()
+
+
+def find_deck(members: Iterable[ZipInfo], deck_suffix: str) -> Optional[ZipInfo]:
+    """Deck member, zstd-compressed variant first (e.g. anki21b, anki21).
+
+    Args:
+        members: archive entries
+        deck_suffix: suffix of (uncompressed) deck, without leading '.'
+
+    Returns:
+        Archive entry of deck, None if there's none.
+    """
+    infos: list[ZipInfo] = list(members)
+    for suffix in (deck_suffix + zstd.deck_suffix_flag, deck_suffix):
+        for info in infos:
+            if info.filename.split(".")[-1] == suffix:
+                return info
+    return None
+
+
+def deck_decoder(src: ZipFile, deck: ZipInfo) -> Optional[Decoder]:
+    """Stream decompressor for deck, if its content is zstd-compressed."""
+    with src.open(deck) as f:
+        return zstd.decompress_stream if zstd.is_zstd(f.read(4)) else None
+
+
+def media_names(manifest: bytes) -> dict[str, str]:
+    """Media file names by member name, from media manifest.
+
+    Args:
+        manifest: content of media member, JSON or zstd-compressed (newer
+            packages, see anki.zstd)
+
+    Returns:
+        Mapping of manifest, empty if it isn't a JSON object (invalid JSON or
+        protobuf raises ValueError).
+    """
+    if zstd.is_zstd(manifest):
+        return zstd.media_names(manifest)
+    names: object = json.loads(manifest)
+    return names if isinstance(names, dict) else {}
+
+
+def _entry_key(info: ZipInfo) -> tuple[int, int]:
+    """CRC and size of archive entry, telling whether its content changed."""
+    return info.CRC, info.file_size
+
+
+def _backup_path(target: Path, number: int) -> Path:
+    """Path of n-th backup of Anki export file, e.g. deck(old 2).apkg."""
+    flag: str = _orig_pkg_flag if number == 1 else f"{_orig_pkg_flag[:-1]} {number})"
+    return target.with_stem(target.stem + flag)
+
+
+def _backup(target: Path, mode: str, count: int) -> None:
+    """Keeps original Anki export file before it's replaced.
+
+    Backups are hard links, so they cost no copy (a copy is made only where
+    the file system has no hard links). In rotate mode, older backups are
+    renamed up to count, the oldest dropped.
+
+    Args:
+        target: Anki export file, about to be replaced
+        mode: none, hardlink (one backup) or rotate (count backups)
+        count: backups kept in rotate mode
+    """
+    if mode == "none":
+        return
+    if mode == "rotate":
+        for number in range(count - 1, 0, -1):
+            if _backup_path(target, number).exists():
+                os.replace(
+                    _backup_path(target, number), _backup_path(target, number + 1)
+                )
+    backup: Path = _backup_path(target, 1)
+    tmp: Path = backup.with_name(f".{backup.name}{_tmp_pkg_suffix}")
+    tmp.unlink(missing_ok=True)
+    try:
+        os.link(target, tmp)
+    except OSError:
+        shutil.copy2(target, tmp)
+    os.replace(tmp, backup)
 
-            with ZipFile(
-                self._anki_export_file,
-                mode="w",
-                compression=ZIP_DEFLATED,
-                compresslevel=self._zip_comp_lvl,
-            ) as new_archive:
-                for file_path in self._work_dir.iterdir():
-                    new_archive.write(file_path, arcname=file_path.name)
 
-        self._clean_up()
+def _fsync(path: Path) -> None:
+    """Flushes file (or directory entries, where supported) to disk."""
+    try:
+        fd: int = os.open(path, os.O_RDONLY)
+    except OSError:
+        return  # e.g. directories on Windows
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -0,0 +1,195 @@
+"""Compression policy for members written into an exported Anki package.
+
+Media that is already compressed (images, audio, video) is stored as is:
+deflating it again costs CPU for no size gain. Everything else (the deck, the
+media manifest) is deflated at the configured level. Compression of members
+runs on a thread pool, zlib releasing the GIL, while members are still written
+into the archive in their original order.
+"""
+import os
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from copy import copy
+from time import localtime
+from types import TracebackType
+from typing import Callable, Optional, Union
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile, ZipInfo
+
+from anki_lu.anki.archive import write_raw
+
+#  leading bytes of already-compressed formats (jpg, png, gif, mp3, ogg/opus,
+#  webm/mkv, flac, zip, zstd)
+_compressed_magic: tuple[bytes, ...] = (
+    b"\xff\xd8\xff",
+    b"\x89PNG",
+    b"GIF8",
+    b"ID3",
+    b"\xff\xfb",
+    b"\xff\xf3",
+    b"\xff\xf2",
+    b"OggS",
+    b"\x1a\x45\xdf\xa3",
+    b"fLaC",
+    b"PK\x03\x04",
+    b"\x28\xb5\x2f\xfd",
+)
+#  brands found at offset 8 of RIFF (webp) and at offset 4 of ISO media (mp4/m4a)
+_riff_compressed: tuple[bytes, ...] = (b"WEBP",)
+_iso_media_box: bytes = b"ftyp"
+_new_member_attr: int = 0o600 << 16  # as ZipFile.writestr gives new members
+_deflate_wbits: int = -zlib.MAX_WBITS  # raw deflate stream, as zip stores it
+
+
+def already_compressed(data: bytes) -> bool:
+    """Whether data starts like a compressed image, audio or archive format."""
+    if data.startswith(_compressed_magic):
+        return True
+    if data.startswith(b"RIFF") and data[8:12] in _riff_compressed:
+        return True
+    return data[4:8] == _iso_media_box
+
+
+def pack(
+    info: ZipInfo,
+    data: bytes,
+    level: int,
+    store: bool,
+    encode: Optional[Callable[[bytes], bytes]] = None,
+) -> tuple[ZipInfo, bytes]:
+    """Compresses member data for writing with archive.write_raw.
+
+    Args:
+        info: entry to base the written entry on (name, timestamps, attributes)
+        data: uncompressed member content
+        level: deflate level
+        store: store data as is, rather than deflating it
+        encode: compresses data itself (e.g. anki.zstd), result is stored
+
+    Returns:
+        Entry with compression method, CRC and size set, and the data to write.
+    """
+    if encode is not None:
+        data, store = encode(data), True
+    entry: ZipInfo = copy(info)
+    entry.file_size = len(data)
+    entry.CRC = zlib.crc32(data)
+    entry.compress_type = ZIP_STORED
+    if not store:
+        deflater = zlib.compressobj(level, zlib.DEFLATED, _deflate_wbits)
+        deflated: bytes = deflater.compress(data) + deflater.flush()
+        if len(deflated) < len(data):
+            entry.compress_type = ZIP_DEFLATED
+            return entry, deflated
+    return entry, data
+
+
+def new_entry(name: str, like: Optional[ZipInfo] = None) -> ZipInfo:
+    """Entry for a member written now, like ZipFile.writestr makes one.
+
+    Args:
+        name: member name
+        like: existing entry of member, whose attributes are kept
+
+    Returns:
+        Entry timestamped now.
+    """
+    entry: ZipInfo = copy(like) if like is not None else ZipInfo(name)
+    entry.date_time = localtime()[:6]
+    if like is None:
+        entry.external_attr = _new_member_attr
+    return entry
+
+
+class Packer:
+    """Writes members into an archive in order, compressing them in parallel.
+
+    Use as a context manager, leaving it writes out all pending members. At
+    most window members are held in memory (compressed or not) at a time.
+    """
+
+    def __init__(
+        self,
+        dst: ZipFile,
+        level: int,
+        workers: Optional[int] = None,
+        window: Optional[int] = None,
+    ) -> None:
+        """Starts compression thread pool.
+
+        Args:
+            dst: archive opened for writing
+            level: deflate level
+            workers: compression threads, defaults to one per core
+            window: members pending at most, defaults to twice the threads
+        """
+        threads: int = workers or os.cpu_count() or 1
+        self._dst: ZipFile = dst
+        self._level: int = level
+        self._pool: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=threads)
+        self._window: int = window or 2 * threads
+        self._pending: deque[
+            Union[Future[tuple[ZipInfo, bytes]], tuple[ZipInfo, bytes]]
+        ] = deque()
+
+    def add(
+        self,
+        info: ZipInfo,
+        data: bytes,
+        store: bool,
+        encode: Optional[Callable[[bytes], bytes]] = None,
+    ) -> None:
+        """Queues member for compression (see pack) and writing.
+
+        Args:
+            info: entry to base the written entry on
+            data: uncompressed member content
+            store: store data as is, rather than deflating it
+            encode: compresses data itself, result is stored
+        """
+        job = self._pool.submit(pack, info, data, self._level, store, encode)
+        self._queue(job)
+
+    def add_raw(self, info: ZipInfo, data: bytes) -> None:
+        """Queues already-compressed member data (see archive.read_raw).
+
+        Args:
+            info: entry of data's source archive
+            data: compressed bytes, matching info.compress_type
+        """
+        self._queue((info, data))
+
+    def _queue(
+        self, item: Union[Future[tuple[ZipInfo, bytes]], tuple[ZipInfo, bytes]]
+    ) -> None:
+        """Adds member to pending ones, writing the oldest if window is full."""
+        self._pending.append(item)
+        while len(self._pending) > self._window:
+            self._write_next()
+
+    def _write_next(self) -> None:
+        """Writes oldest pending member, waiting for its compression."""
+        item = self._pending.popleft()
+        info, data = item.result() if isinstance(item, Future) else item
+        write_raw(self._dst, info, data)
+
+    def __enter__(self) -> "Packer":
+        """Gives packer for adding members."""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc: Optional[BaseException],
+        tb: Optional[TracebackType],
+    ) -> None:
+        """Writes pending members (unless failing), and stops thread pool."""
+        try:
+            while self._pending and exc_type is None:
+                self._write_next()
+        finally:
+            for item in self._pending:
+                if isinstance(item, Future):
+                    item.cancel()
+            self._pending.clear()
+            self._pool.shutdown()
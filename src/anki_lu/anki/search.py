@@ -0,0 +1,188 @@
+"""Full-text search over deck notes, folding Luxembourgish spelling variants.
+
+Note fields are normalised (see normalise) and indexed with SQLite FTS5, in a
+side database kept beside the package, so it outlives the work area. Updating
+the index re-indexes only notes whose mod time changed, and drops removed
+notes. Queries are normalised the same way, so "Äddi" finds "addi", and "de"
+finds "den" (n-rule).
+
+Example::
+
+    with Handler(conf) as handler, SearchIndex.for_package(conf) as index:
+        index.update(handler.db)
+        note_ids = index.search("den Hond")
+"""
+import html
+import re
+import sqlite3
+import unicodedata
+from pathlib import Path
+from types import TracebackType
+from typing import Optional
+
+from anki_lu.anki.conf import Configuration as AnkiConf
+from anki_lu.anki.db import DeckDB
+
+_index_version: int = 1  # bump when normalise or schema change (forces rebuild)
+_index_suffix: str = ".search"
+_schema: str = """
+CREATE VIRTUAL TABLE notes_fts USING fts5(
+    body, tokenize = 'unicode61 remove_diacritics 0', prefix = '2 3'
+);
+CREATE TABLE indexed (id INTEGER PRIMARY KEY, mod INTEGER NOT NULL);
+"""
+_html_tag = re.compile(r"<[^>]*>")
+_word = re.compile(r"[^\W_]+")
+_vowels: str = "aeiouy"
+_field_sep: str = "\x1f"
+
+
+def normalise(text: str, n_rule: bool = True) -> str:
+    """Folds note field text for indexing: words, lower-case, no diacritics.
+
+    HTML tags are dropped and entities decoded. With n_rule, a final n after
+    a vowel is dropped (den/de, een/ee, an/a), as the Eifeler Regel drops it
+    before most consonants.
+
+    Args:
+        text: field content, or query
+        n_rule: whether to fold n-rule variants (not for prefix terms)
+
+    Returns:
+        Space separated words.
+    """
+    text = html.unescape(_html_tag.sub(" ", text)).casefold()
+    text = "".join(
+        c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c)
+    )
+    words: list[str] = _word.findall(text)
+    if n_rule:
+        words = [
+            w[:-1] if len(w) > 1 and w[-1] == "n" and w[-2] in _vowels else w
+            for w in words
+        ]
+    return " ".join(words)
+
+
+def _match_expression(query: str) -> str:
+    """FTS5 query matching all words of query, a trailing * for a prefix."""
+    terms: list[str] = []
+    for token in query.split():
+        prefix: bool = token.endswith("*")
+        words: list[str] = normalise(token, n_rule=not prefix).split()
+        #  words are letters and digits only (see normalise): quoted, so that
+        #  FTS5 reads e.g. "or" as a word, not an operator
+        terms.extend('"' + word + '"' for word in words)
+        if prefix and words:
+            terms[-1] += "*"
+    return " ".join(terms)
+
+
+class SearchIndex:
+    """FTS5 index of one package's notes, in a side database."""
+
+    def __init__(self, path: Path) -> None:
+        """Opens index, creating it (or rebuilding an outdated one).
+
+        Args:
+            path: side database file
+        """
+        self.path: Path = path
+        self._conn: sqlite3.Connection = sqlite3.connect(path)
+        version: int = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != _index_version:
+            with self._conn:
+                self._conn.execute("DROP TABLE IF EXISTS notes_fts")
+                self._conn.execute("DROP TABLE IF EXISTS indexed")
+                self._conn.executescript(_schema)
+                self._conn.execute(f"PRAGMA user_version = {_index_version}")
+
+    @classmethod
+    def for_package(cls, conf: AnkiConf) -> "SearchIndex":
+        """Index of configured package, at search_index or beside package.
+
+        Args:
+            conf: anki config
+
+        Returns:
+            Opened index, e.g. .deck.apkg.search for deck.apkg.
+        """
+        zip_path: Path = conf.zip_path
+        default: Path = zip_path.with_name(f".{zip_path.name}{_index_suffix}")
+        return cls(conf.search_index or default)
+
+    def update(self, db: DeckDB) -> int:
+        """Re-indexes notes added or changed since last update, drops removed.
+
+        Args:
+            db: deck to index
+
+        Returns:
+            Number of notes re-indexed or dropped.
+        """
+        current: dict[int, int] = {
+            row[0]: row[1] for row in db.query("SELECT id, mod FROM notes")
+        }
+        indexed: dict[int, int] = {
+            row[0]: row[1] for row in self._conn.execute("SELECT id, mod FROM indexed")
+        }
+        stale: list[int] = [n for n, mod in current.items() if indexed.get(n) != mod]
+        dropped: list[tuple[int]] = [(n,) for n in indexed.keys() - current.keys()]
+        if not stale and not dropped:
+            return 0
+        rows: list[sqlite3.Row] = db.query(
+            "SELECT id, mod, flds FROM notes WHERE id IN "
+            "(SELECT value FROM json_each(?))",
+            (f"[{','.join(map(str, stale))}]",),
+        )
+        with self._conn:
+            stale_ids: list[tuple[int]] = [(n,) for n in stale if n in indexed]
+            for ids in (stale_ids, dropped):
+                self._conn.executemany("DELETE FROM notes_fts WHERE rowid = ?", ids)
+                self._conn.executemany("DELETE FROM indexed WHERE id = ?", ids)
+            self._conn.executemany(
+                "INSERT INTO notes_fts (rowid, body) VALUES (?, ?)",
+                ((r[0], normalise(r[2].replace(_field_sep, " "))) for r in rows),
+            )
+            self._conn.executemany(
+                "INSERT INTO indexed VALUES (?, ?)", ((r[0], r[1]) for r in rows)
+            )
+        return len(stale) + len(dropped)
+
+    def search(self, query: str, limit: int = 20) -> list[int]:
+        """Ids of notes matching all words of query, best matches first.
+
+        Args:
+            query: words, normalised like note fields; end a word with * to
+                match it as a prefix
+            limit: most note ids returned
+
+        Returns:
+            Note ids, by relevance (bm25).
+        """
+        expression: str = _match_expression(query)
+        if not expression:
+            return []
+        rows = self._conn.execute(
+            "SELECT rowid FROM notes_fts WHERE notes_fts MATCH ? "
+            "ORDER BY rank LIMIT ?",
+            (expression, limit),
+        )
+        return [row[0] for row in rows]
+
+    def close(self) -> None:
+        """Closes side database."""
+        self._conn.close()
+
+    def __enter__(self) -> "SearchIndex":
+        """Gives index, closed on leaving the with block."""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc: Optional[BaseException],
+        tb: Optional[TracebackType],
+    ) -> None:
+        """Closes side database."""
+        self.close()
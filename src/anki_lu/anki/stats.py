@@ -0,0 +1,239 @@
+"""Review-log analytics of a deck: retention, due forecast and hard notes.
+
+Review log entries and cards are read from one cursor in chunks (fetchmany)
+into a NumPy array allocated for the counted rows, so memory holds the array
+and one chunk of rows. Every statistic is computed with vectorised operations,
+so a year of a class's reviews is analysed in well under a second. Needs the
+optional ``numpy`` package (``pip install anki-lu[stats]``).
+
+Anki days are counted from the collection's creation (col.crt): review cards
+are due on such a day, learning cards at an epoch time in seconds.
+"""
+import sqlite3
+import time
+from typing import Any, Optional
+
+from anki_lu.anki.db import DeckDB
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None  # type: ignore[assignment]
+
+#  upper bounds (days) of retention curve buckets, by interval before review
+retention_buckets: tuple[int, ...] = (1, 2, 4, 7, 14, 30, 90, 180, 365)
+_chunk: int = 262144
+_day: int = 86400
+#  cards.queue values
+_learn_queue, _review_queue, _day_learn_queue = 1, 2, 3
+#  review entries (revlog.type 1, not learning steps): card id, interval
+#  before review (days), failed (answered again)
+_reviews_sql: str = (
+    "SELECT cid, max(lastIvl, 0), ease = 1 FROM revlog WHERE type = 1 ORDER BY id"
+)
+_reviews_count_sql: str = "SELECT count(*) FROM revlog WHERE type = 1"
+_cards_sql: str = "SELECT id, nid, queue, due FROM cards ORDER BY id"
+_cards_count_sql: str = "SELECT count(*) FROM cards"
+_crt_sql: str = "SELECT crt FROM col"
+
+
+def _numpy() -> Any:
+    """The numpy module.
+
+    Returns:
+        numpy module, if installed.
+
+    Raises:
+        RuntimeError: if numpy isn't installed.
+    """
+    if np is None:
+        raise RuntimeError("deck stats need the stats extra: anki-lu[stats]")
+    return np
+
+
+def _load(
+    conn: sqlite3.Connection, sql: str, count_sql: str, columns: int, chunk: int
+) -> Any:
+    """Integer rows of query, read in chunks into an array of the counted rows.
+
+    Args:
+        conn: deck connection
+        sql: query of integer columns
+        count_sql: query counting rows of sql
+        columns: columns of sql
+        chunk: rows read at a time
+
+    Returns:
+        int64 array, one row per result row.
+    """
+    numpy: Any = _numpy()
+    rows: Any = numpy.empty(
+        (conn.execute(count_sql).fetchone()[0], columns), dtype=numpy.int64
+    )
+    filled: int = 0
+    cur: sqlite3.Cursor = conn.execute(sql)
+    while part := cur.fetchmany(chunk):
+        end: int = filled + len(part)
+        if end > len(rows):  # rows added since counted
+            rows = numpy.concatenate(
+                [rows, numpy.empty((end - len(rows), columns), dtype=numpy.int64)]
+            )
+        rows[filled:end] = part
+        filled = end
+    return rows[:filled]
+
+
+def load_reviews(db: DeckDB, chunk: int = _chunk) -> Any:
+    """Review entries of deck, read in chunks.
+
+    Args:
+        db: deck
+        chunk: entries read at a time
+
+    Returns:
+        int64 array, columns card id, interval before review (days, at least
+        0) and failed (1 if answered again, else 0).
+    """
+    with db.connection() as conn:
+        return _load(conn, _reviews_sql, _reviews_count_sql, 3, chunk)
+
+
+def load_cards(db: DeckDB, chunk: int = _chunk) -> Any:
+    """Cards of deck, by id, read in chunks.
+
+    Args:
+        db: deck
+        chunk: cards read at a time
+
+    Returns:
+        int64 array, columns id, note id, queue and due.
+    """
+    with db.connection() as conn:
+        return _load(conn, _cards_sql, _cards_count_sql, 4, chunk)
+
+
+def retention_curve(reviews: Any) -> tuple[Any, Any]:
+    """Reviews, and share passed, by interval before review (see buckets).
+
+    Args:
+        reviews: see load_reviews
+
+    Returns:
+        Reviews and retention per bucket of retention_buckets, and one for
+        longer intervals; retention is NaN for empty buckets.
+    """
+    numpy: Any = _numpy()
+    bucket: Any = numpy.searchsorted(
+        numpy.array(retention_buckets), numpy.maximum(reviews[:, 1], 1)
+    )
+    size: int = len(retention_buckets) + 1
+    counts: Any = numpy.bincount(bucket, minlength=size)
+    passed: Any = numpy.bincount(bucket, weights=1 - reviews[:, 2], minlength=size)
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        return counts, passed / counts
+
+
+def due_forecast(cards: Any, today: int, now: float, days: int) -> Any:
+    """Review cards due per day, from today (overdue cards count as today's).
+
+    Args:
+        cards: see load_cards
+        today: Anki day number of today
+        now: epoch time, for learning cards
+        days: days forecast
+
+    Returns:
+        Due counts, one per day.
+    """
+    numpy: Any = _numpy()
+    queue: Any = cards[:, 2]
+    due: Any = cards[:, 3]
+    in_days: Any = numpy.concatenate(
+        [
+            due[(queue == _review_queue) | (queue == _day_learn_queue)] - today,
+            (due[queue == _learn_queue] - int(now)) // _day,
+        ]
+    )
+    in_days = numpy.maximum(in_days[in_days < days], 0)
+    return numpy.bincount(in_days, minlength=days)
+
+
+def lapse_rates(reviews: Any, cards: Any) -> tuple[Any, Any, Any]:
+    """Reviews and lapses (failed reviews) of each reviewed note.
+
+    Args:
+        reviews: see load_reviews
+        cards: see load_cards
+
+    Returns:
+        Note ids, and their review and lapse counts.
+    """
+    numpy: Any = _numpy()
+    if not len(cards):
+        reviews = reviews[:0]
+        cards = numpy.zeros((1, 4), dtype=numpy.int64)
+    idx: Any = numpy.minimum(
+        numpy.searchsorted(cards[:, 0], reviews[:, 0]), len(cards) - 1
+    )
+    known: Any = cards[idx, 0] == reviews[:, 0]  # leaves out deleted cards
+    nids, note_idx = numpy.unique(cards[idx[known], 1], return_inverse=True)
+    counts: Any = numpy.bincount(note_idx, minlength=len(nids))
+    lapses: Any = numpy.bincount(
+        note_idx, weights=reviews[known, 2], minlength=len(nids)
+    )
+    return nids, counts, lapses.astype(numpy.int64)
+
+
+def report(
+    db: DeckDB,
+    days: int = 30,
+    top: int = 20,
+    min_reviews: int = 3,
+    now: Optional[float] = None,
+) -> dict[str, list[dict[str, Any]]]:
+    """Retention curve, due forecast, and notes with the highest lapse rates.
+
+    Args:
+        db: deck
+        days: days forecast
+        top: notes listed
+        min_reviews: reviews a note needs to be listed
+        now: epoch time, defaults to the current time
+
+    Returns:
+        JSON-ready tables: retention, forecast, and notes.
+    """
+    numpy: Any = _numpy()
+    now = time.time() if now is None else now
+    crt: int = db.query(_crt_sql)[0][0]
+    reviews: Any = load_reviews(db)
+    cards: Any = load_cards(db)
+
+    counts, retained = retention_curve(reviews)
+    bounds: list[Optional[int]] = [*retention_buckets, None]
+    forecast: Any = due_forecast(cards, int(now - crt) // _day, now, days)
+    nids, reviewed, lapses = lapse_rates(reviews, cards)
+    listed: Any = reviewed >= min_reviews
+    nids, reviewed, lapses = nids[listed], reviewed[listed], lapses[listed]
+    rate: Any = lapses / reviewed
+    order: Any = numpy.argsort(-rate, kind="stable")[:top]
+    return {
+        "retention": [
+            {
+                "max_interval": bound,
+                "reviews": int(counts[i]),
+                "retention": None if counts[i] == 0 else round(float(retained[i]), 4),
+            }
+            for i, bound in enumerate(bounds)
+        ],
+        "forecast": [{"day": d, "due": int(n)} for d, n in enumerate(forecast)],
+        "notes": [
+            {
+                "nid": int(nids[i]),
+                "reviews": int(reviewed[i]),
+                "lapses": int(lapses[i]),
+                "lapse_rate": round(float(rate[i]), 4),
+            }
+            for i in order
+        ],
+    }
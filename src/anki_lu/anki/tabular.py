@@ -0,0 +1,282 @@
+"""Streaming export of deck tables (notes, cards, revlog) for analytics.
+
+Rows are read from one cursor in chunks and written chunk by chunk, so memory
+holds one chunk whatever the collection's size. Note fields (joined by 0x1f in
+the deck) become one column each, named after the note type's fields; notes of
+several note types get the union of their field columns, empty where a note
+type lacks a field.
+
+Files are written as CSV, JSON Lines, or Parquet (columnar, needs the optional
+``pyarrow`` package: ``pip install anki-lu[parquet]``).
+
+Example::
+
+    with Handler(conf) as handler:
+        export_table(handler.db, "notes", Path("notes.parquet"))
+"""
+import csv
+import json
+from collections.abc import Iterator
+from operator import itemgetter
+from pathlib import Path
+from typing import IO, Any, NamedTuple, Optional
+
+from anki_lu.anki.db import DeckDB
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+formats: tuple[str, ...] = ("csv", "jsonl", "parquet")
+_suffixes: dict[str, str] = {".csv": "csv", ".jsonl": "jsonl", ".parquet": "parquet"}
+_chunk: int = 10000  # rows
+_buffer: int = 1 << 20  # bytes of file buffer, so writes are few and large
+_field_sep: str = "\x1f"
+#  exported columns, and whether they hold integers (else text), per table;
+#  notes also get one text column per field
+_columns: dict[str, tuple[tuple[str, bool], ...]] = {
+    "notes": (
+        ("id", True),
+        ("guid", False),
+        ("mid", True),
+        ("model", False),
+        ("mod", True),
+        ("usn", True),
+        ("tags", False),
+    ),
+    "cards": tuple(
+        (name, name != "data")
+        for name in (
+            "id nid did ord mod usn type queue due ivl factor reps lapses left odue "
+            "odid flags data"
+        ).split()
+    ),
+    "revlog": tuple(
+        (name, True) for name in "id cid usn ease ivl lastIvl factor time type".split()
+    ),
+}
+_notes_sql: str = "SELECT id, guid, mid, mod, usn, tags, flds FROM notes"
+_table_sql: dict[str, str] = {
+    table: f"SELECT {', '.join(n for n, _ in cols)} FROM {table} ORDER BY id"  # noqa: S608
+    for table, cols in _columns.items()
+}
+_models_sql: str = "SELECT models FROM col"
+
+
+class Columns(NamedTuple):
+    """Exported columns of a table."""
+
+    names: tuple[str, ...]
+    integer: tuple[bool, ...]  # per column, else text
+
+
+def _pyarrow() -> Any:
+    """The pyarrow module.
+
+    Returns:
+        pyarrow module, if installed.
+
+    Raises:
+        RuntimeError: if pyarrow isn't installed.
+    """
+    if pyarrow is None:
+        raise RuntimeError("Parquet export needs the parquet extra: anki-lu[parquet]")
+    return pyarrow
+
+
+def _models(db: DeckDB, model: Optional[str]) -> list[dict[str, Any]]:
+    """Note types of collection, or the one named (or with id) model.
+
+    Args:
+        db: deck
+        model: note type name (or id as string), all if None
+
+    Returns:
+        Note type definitions.
+
+    Raises:
+        KeyError: if model isn't in the collection.
+    """
+    models: dict[str, Any] = json.loads(db.query(_models_sql)[0][0])
+    if model is None:
+        return list(models.values())
+    found: list[dict[str, Any]] = [
+        m for k, m in models.items() if model in (k, m["name"])
+    ]
+    if not found:
+        raise KeyError(f"note type {model} not in collection")
+    return found[:1]
+
+
+def _field_names(models: list[dict[str, Any]]) -> list[str]:
+    """Field columns of note types: their field names, each once."""
+    names: dict[str, None] = {}
+    for m in models:
+        for f in sorted(m["flds"], key=lambda f: f["ord"]):
+            names.setdefault(f["name"])
+    return list(names)
+
+
+def columns(db: DeckDB, table: str, model: Optional[str] = None) -> Columns:
+    """Columns a table is exported with.
+
+    Args:
+        db: deck
+        table: notes, cards or revlog
+        model: notes only: note type name (or id as string) exported, all if None
+
+    Returns:
+        Column names and types.
+    """
+    fixed: tuple[tuple[str, bool], ...] = _columns[table]
+    fields: list[str] = _field_names(_models(db, model)) if table == "notes" else []
+    return Columns(
+        tuple(name for name, _ in fixed) + tuple(fields),
+        tuple(integer for _, integer in fixed) + (False,) * len(fields),
+    )
+
+
+def chunks(
+    db: DeckDB, table: str, model: Optional[str] = None, size: int = _chunk
+) -> Iterator[list[tuple[Any, ...]]]:
+    """Streams rows of table, in id order, matching columns(db, table, model).
+
+    Args:
+        db: deck
+        table: notes, cards or revlog
+        model: see columns
+        size: rows per chunk
+
+    Yields:
+        Up to size rows at a time.
+    """
+    models: list[dict[str, Any]] = _models(db, model) if table == "notes" else []
+    fields: list[str] = _field_names(models)
+    #  note type id -> (name, column index of each field, by field ord)
+    layout: dict[int, tuple[str, list[int]]] = {
+        int(m["id"]): (
+            m["name"],
+            [
+                fields.index(f["name"])
+                for f in sorted(m["flds"], key=lambda f: f["ord"])
+            ],
+        )
+        for m in models
+    }
+    if table == "notes":
+        sql: str = _notes_sql + (" WHERE mid = ?" if model else "") + " ORDER BY id"
+        params: tuple[Any, ...] = (next(iter(layout)),) if model else ()
+    else:
+        sql, params = _table_sql[table], ()
+    with db.connection() as conn:
+        cursor = conn.execute(sql, params)
+        while rows := cursor.fetchmany(size):
+            if table == "notes":
+                yield [_note_row(row, layout, len(fields)) for row in rows]
+            else:
+                yield rows
+
+
+def _note_row(
+    row: tuple[Any, ...], layout: dict[int, tuple[str, list[int]]], n_fields: int
+) -> tuple[Any, ...]:
+    """Notes row, with model name and fields split into their columns."""
+    nid, guid, mid, mod, usn, tags, flds = row
+    name, slots = layout.get(mid, ("", []))
+    values: list[Optional[str]] = [None] * n_fields
+    for i, value in enumerate(flds.split(_field_sep)[: len(slots)]):
+        values[slots[i]] = value
+    return (nid, guid, mid, name, mod, usn, tags.strip(), *values)
+
+
+def export_table(
+    db: DeckDB,
+    table: str,
+    dst: Path,
+    fmt: Optional[str] = None,
+    model: Optional[str] = None,
+    size: int = _chunk,
+) -> int:
+    """Writes a deck table to file, chunk by chunk.
+
+    Args:
+        db: deck, e.g. Handler.db
+        table: notes, cards or revlog
+        dst: file written (replaced)
+        fmt: csv, jsonl or parquet, taken from dst's suffix if None
+        model: see columns
+        size: rows per chunk
+
+    Returns:
+        Rows written.
+
+    Raises:
+        ValueError: if table or format is unknown.
+    """
+    if table not in _columns:
+        raise ValueError(f"unknown table {table}, not one of {', '.join(_columns)}")
+    fmt = fmt or _suffixes.get(dst.suffix.lower())
+    if fmt not in formats:
+        raise ValueError(f"{dst.name}: unknown export format, give one of {formats}")
+    cols: Columns = columns(db, table, model)
+    rows: Iterator[list[tuple[Any, ...]]] = chunks(db, table, model, size)
+    if fmt == "parquet":
+        return _write_parquet(dst, cols, rows)
+    with open(dst, "w", encoding="utf-8", newline="", buffering=_buffer) as f:
+        if fmt == "csv":
+            return _write_csv(f, cols, rows)
+        return _write_jsonl(f, cols, rows)
+
+
+def _write_csv(f: IO[str], cols: Columns, rows: Iterator[list[tuple[Any, ...]]]) -> int:
+    """Writes header, then rows (missing fields empty)."""
+    writer = csv.writer(f)
+    writer.writerow(cols.names)
+    count: int = 0
+    for chunk in rows:
+        writer.writerows(chunk)
+        count += len(chunk)
+    return count
+
+
+def _write_jsonl(
+    f: IO[str], cols: Columns, rows: Iterator[list[tuple[Any, ...]]]
+) -> int:
+    """Writes one object per row (missing fields null)."""
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    names: tuple[str, ...] = cols.names
+    count: int = 0
+    for chunk in rows:
+        f.write(
+            "".join(
+                encode({name: row[i] for i, name in enumerate(names)}) + "\n"
+                for row in chunk
+            )
+        )
+        count += len(chunk)
+    return count
+
+
+def _write_parquet(
+    dst: Path, cols: Columns, rows: Iterator[list[tuple[Any, ...]]]
+) -> int:
+    """Writes one row group per chunk."""
+    pa: Any = _pyarrow()
+    schema: Any = pa.schema(
+        [
+            (name, pa.int64() if cols.integer[i] else pa.string())
+            for i, name in enumerate(cols.names)
+        ]
+    )
+    count: int = 0
+    with pa.parquet.ParquetWriter(dst, schema) as writer:
+        for chunk in rows:
+            arrays: list[Any] = [
+                pa.array(list(map(itemgetter(i), chunk)), type=column.type)
+                for i, column in enumerate(schema)
+            ]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            count += len(chunk)
+    return count
@@ -0,0 +1,201 @@
+"""Integrity checks of an Anki export file, before it's shipped to learners.
+
+Three checks, each reported separately:
+
+- every member's data is read and checked against the CRC the archive
+  records, on a thread pool (inflating and checksumming release the GIL, so
+  all cores are used), each thread with its own handle on the archive
+- the deck is checked with SQLite's quick_check, on a read-only copy
+  (decompressed if zstd-compressed), without a handler or the media store
+- media references in note fields (``<img src>``, ``[sound:]``) are gathered
+  in one scan of the notes that hold any, and cross-referenced with the media
+  manifest and the archive's members
+
+Files whose name starts with "_" are used by note type templates (fonts, CSS
+images), as in Anki, so they're never orphaned.
+"""
+import html
+import os
+import re
+import shutil
+import sqlite3
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import NamedTuple, Optional
+from urllib.parse import unquote
+from zipfile import BadZipFile, ZipFile, ZipInfo
+
+from anki_lu.anki.conf import Configuration as AnkiConf
+from anki_lu.anki.mgr import deck_decoder, find_deck, media_manifest, media_names
+from anki_lu.anki.work import Decoder
+
+_package_members: tuple[str, ...] = ("media", "meta")  # besides collection.*
+_read_size: int = 1 << 20
+_template_prefix: str = "_"
+_media_ref_re: re.Pattern[str] = re.compile(
+    r"<img[^>]+src=[\"']?([^\"'>]+)[\"']?[^>]*>|\[sound:([^\]]+)\]", re.IGNORECASE
+)
+#  notes that may reference media; LIKE is case-insensitive (ASCII)
+_refs_sql: str = (
+    "SELECT flds FROM notes WHERE flds LIKE '%<img%' OR flds LIKE '%[sound:%'"
+)
+
+
+class VerifyReport(NamedTuple):
+    """Problems found in a package, each list sorted."""
+
+    members: int  # members checked
+    corrupt: list[str]  # members not matching their CRC, or unreadable
+    deck_errors: list[str]  # quick_check findings (or why it couldn't run)
+    missing: list[str]  # media referenced, or in manifest, but not in package
+    orphaned: list[str]  # media no note references, members not in manifest
+
+    @property
+    def ok(self) -> bool:
+        """Whether package is intact (orphaned media only wastes space)."""
+        return not (self.corrupt or self.deck_errors or self.missing)
+
+
+def _check_members(path: Path, infos: list[ZipInfo]) -> list[str]:
+    """Names of members whose data doesn't match its CRC, or can't be read."""
+    corrupt: list[str] = []
+    with ZipFile(path) as src:
+        for info in infos:
+            try:
+                with src.open(info) as f:  # checks CRC at end of data
+                    while f.read(_read_size):
+                        pass
+            #  RuntimeError: encrypted member, or unsupported compression
+            except (BadZipFile, EOFError, RuntimeError, zlib.error):
+                corrupt.append(info.filename)
+    return corrupt
+
+
+def check_crcs(path: Path, workers: Optional[int] = None) -> tuple[int, list[str]]:
+    """Checks every member of archive against its CRC, in parallel.
+
+    Args:
+        path: Anki export file
+        workers: threads, defaults to one per core
+
+    Returns:
+        Members checked, and names of corrupt ones.
+    """
+    with ZipFile(path) as src:
+        infos: list[ZipInfo] = [i for i in src.infolist() if not i.is_dir()]
+    threads: int = max(min(workers or os.cpu_count() or 1, len(infos)), 1)
+    #  largest first, dealt round-robin, so threads get similar shares of bytes
+    infos.sort(key=lambda i: i.compress_size, reverse=True)
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        shares = pool.map(
+            _check_members,
+            [path] * threads,
+            [infos[i::threads] for i in range(threads)],
+        )
+        corrupt: list[str] = sorted(name for share in shares for name in share)
+    return len(infos), corrupt
+
+
+def media_refs(conn: sqlite3.Connection) -> set[str]:
+    """Media file names referenced by note fields.
+
+    Args:
+        conn: connection to deck
+
+    Returns:
+        File names, HTML entities decoded; remote (URL) references left out.
+    """
+    refs: set[str] = set()
+    for (flds,) in conn.execute(_refs_sql):
+        for match in _media_ref_re.finditer(flds):
+            name: str = html.unescape(match.group(1) or match.group(2)).strip()
+            if name and "://" not in name and not name.startswith("data:"):
+                refs.add(name)
+    return refs
+
+
+def verify(conf: AnkiConf, workers: Optional[int] = None) -> VerifyReport:
+    """Checks package's members, deck, and media manifest (see module doc).
+
+    Nothing is changed: the package is opened, and closed without export.
+
+    Args:
+        conf: anki config of package
+        workers: threads checking CRCs, defaults to one per core
+
+    Returns:
+        Report of corrupt members, deck errors, and missing and orphaned media.
+    """
+    path: Path = conf.zip_path
+    members, corrupt = check_crcs(path, workers)
+    with ZipFile(path) as src:
+        names: set[str] = set(src.namelist())
+        try:
+            manifest: dict[str, str] = media_names(src.read(media_manifest))
+        except KeyError:
+            manifest = {}
+        except (ValueError, RuntimeError, BadZipFile, zlib.error):
+            manifest = {}
+            corrupt = sorted({*corrupt, media_manifest})
+    deck_errors, refs = _check_deck(conf)
+
+    present: set[str] = {file for member, file in manifest.items() if member in names}
+    missing: set[str] = {
+        file for member, file in manifest.items() if member not in names
+    }
+    missing.update(r for r in refs if r not in present and unquote(r) not in present)
+    used: set[str] = refs | {unquote(r) for r in refs}
+    orphaned: set[str] = {
+        file
+        for file in present
+        if file not in used and not file.startswith(_template_prefix)
+    }
+    orphaned.update(
+        name
+        for name in names
+        if name not in manifest
+        and name not in _package_members
+        and not name.startswith("collection.")
+    )
+    return VerifyReport(
+        members, corrupt, deck_errors, sorted(missing), sorted(orphaned)
+    )
+
+
+def _copy_deck(src: ZipFile, deck: ZipInfo, dst: Path) -> None:
+    """Writes deck member's data to dst, decompressed if zstd-compressed."""
+    decoder: Optional[Decoder] = deck_decoder(src, deck)
+    with src.open(deck) as f, open(dst, "wb") as out:
+        if decoder is None:
+            shutil.copyfileobj(f, out, _read_size)
+        else:
+            decoder(f, out)
+
+
+def _check_deck(conf: AnkiConf) -> tuple[list[str], set[str]]:
+    """Deck's quick_check findings (or why it failed), and its media references.
+
+    The deck is copied out of the package into a temp dir (in work_dir, if
+    set) and opened read-only.
+    """
+    with TemporaryDirectory(dir=conf.work_dir) as tmp:
+        copy: Path = Path(tmp) / "deck"
+        try:
+            with ZipFile(conf.zip_path) as src:
+                deck: Optional[ZipInfo] = find_deck(src.infolist(), conf.deck_suffix)
+                if deck is None:
+                    return [f"deck not loaded: no {conf.deck_suffix} file"], set()
+                _copy_deck(src, deck, copy)
+        #  RuntimeError: encrypted member, or zstd deck without the zstd extra
+        except (BadZipFile, EOFError, OSError, RuntimeError, zlib.error) as exc:
+            return [f"deck not loaded: {exc}"], set()
+        try:
+            uri: str = f"{copy.as_uri()}?mode=ro"
+            with closing(sqlite3.connect(uri, uri=True)) as conn:
+                findings: list[str] = [r[0] for r in conn.execute("PRAGMA quick_check")]
+                return [f for f in findings if f != "ok"], media_refs(conn)
+        except sqlite3.DatabaseError as exc:
+            return [str(exc)], set()
@@ -0,0 +1,466 @@
+"""Work areas, the scratch storage Handler extracts Anki package members into.
+
+A work area only holds members that were loaded (the deck, and anything asked
+for later) or written. Everything else stays in the source archive.
+"""
+import os
+import shutil
+import sqlite3
+import zlib
+from abc import ABC, abstractmethod
+from collections.abc import Container
+from io import BytesIO
+from pathlib import Path
+from tempfile import mkdtemp
+from typing import IO, Any, Callable, Optional
+from zipfile import ZipFile, ZipInfo
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover (Windows)
+    fcntl = None  # type: ignore[assignment]
+
+_work_deck_prefix: str = "anki_temp"
+_work_deck_loc: Path = Path(__file__).parent
+_hash_chunk_size: int = 1 << 20
+_sqlite_sidecars: tuple[str, ...] = ("-journal", "-wal", "-shm")
+_tmp_suffix: str = ".tmp"  # member file being replaced, see DiskArea.write
+_ficlone: int = 0x40049409  # Linux ioctl, clones file data (see clone_file)
+#  copies a compressed member stream into a file, decompressed (e.g. zstd)
+Decoder = Callable[[IO[bytes], IO[bytes]], None]
+
+
+class WorkArea(ABC):
+    """Scratch storage for members of one Anki export file."""
+
+    #  connect gives the same connection every call, rather than a new one
+    shared_connection: bool = False
+
+    def __init__(self, archive: Path, root: Optional[Path] = None) -> None:
+        """Sets up empty work area.
+
+        Args:
+            archive: Anki export file that members are loaded from
+            root: directory to create work area in (where applicable)
+        """
+        self._archive: Path = archive
+        self._root: Optional[Path] = root
+        #  decoded member name -> (size, crc32) of its content when loaded
+        self._decoded: dict[str, tuple[int, int]] = {}
+
+    @abstractmethod
+    def load(
+        self,
+        src: ZipFile,
+        info: ZipInfo,
+        deck: bool = False,
+        decoder: Optional[Decoder] = None,
+    ) -> None:
+        """Makes member of open archive available in work area.
+
+        Args:
+            src: archive opened for reading
+            info: member to load
+            deck: whether member is the SQLite deck
+            decoder: decompresses member content on loading, if it is stored
+                compressed inside the archive (see anki.zstd)
+        """
+
+    def _decode(
+        self, src: ZipFile, info: ZipInfo, decoder: Decoder, dst: IO[bytes]
+    ) -> None:
+        """Streams decoded member into dst, recording its size and crc32."""
+        checked: _Checksummed = _Checksummed(dst)
+        with src.open(info) as member:
+            decoder(member, checked)  # type: ignore[arg-type]
+        self._decoded[info.filename] = (checked.size, checked.crc)
+
+    def baseline(self, info: ZipInfo) -> tuple[int, int]:
+        """Size and crc32 of member content as loaded, before any changes."""
+        return self._decoded.get(info.filename, (info.file_size, info.CRC))
+
+    @abstractmethod
+    def load_file(
+        self,
+        info: ZipInfo,
+        path: Path,
+        baseline: tuple[int, int],
+        deck: bool = False,
+    ) -> None:
+        """Makes member available from a file, e.g. an extraction cache entry.
+
+        Args:
+            info: archive entry of member
+            path: file holding member content, as loaded (decoded), not changed
+            baseline: size and crc32 of content in path
+            deck: whether member is the SQLite deck
+        """
+
+    def link_file(self, info: ZipInfo, path: Path, baseline: tuple[int, int]) -> None:
+        """Makes member available from a file that's never changed (a blob).
+
+        Work areas that can share the file (see DiskArea) do, instead of
+        copying it.
+
+        Args:
+            info: archive entry of member
+            path: file holding member content, kept as it is
+            baseline: size and crc32 of content in path
+        """
+        self.load_file(info, path, baseline)
+
+    def unshare(self, name: str) -> None:  # noqa: B027 (no-op by default)
+        """Gives loaded member a file of its own, if it shares one (link_file)."""
+
+    def copy_to(self, name: str, dst: Path) -> None:
+        """Writes current content of loaded member to file."""
+        dst.write_bytes(self.read(name))
+
+    @abstractmethod
+    def loaded(self) -> list[str]:
+        """Names of members loaded into (or written to) work area."""
+
+    @abstractmethod
+    def path(self, name: str) -> Optional[Path]:
+        """File system path of a loaded member, None if it's held in memory."""
+
+    @abstractmethod
+    def read(self, name: str) -> bytes:
+        """Current content of member."""
+
+    @abstractmethod
+    def write(self, name: str, data: bytes) -> None:
+        """Replaces (or adds) member content."""
+
+    @abstractmethod
+    def removed(self, name: str) -> bool:
+        """Whether loaded member was deleted from work area."""
+
+    @abstractmethod
+    def changed(self, info: ZipInfo, check_content: bool) -> bool:
+        """Whether loaded member differs from its archive entry.
+
+        Args:
+            info: archive entry of member
+            check_content: compare checksums, not only size and mtime
+        """
+
+    @abstractmethod
+    def added(self, known: Container[str]) -> list[str]:
+        """Names of members in work area that aren't in known."""
+
+    @abstractmethod
+    def connect(self, name: str, **kwargs: Any) -> sqlite3.Connection:
+        """Gives SQLite connection to loaded deck member.
+
+        Args:
+            name: member name of deck
+            kwargs: passed on to sqlite3.connect, where a connection is opened
+        """
+
+    @abstractmethod
+    def clean_up(self) -> None:
+        """Releases all resources held by work area."""
+
+
+class DiskArea(WorkArea):
+    """Members extracted to files in a temporary directory.
+
+    The directory is created in root (e.g. a tmpfs mount), or next to this
+    package by default.
+    """
+
+    def __init__(self, archive: Path, root: Optional[Path] = None) -> None:
+        """Creates temp dir for members."""
+        super().__init__(archive, root)
+        self.dir: Path = Path(
+            mkdtemp(prefix=_work_deck_prefix, dir=root or _work_deck_loc)
+        )
+        #  loaded member name -> mtime (ns) of file when extracted
+        self._extracted: dict[str, int] = {}
+
+    def load(
+        self,
+        src: ZipFile,
+        info: ZipInfo,
+        deck: bool = False,
+        decoder: Optional[Decoder] = None,
+    ) -> None:
+        """Extracts member into temp dir (again, on reloading)."""
+        self._decoded.pop(info.filename, None)
+        self.path(info.filename).unlink(missing_ok=True)  # may be a link
+        if decoder is None:
+            path: str = src.extract(info, self.dir)
+        else:
+            path = str(self.path(info.filename))
+            with open(path, "wb") as f:
+                self._decode(src, info, decoder, f)
+        self._extracted[info.filename] = os.stat(path).st_mtime_ns
+
+    def load_file(
+        self,
+        info: ZipInfo,
+        path: Path,
+        baseline: tuple[int, int],
+        deck: bool = False,
+    ) -> None:
+        """Clones file into temp dir."""
+        dst: Path = self.path(info.filename)
+        dst.unlink(missing_ok=True)  # may be a link
+        clone_file(path, dst)
+        self._decoded[info.filename] = baseline
+        self._extracted[info.filename] = os.stat(dst).st_mtime_ns
+
+    def link_file(self, info: ZipInfo, path: Path, baseline: tuple[int, int]) -> None:
+        """Hard links file into temp dir (cloned if it's on another device).
+
+        The member file is then never written in place: write replaces it, and
+        unshare gives it a copy of its own.
+        """
+        dst: Path = self.path(info.filename)
+        tmp: Path = dst.with_name(f"{info.filename}{_tmp_suffix}")
+        tmp.unlink(missing_ok=True)
+        try:
+            os.link(path, tmp)
+        except OSError:
+            clone_file(path, tmp)
+        os.replace(tmp, dst)  # an earlier file of member stays, on failure
+        self._decoded[info.filename] = baseline
+        self._extracted[info.filename] = os.stat(dst).st_mtime_ns
+
+    def unshare(self, name: str) -> None:
+        """Replaces member file by a clone of it, if it's a hard link."""
+        path: Path = self.path(name)
+        if path.stat().st_nlink > 1:
+            tmp: Path = path.with_name(f"{name}{_tmp_suffix}")
+            clone_file(path, tmp)
+            os.replace(tmp, path)
+
+    def copy_to(self, name: str, dst: Path) -> None:
+        """Clones member file."""
+        clone_file(self.path(name), dst)
+
+    def loaded(self) -> list[str]:
+        """Names of extracted members."""
+        return list(self._extracted)
+
+    def path(self, name: str) -> Path:
+        """Path of member in temp dir."""
+        return self.dir / name
+
+    def read(self, name: str) -> bytes:
+        """Reads member file."""
+        return self.path(name).read_bytes()
+
+    def write(self, name: str, data: bytes) -> None:
+        """Writes member to a new file, replacing any (maybe linked) old one."""
+        path: Path = self.path(name)
+        tmp: Path = path.with_name(f"{name}{_tmp_suffix}")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+    def removed(self, name: str) -> bool:
+        """Whether member file no longer exists."""
+        return not self.path(name).exists()
+
+    def changed(self, info: ZipInfo, check_content: bool) -> bool:
+        """Compares member file with its archive entry.
+
+        A size difference is conclusive. Otherwise, with check_content, the
+        file's crc32 is compared with the one the archive already records, else
+        a changed mtime counts as a change. Timestamps alone can't be trusted
+        for the deck: opening it in SQLite, or a touch, bumps mtime without
+        changing content, while coarse timestamps can miss a write.
+        """
+        file_path: Path = self.path(info.filename)
+        stat: os.stat_result = os.stat(file_path)
+        size, crc = self.baseline(info)
+        if stat.st_size != size:
+            return True
+        if not check_content:
+            return stat.st_mtime_ns != self._extracted.get(info.filename)
+        return _crc32(file_path) != crc
+
+    def added(self, known: Container[str]) -> list[str]:
+        """Names of files in temp dir that aren't in known.
+
+        SQLite journal files left next to the deck aren't members.
+        """
+        return [
+            p.name
+            for p in self.dir.iterdir()
+            if p.name not in known and not p.name.endswith(_sqlite_sidecars)
+        ]
+
+    def connect(self, name: str, **kwargs: Any) -> sqlite3.Connection:
+        """Opens new connection to deck file."""
+        conn: sqlite3.Connection = sqlite3.connect(self.path(name), **kwargs)
+        return conn
+
+    def clean_up(self) -> None:
+        """Removes temp dir and everything in it."""
+        shutil.rmtree(self.dir)
+
+
+class MemoryArea(WorkArea):
+    """Members held in memory, nothing written to disk.
+
+    The deck is deserialized into an in-memory SQLite database, which lives as
+    long as the work area's single connection (so it mustn't be closed by
+    callers). Other members stay lazy references into the source archive until
+    written.
+    """
+
+    shared_connection: bool = True
+
+    def __init__(self, archive: Path, root: Optional[Path] = None) -> None:
+        """Sets up empty in-memory storage."""
+        super().__init__(archive, root)
+        if not hasattr(sqlite3.Connection, "deserialize"):
+            raise RuntimeError("memory work area needs Python 3.11+ sqlite3")
+        self._decks: dict[str, sqlite3.Connection] = {}
+        self._data: dict[str, bytes] = {}
+        self._loaded: set[str] = set()
+
+    def load(
+        self,
+        src: ZipFile,
+        info: ZipInfo,
+        deck: bool = False,
+        decoder: Optional[Decoder] = None,
+    ) -> None:
+        """Deserializes deck into memory, other members are only referenced.
+
+        Members that need decoding are decoded into memory on loading. Loading
+        a member again drops data written to it.
+        """
+        data: Optional[bytes] = None
+        self._decoded.pop(info.filename, None)
+        self._data.pop(info.filename, None)
+        if decoder is not None:
+            buffer: BytesIO = BytesIO()
+            self._decode(src, info, decoder, buffer)
+            data = buffer.getvalue()
+        if deck:
+            self._new_deck(info.filename)
+            self.write(info.filename, src.read(info) if data is None else data)
+        elif data is not None:
+            self._data[info.filename] = data
+        self._loaded.add(info.filename)
+
+    def _new_deck(self, name: str) -> None:
+        """Opens empty in-memory database for deck, closing one loaded before."""
+        if name in self._decks:
+            self._decks[name].close()
+        self._decks[name] = sqlite3.connect(":memory:", check_same_thread=False)
+
+    def load_file(
+        self,
+        info: ZipInfo,
+        path: Path,
+        baseline: tuple[int, int],
+        deck: bool = False,
+    ) -> None:
+        """Reads file into memory, deserializing a deck."""
+        data: bytes = path.read_bytes()
+        if deck:
+            self._new_deck(info.filename)
+        self.write(info.filename, data)
+        self._decoded[info.filename] = baseline
+        self._loaded.add(info.filename)
+
+    def loaded(self) -> list[str]:
+        """Names of decks, and members read through or written to work area."""
+        return list(self._loaded | self._data.keys())
+
+    def path(self, name: str) -> Optional[Path]:
+        """None, members have no file system path."""
+        return None
+
+    def read(self, name: str) -> bytes:
+        """Serialized deck, written data, or member data from source archive."""
+        if name in self._decks:
+            return self._decks[name].serialize()
+        if name in self._data:
+            return self._data[name]
+        with ZipFile(self._archive) as src:
+            return src.read(name)
+
+    def write(self, name: str, data: bytes) -> None:
+        """Keeps member data in memory (decks are replaced)."""
+        if name in self._decks:
+            if data:  # zero-length file is an empty database, not deserializable
+                self._decks[name].deserialize(data)
+        else:
+            self._data[name] = data
+
+    def removed(self, name: str) -> bool:
+        """Members can't be removed from memory work area."""
+        return False
+
+    def changed(self, info: ZipInfo, check_content: bool) -> bool:
+        """Compares size and crc32 of deck or written data with archive entry."""
+        if info.filename not in self._decks and info.filename not in self._data:
+            return False
+        data: bytes = self.read(info.filename)
+        return (len(data), zlib.crc32(data)) != self.baseline(info)
+
+    def added(self, known: Container[str]) -> list[str]:
+        """Names of written members that aren't in known."""
+        return [name for name in self._data if name not in known]
+
+    def connect(self, name: str, **kwargs: Any) -> sqlite3.Connection:
+        """Shared connection to in-memory deck (kwargs are ignored)."""
+        return self._decks[name]
+
+    def clean_up(self) -> None:
+        """Closes in-memory decks and drops member data."""
+        for conn in self._decks.values():
+            conn.close()
+        self._decks.clear()
+        self._data.clear()
+
+
+#  work_area config values -> implementation
+areas: dict[str, type[WorkArea]] = {"disk": DiskArea, "memory": MemoryArea}
+
+
+class _Checksummed:
+    """Writable wrapper, tracking size and crc32 of what is written through."""
+
+    def __init__(self, dst: IO[bytes]) -> None:
+        """Wraps dst."""
+        self._dst: IO[bytes] = dst
+        self.size: int = 0
+        self.crc: int = 0
+
+    def write(self, data: bytes) -> int:
+        """Writes data to wrapped file."""
+        self.size += len(data)
+        self.crc = zlib.crc32(data, self.crc)
+        return self._dst.write(data)
+
+
+def clone_file(src: Path, dst: Path) -> None:
+    """Copies file, as a copy-on-write clone (reflink) where supported.
+
+    Linux file systems with reflinks (btrfs, XFS) share the data blocks until
+    either file is written, other systems get a plain copy.
+    """
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        if fcntl is not None:
+            try:
+                fcntl.ioctl(d.fileno(), _ficlone, s.fileno())
+                return
+            except OSError:
+                pass
+        shutil.copyfileobj(s, d, _hash_chunk_size)
+
+
+def _crc32(path: Path) -> int:
+    """Streams file through zlib's crc32, same checksum as zip entries."""
+    crc: int = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(_hash_chunk_size):
+            crc = zlib.crc32(chunk, crc)
+    return crc
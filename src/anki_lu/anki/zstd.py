@@ -0,0 +1,202 @@
+"""Zstandard-compressed members of newer Anki packages (Anki 2.1.50+).
+
+These packages hold the collection as ``collection.anki21b``, a zstd-compressed
+SQLite file, and a ``media`` map that is zstd-compressed protobuf rather than
+JSON. Needs the optional ``zstandard`` package (``pip install anki-lu[zstd]``).
+"""
+import shutil
+from collections.abc import Iterator
+from io import BytesIO
+from typing import IO, Any, Union
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None  # type: ignore[assignment]
+
+#  collection.anki21b: deck suffix (e.g. anki21) plus this
+deck_suffix_flag: str = "b"
+_magic: bytes = b"\x28\xb5\x2f\xfd"
+_chunk_size: int = 1 << 20
+#  protobuf: MediaEntries.entries, and MediaEntry name & legacy zip name fields
+_entries_field: int = 1
+_name_field: int = 1
+_zip_name_field: int = 255
+_varint_wire, _fixed64_wire, _length_wire, _fixed32_wire = 0, 1, 2, 5
+
+
+def is_zstd(data: bytes) -> bool:
+    """Whether data starts with a zstd frame."""
+    return data.startswith(_magic)
+
+
+def _zstandard() -> Any:
+    """The zstandard module.
+
+    Returns:
+        zstandard module, if installed.
+
+    Raises:
+        RuntimeError: if zstandard isn't installed.
+    """
+    if zstandard is None:
+        raise RuntimeError("zstd packages need the zstd extra: anki-lu[zstd]")
+    return zstandard
+
+
+def decompress_stream(src: IO[bytes], dst: IO[bytes]) -> None:
+    """Streams zstd-compressed src (one or more frames) into dst, decompressed."""
+    decompressor: Any = _zstandard().ZstdDecompressor()
+    with decompressor.stream_reader(
+        src, read_across_frames=True, closefd=False
+    ) as reader:
+        shutil.copyfileobj(reader, dst, _chunk_size)
+
+
+def decompress(data: bytes) -> bytes:
+    """Decompresses zstd data (frames needn't record their content size).
+
+    Args:
+        data: one or more zstd frames
+
+    Returns:
+        Decompressed content.
+
+    Raises:
+        ValueError: if data isn't valid zstd.
+    """
+    module: Any = _zstandard()
+    out: BytesIO = BytesIO()
+    try:
+        decompress_stream(BytesIO(data), out)
+    except module.ZstdError as exc:
+        raise ValueError(f"invalid zstd data: {exc}") from exc
+    return out.getvalue()
+
+
+def compress(data: bytes, level: int = 3, threads: int = -1) -> bytes:
+    """Compresses data into a zstd frame.
+
+    Args:
+        data: uncompressed content
+        level: zstd compression level
+        threads: compression threads, -1 for one per core (multi-threaded
+            frames need a zstd library built with thread support)
+
+    Returns:
+        zstd frame, recording content size.
+    """
+    compressor = _zstandard().ZstdCompressor(level=level, threads=threads)
+    return bytes(compressor.compress(data))
+
+
+def media_names(data: bytes) -> dict[str, str]:
+    """Media file names by member name, from a zstd/protobuf media map.
+
+    Members are named by their entry's position in the map ("0", "1", ...),
+    unless the entry records a legacy zip name.
+
+    Args:
+        data: zstd-compressed MediaEntries message
+
+    Returns:
+        Member name to media file name mapping.
+
+    Raises:
+        ValueError: if data isn't a valid media map.
+    """
+    names: dict[str, str] = {}
+    entries = (v for n, v in _fields(decompress(data)) if n == _entries_field)
+    try:
+        for idx, entry in enumerate(entries):
+            fields: dict[int, Union[int, bytes]] = dict(_fields(bytes(entry)))
+            name = fields.get(_name_field, b"")
+            if isinstance(name, bytes):
+                names[str(fields.get(_zip_name_field, idx))] = name.decode("utf-8")
+    except IndexError as exc:
+        raise ValueError("truncated media map") from exc
+    return names
+
+
+def media_map(names: dict[str, str], level: int = 3) -> bytes:
+    """Builds zstd/protobuf media map, as read by media_names.
+
+    Args:
+        names: media file names by member name, members named "0", "1", ...
+            in order are recorded by position, others as legacy zip names
+        level: zstd compression level
+
+    Returns:
+        zstd-compressed MediaEntries message.
+    """
+    message: bytearray = bytearray()
+    for idx, (member, name) in enumerate(names.items()):
+        entry: bytes = _length_field(_name_field, name.encode("utf-8"))
+        if member != str(idx):
+            entry += _varint_field(_zip_name_field, int(member))
+        message += _length_field(_entries_field, entry)
+    return compress(bytes(message), level)
+
+
+def _encode_varint(value: int) -> bytes:
+    """Protobuf varint encoding of non-negative value."""
+    out: bytearray = bytearray()
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _varint_field(number: int, value: int) -> bytes:
+    """Protobuf varint field."""
+    return _encode_varint(number << 3 | _varint_wire) + _encode_varint(value)
+
+
+def _length_field(number: int, value: bytes) -> bytes:
+    """Protobuf length-delimited (string, bytes, message) field."""
+    key: bytes = _encode_varint(number << 3 | _length_wire)
+    return key + _encode_varint(len(value)) + value
+
+
+def _varint(buf: bytes, pos: int) -> tuple[int, int]:
+    """Decodes protobuf varint at pos, giving value and position after it."""
+    value: int = 0
+    shift: int = 0
+    while True:
+        byte: int = buf[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def _fields(buf: bytes) -> Iterator[tuple[int, Union[int, bytes]]]:
+    """Field numbers and values of a protobuf message.
+
+    Args:
+        buf: serialized message
+
+    Yields:
+        Field number, and value: int for varints, bytes for other wire types.
+
+    Raises:
+        ValueError: for (deprecated) group wire types.
+    """
+    pos: int = 0
+    while pos < len(buf):
+        key, pos = _varint(buf, pos)
+        wire: int = key & 0x07
+        if wire == _varint_wire:
+            value, pos = _varint(buf, pos)
+            yield key >> 3, value
+            continue
+        if wire == _length_wire:
+            size, pos = _varint(buf, pos)
+        elif wire in (_fixed64_wire, _fixed32_wire):
+            size = 8 if wire == _fixed64_wire else 4
+        else:
+            raise ValueError(f"unsupported protobuf wire type {wire}")
+        yield key >> 3, buf[pos : pos + size]
+        pos += size
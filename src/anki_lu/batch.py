@@ -0,0 +1,77 @@
+"""Runs a task over many Anki export files, in a pool of worker processes.
+
+Each package gets its own Handler in a worker, and any error stays with that
+package's result, so one bad archive doesn't abort the batch.
+"""
+import glob
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Callable, NamedTuple, Optional
+
+from anki_lu.anki.conf import Configuration as AnkiConf
+from anki_lu.anki.mgr import Handler
+
+Task = Callable[[Handler], Any]
+
+
+class PackageResult(NamedTuple):
+    """Outcome of a batch task for one package."""
+
+    path: Path
+    ok: bool
+    seconds: float
+    detail: str  # task result, or error
+
+
+def count_notes(handler: Handler) -> str:
+    """Default batch task, summarises the deck."""
+    return f"{handler.db.query('SELECT count() FROM notes')[0][0]} notes"
+
+
+def expand(patterns: Iterable[str]) -> list[Path]:
+    """Package paths from paths and glob patterns, de-duplicated, in order."""
+    found: dict[Path, None] = {}
+    for pattern in patterns:
+        matches: list[str] = sorted(glob.glob(pattern, recursive=True))
+        for match in matches or [pattern]:
+            found[Path(match)] = None
+    return list(found)
+
+
+def _process(conf: AnkiConf, task: Task) -> PackageResult:
+    """Runs task on one package (in a worker process)."""
+    start: float = perf_counter()
+    try:
+        with Handler(conf) as handler:
+            detail: str = str(task(handler))
+    except Exception as exc:  # noqa: B902 (reported per package)
+        error: str = f"{type(exc).__name__}: {exc}"
+        return PackageResult(conf.zip_path, False, perf_counter() - start, error)
+    return PackageResult(conf.zip_path, True, perf_counter() - start, detail)
+
+
+def run_batch(
+    conf: AnkiConf,
+    packages: Iterable[Path],
+    task: Task = count_notes,
+    workers: Optional[int] = None,
+) -> list[PackageResult]:
+    """Runs task on each package, in parallel worker processes.
+
+    Args:
+        conf: anki config, used for every package (zip_path is replaced)
+        packages: Anki export files
+        task: picklable (module-level) callable given each package's Handler,
+            its changes are exported unless it raises
+        workers: worker processes, defaults to one per core
+
+    Returns:
+        One result per package, in input order.
+    """
+    confs: list[AnkiConf] = [conf.copy(update={"zip_path": p}) for p in packages]
+    if workers == 1 or len(confs) <= 1:
+        return [_process(c, task) for c in confs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_process, confs, [task] * len(confs)))
@@ -3,17 +3,32 @@
 This class handles access and management of data persistence (e.g. json files),
 enabling the conf files to focus purely on defining the model
 """
-from importlib import util
+import hashlib
+import os
+import sys
+from importlib import import_module, util
 from inspect import getmembers
 from pathlib import Path
+from types import ModuleType
+from typing import Optional
 
-from pydantic import BaseModel
+from pydantic import VERSION, BaseModel
+
+from anki_lu import __version__
+from anki_lu.profiling import span
 
 def_file_name: str = "config.json"
 def_module_name: str = "conf"
 def_model_name: str = "Configuration"
 _pkg_path: Path = Path(__file__).parent
 _pkg_name: str = _pkg_path.stem
+#  validated config objects, in process and (as JSON) across processes
+_cache_dir: Path = Path(
+    os.environ.get("ANKI_LU_CACHE_DIR", Path.home() / ".cache" / _pkg_name)
+)
+_mem_cache: dict[str, BaseModel] = {}
+#  modules defining models the package config nests, so part of the cache key
+_model_sources: tuple[Path, ...] = (_pkg_path / "anki" / "conf.py",)
 
 
 def get_config_obj(
@@ -21,6 +36,7 @@ def get_config_obj(
     pkg_dir: Path = _pkg_path,
     module: str = def_module_name,
     model: str = def_model_name,
+    cache: bool = True,
 ) -> BaseModel:
     """Accesses persistence (json), and uses it to instantiate config model.
 
@@ -28,28 +44,103 @@ def get_config_obj(
     -   this module and conf module are both in top-level pkg directory,
     -   the conf data file is json format.
 
+    Validated config objects are cached, keyed on the package version, and the
+    paths, sizes and mtimes of module, data file and nested model modules. A hit
+    in process skips import and validation. The on-disk cache keeps the JSON of
+    validated objects for later program starts: a hit there is parsed (so
+    validated) with the model, an entry the model rejects is a miss.
+
     Args:
         data: name of data file (only json support currently)
         pkg_dir: Path to top-level directory holding module and data file
         module: name of module defining config model (e.g. conf)
         model: name of class in conf module that sets data model
+        cache: whether to use (and fill) the config cache
 
     Returns:
-        A validated config model (based on pydantic BaseModel).
-
-    Raises:
-        FileNotFoundError: if conf module isn't found.
-        NameError: if model (class) isn't found.
-        ValueError: if json file data has validation error during instantiation.
+        A validated config model (based on pydantic BaseModel), a copy that
+        callers may modify.
     """
+    with span("config") as counters:
+        file_path: Path = pkg_dir.joinpath(module).with_suffix(".py")
+        key: Optional[str] = _cache_key(file_path, pkg_dir.joinpath(data), model)
+        if not cache or key is None:
+            return _validated(data, pkg_dir, _model(pkg_dir, module, model))
+        conf_obj: Optional[BaseModel] = _mem_cache.get(key)
+        if conf_obj is None:
+            c_model: type[BaseModel] = _model(pkg_dir, module, model)
+            conf_obj = _read_cache(key, c_model)
+        counters["cache_hits"] = int(conf_obj is not None)
+        if conf_obj is None:
+            conf_obj = _validated(data, pkg_dir, c_model)
+            _write_cache(key, conf_obj)
+        _mem_cache[key] = conf_obj
+        return conf_obj.copy(deep=True)
+
+
+def _cache_key(module_path: Path, data_path: Path, model: str) -> Optional[str]:
+    """Digest of file identities and versions, None if a file is missing."""
+    parts: list[object] = [model, sys.version_info[:2], VERSION, __version__]
+    for path in (module_path, data_path, *_model_sources):
+        try:
+            stat: os.stat_result = os.stat(path)
+        except OSError:
+            return None
+        parts.extend((path.resolve(), stat.st_size, stat.st_mtime_ns))
+    return hashlib.sha1(repr(parts).encode()).hexdigest()  # noqa: S324
+
+
+def _read_cache(key: str, c_model: type[BaseModel]) -> Optional[BaseModel]:
+    """Config object from on-disk cache, None on miss (or an invalid entry)."""
+    try:
+        return c_model.parse_raw((_cache_dir / f"{key}.json").read_bytes())
+    except (OSError, ValueError):  # pydantic ValidationError is a ValueError
+        return None
+
+
+def _write_cache(key: str, conf_obj: BaseModel) -> None:
+    """Stores JSON of validated config object on disk, if it can be encoded."""
+    try:
+        payload: str = conf_obj.json()
+        _cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp: Path = _cache_dir / f"{key}.{os.getpid()}.tmp"
+        tmp.write_text(payload)
+        os.replace(tmp, _cache_dir / f"{key}.json")
+    except (OSError, TypeError, ValueError):
+        pass  # e.g. read-only home, or a field type JSON can't hold
+
+
+def _import_conf(pkg_dir: Path, module: str) -> ModuleType:
+    """Imports conf module, as a package module (bytecode cached) if it is one."""
+    if pkg_dir == _pkg_path:
+        return import_module(f"{_pkg_name}.{module}")
     #  Supports cases (e.g. test) when module is not in package folder.
     #  Recipe for direct import of source file: https://bityl.co/Elxf
     file_path: Path = pkg_dir.joinpath(module).with_suffix(".py")
     spec = util.spec_from_file_location(module, file_path)
     c_module = util.module_from_spec(spec)  # type: ignore[arg-type]
+    spec.loader.exec_module(c_module)  # type: ignore[union-attr]
+    return c_module
+
+
+def _model(pkg_dir: Path, module: str, model: str) -> type[BaseModel]:
+    """Imports conf module, and looks up config model in it.
+
+    Args:
+        pkg_dir: Path to top-level directory holding module and data file
+        module: name of module defining config model (e.g. conf)
+        model: name of class in conf module that sets data model
+
+    Returns:
+        Config model class (based on pydantic BaseModel).
+
+    Raises:
+        FileNotFoundError: if conf module isn't found.
+        NameError: if model (class) isn't found.
+    """
     try:
-        spec.loader.exec_module(c_module)  # type: ignore[union-attr]
-    except FileNotFoundError as exc:
+        c_module: ModuleType = _import_conf(pkg_dir, module)
+    except (FileNotFoundError, ModuleNotFoundError) as exc:
         raise FileNotFoundError(
             f"{exc}: run from <test>, {module} could not be imported"
         ) from exc
@@ -61,7 +152,23 @@ def get_config_obj(
             break
     if c_model == BaseModel():
         raise NameError(f"{model} not found in {module}")
+    return c_model  # type: ignore[return-value]
+
 
+def _validated(data: str, pkg_dir: Path, c_model: type[BaseModel]) -> BaseModel:
+    """Validates data file with config model.
+
+    Args:
+        data: name of data file (only json support currently)
+        pkg_dir: Path to top-level directory holding module and data file
+        c_model: config model class, see _model
+
+    Returns:
+        A validated config model (based on pydantic BaseModel).
+
+    Raises:
+        ValueError: if json file data has validation error during instantiation.
+    """
     # no tests written for try block, pydantic handles validation/errors
     try:  # pragma: no cover
         if pkg_dir == _pkg_name:  # pragma: no cover
@@ -0,0 +1,104 @@
+"""Timing spans and byte counters around the expensive phases of a run.
+
+Instrumented code wraps a phase in ``span(name)``, and may add counters (e.g.
+bytes read) to the dict it yields. Finished spans go to registered hooks, so
+embedding code can collect them; without hooks a span costs two clock reads.
+``Recorder`` is a hook that sums spans by name, for the CLI's --profile.
+
+Span names are dotted by phase: config, open, detect, close.db, export.zip,
+export.fsync and export.publish.
+"""
+import json
+from collections.abc import Iterator
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+from typing import Any, Callable, NamedTuple
+
+
+class Span(NamedTuple):
+    """A finished phase."""
+
+    name: str
+    seconds: float
+    counters: dict[str, int]
+
+
+Hook = Callable[[Span], None]
+_hooks: list[Hook] = []
+
+
+def add_hook(hook: Hook) -> None:
+    """Registers hook, called with every finished span (in the span's thread)."""
+    _hooks.append(hook)
+
+
+def remove_hook(hook: Hook) -> None:
+    """Unregisters hook."""
+    _hooks.remove(hook)
+
+
+@contextmanager
+def span(name: str) -> Iterator[dict[str, int]]:
+    """Times the with block, reporting it to hooks when it ends.
+
+    Args:
+        name: phase name
+
+    Yields:
+        Counters of the span, for the block to add to.
+    """
+    counters: dict[str, int] = {}
+    start: float = perf_counter()
+    try:
+        yield counters
+    finally:
+        if _hooks:
+            finished: Span = Span(name, perf_counter() - start, counters)
+            for hook in list(_hooks):
+                hook(finished)
+
+
+class Recorder:
+    """Hook summing spans by name: count, total time and counters."""
+
+    def __init__(self) -> None:
+        """Starts with no spans."""
+        self._lock: Lock = Lock()
+        self._totals: dict[str, dict[str, Any]] = {}
+
+    def __call__(self, finished: Span) -> None:
+        """Adds span to its name's totals."""
+        with self._lock:
+            total = self._totals.setdefault(
+                finished.name, {"count": 0, "seconds": 0.0, "counters": {}}
+            )
+            total["count"] += 1
+            total["seconds"] += finished.seconds
+            for key, value in finished.counters.items():
+                total["counters"][key] = total["counters"].get(key, 0) + value
+
+    def summary(self) -> dict[str, dict[str, Any]]:
+        """Totals by span name, in order of first occurrence."""
+        with self._lock:
+            return {
+                name: {**total, "counters": dict(total["counters"])}
+                for name, total in self._totals.items()
+            }
+
+    def table(self) -> str:
+        """Summary as a plain text table."""
+        lines: list[str] = [f"{'span':<16} {'count':>5} {'ms':>10}  counters"]
+        for name, total in self.summary().items():
+            counters: str = ", ".join(
+                f"{key}={value:,}" for key, value in total["counters"].items()
+            )
+            lines.append(
+                f"{name:<16} {total['count']:>5} {total['seconds'] * 1000:>10.1f}"
+                f"  {counters}"
+            )
+        return "\n".join(lines)
+
+    def json(self) -> str:
+        """Summary as JSON."""
+        return json.dumps(self.summary(), indent=2)
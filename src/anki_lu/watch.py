@@ -0,0 +1,112 @@
+"""Keeps Anki export files open, re-running a task whenever one is rewritten.
+
+Each package gets one Handler for the whole session, so its work area and deck
+connections stay warm. Packages are polled (a stat call each), and a rewrite
+is handled once the file has settled, so a burst of writes (or a slow copy)
+triggers one refresh. Refreshing re-reads only the members whose CRC or size
+changed (see Handler.refresh), so reacting to a new export costs about as much
+as its changed members.
+
+Tasks are meant to read (e.g. count, index, report): handlers are closed
+without export, as their package may be rewritten under them at any time.
+"""
+import os
+import time
+from collections.abc import Generator, Iterable
+from pathlib import Path
+from time import monotonic, perf_counter
+from typing import NamedTuple, Optional
+
+from anki_lu.anki.conf import Configuration as AnkiConf
+from anki_lu.anki.mgr import Handler
+from anki_lu.batch import Task, count_notes
+
+#  file identity and state, changing when a package is rewritten (or replaced)
+_Signature = tuple[int, int, int]
+
+
+class WatchEvent(NamedTuple):
+    """Outcome of handling a new or rewritten package."""
+
+    path: Path
+    changed: frozenset[str]  # members re-read, empty when package was opened
+    seconds: float
+    ok: bool
+    detail: str  # task result, or error
+
+
+def _signature(path: Path) -> Optional[_Signature]:
+    """Inode, size and mtime of file, None if it doesn't exist."""
+    try:
+        stat: os.stat_result = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def watch(
+    conf: AnkiConf,
+    packages: Iterable[Path],
+    task: Task = count_notes,
+    interval: float = 1.0,
+    settle: float = 2.0,
+) -> Generator[WatchEvent, None, None]:
+    """Runs task on each package when it's opened, and whenever it's rewritten.
+
+    Stop watching by closing the generator (e.g. leaving the loop over it),
+    which closes the handlers.
+
+    Args:
+        conf: anki config, zip_path is replaced by each package's path
+        packages: Anki export files, that needn't exist yet
+        task: called with each package's handler, returning a summary
+        interval: seconds between polls
+        settle: seconds a package must stay unchanged before it's handled
+
+    Yields:
+        An event per handled package, including failures (e.g. a package
+        that's no valid archive), after which it's opened afresh.
+    """
+    paths: list[Path] = list(packages)
+    handlers: dict[Path, Handler] = {}
+    seen: dict[Path, Optional[_Signature]] = {path: None for path in paths}
+    pending: dict[Path, float] = {}  # time of last change, per path
+    try:
+        while True:
+            now: float = monotonic()
+            for path in paths:
+                signature: Optional[_Signature] = _signature(path)
+                if signature != seen[path]:
+                    seen[path] = signature
+                    pending[path] = now
+            for path, since in list(pending.items()):
+                if now - since >= settle and seen[path] is not None:
+                    del pending[path]
+                    yield _handle(conf, path, handlers, task)
+            time.sleep(interval)
+    finally:
+        for handler in handlers.values():
+            handler.close(export=False)
+
+
+def _handle(
+    conf: AnkiConf, path: Path, handlers: dict[Path, Handler], task: Task
+) -> WatchEvent:
+    """Opens or refreshes package's handler, and runs task on it."""
+    start: float = perf_counter()
+    changed: frozenset[str] = frozenset()
+    try:
+        handler: Optional[Handler] = handlers.get(path)
+        if handler is None:
+            handler = Handler(conf.copy(update={"zip_path": path}))
+            handlers[path] = handler
+        else:
+            changed = frozenset(handler.refresh())
+        detail: str = str(task(handler))
+    except Exception as exc:  # noqa: B902 (reported per event)
+        failed: Optional[Handler] = handlers.pop(path, None)
+        if failed is not None:
+            failed.close(export=False)
+        error: str = f"{type(exc).__name__}: {exc}"
+        return WatchEvent(path, changed, perf_counter() - start, False, error)
+    return WatchEvent(path, changed, perf_counter() - start, True, detail)
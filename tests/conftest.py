@@ -1 +1,114 @@
 """Config file for anki-lu tests."""
+import json
+import shutil
+import sqlite3
+from pathlib import Path
+from tempfile import mkdtemp
+from typing import Iterator
+from zipfile import ZIP_DEFLATED, ZipFile
+
+import pytest
+
+from anki_lu import conf_mgr
+from anki_lu.anki.conf import Configuration
+from anki_lu.anki.schema import create_collection
+
+#  memory work area (and reading a deck from bytes) needs Python 3.11+
+needs_deserialize = pytest.mark.skipif(
+    not hasattr(sqlite3.Connection, "deserialize"),
+    reason="sqlite3 deserialize needs Python 3.11+",
+)
+#  work_area values to parametrize tests with
+work_areas: list[object] = ["disk", pytest.param("memory", marks=needs_deserialize)]
+
+model_id: int = 1342697561419
+deck_id: int = 1
+_models: dict[str, object] = {
+    str(model_id): {
+        "id": model_id,
+        "name": "Basic",
+        "type": 0,
+        "sortf": 0,
+        "did": deck_id,
+        "flds": [{"name": "Lëtzebuergesch", "ord": 0}, {"name": "English", "ord": 1}],
+        "tmpls": [{"name": "Card 1", "ord": 0}],
+    }
+}
+#  (Lëtzebuergesch, English) fields of seeded notes
+words: list[tuple[str, str]] = [
+    ("Moien", "Hello"),
+    ("<b>Äddi</b>", "Goodbye"),
+    ("den Hond", "the dog"),
+]
+
+
+def make_collection(path: Path) -> None:
+    """Creates Anki collection with one Basic note (and card) per word."""
+    conn: sqlite3.Connection = sqlite3.connect(path)
+    create_collection(conn)
+    conn.execute(
+        "INSERT INTO col VALUES (1, 1600000000, 0, 0, 11, 0, 0, 0, '{}', ?, ?, "
+        "'{}', '{}')",
+        (json.dumps(_models), json.dumps({str(deck_id): {"name": "Default"}})),
+    )
+    for i, (lb, en) in enumerate(words, start=1):
+        conn.execute(
+            "INSERT INTO notes VALUES (?, ?, ?, 0, 0, '', ?, ?, 0, 0, '')",
+            (i, f"guid{i}", model_id, f"{lb}\x1f{en}", lb),
+        )
+        conn.execute(
+            "INSERT INTO cards VALUES (?, ?, ?, 0, 0, 0, 0, 0, ?, 0, 0, 0, 0, 0, "
+            "0, 0, 0, '')",
+            (i, i, deck_id, i),
+        )
+    conn.commit()
+    conn.close()
+
+
+def note_ids(deck: bytes, tmp: Path) -> list[int]:
+    """Note ids in deck content, written to a file in tmp to be read."""
+    path: Path = tmp / "check.anki21"
+    path.write_bytes(deck)
+    conn: sqlite3.Connection = sqlite3.connect(path)
+    try:
+        return [r[0] for r in conn.execute("SELECT id FROM notes ORDER BY id")]
+    finally:
+        conn.close()
+
+
+@pytest.fixture(autouse=True)
+def config_cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Keeps config cache of every test in its tmp dir, in-process cache empty.
+
+    Args:
+        tmp_path: test's tmp dir
+        monkeypatch: pytest fixture
+
+    Returns:
+        on-disk config cache dir.
+    """
+    cache_dir: Path = tmp_path / "config_cache"
+    monkeypatch.setattr(conf_mgr, "_cache_dir", cache_dir)
+    monkeypatch.setattr(conf_mgr, "_mem_cache", {})
+    monkeypatch.setenv("ANKI_LU_CACHE_DIR", str(cache_dir))  # subprocesses
+    return cache_dir
+
+
+@pytest.fixture()
+def anki_pkg() -> Iterator[Configuration]:
+    """Creates Anki export with a real collection and a media file.
+
+    Yields:
+        conf object, pointing to the export.
+    """
+    w_dir: Path = Path(mkdtemp())
+    deck: Path = w_dir / "collection.anki21"
+    make_collection(deck)
+    zip_pkg: Path = w_dir / "test.apkg"
+    with ZipFile(zip_pkg, mode="w", compression=ZIP_DEFLATED) as z:
+        z.write(deck, arcname=deck.name)
+        z.writestr("media", json.dumps({"0": "moien.mp3"}))
+        z.writestr("0", b"ID3" + bytes(256))
+    deck.unlink()
+    yield Configuration.parse_obj({"zip_path": zip_pkg, "deck_suffix": "anki21"})
+    shutil.rmtree(w_dir)
@@ -0,0 +1,153 @@
+"""Tests the asyncio handler."""
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from anki_lu.anki import aio, mgr
+from anki_lu.anki.conf import Configuration
+
+
+def _delete_first_note(handler: mgr.Handler) -> None:
+    """Blocking edit, run off the event loop."""
+    with handler.db.transaction() as conn:
+        conn.execute("DELETE FROM notes WHERE id = 1")
+
+
+def test_async_round_trip(anki_pkg: Configuration) -> None:
+    """Tests queries and edits off the event loop, exported on leaving block."""
+
+    async def edit() -> list[Any]:
+        async with aio.AsyncHandler(anki_pkg) as handler:
+            rows = await handler.query("SELECT id FROM notes ORDER BY id")
+            await handler.run(_delete_first_note)
+            await handler.write("media", b"{}")
+            assert await handler.read("media") == b"{}"
+        return [r[0] for r in rows]
+
+    assert asyncio.run(edit()) == [1, 2, 3]
+    with mgr.Handler(anki_pkg) as handler:
+        assert [r[0] for r in handler.db.query("SELECT id FROM notes")] == [2, 3]
+        assert handler.read("media") == b"{}"
+
+
+def test_extractions_are_capped(
+    anki_pkg: Configuration, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests no more packages are opened at a time than the limit allows.
+
+    GIVEN six concurrent requests for a package, and a limit of two,
+    WHEN all are served,
+    THEN at most two handlers were being opened at any time.
+    """
+    opening: list[int] = [0, 0]  # now, max
+    lock: threading.Lock = threading.Lock()
+    open_handler = aio._open
+
+    def slow_open(conf: Configuration) -> mgr.Handler:
+        with lock:
+            opening[0] += 1
+            opening[1] = max(opening)
+        time.sleep(0.02)
+        with lock:
+            opening[0] -= 1
+        return open_handler(conf)
+
+    monkeypatch.setattr(aio, "_open", slow_open)
+
+    async def serve() -> list[int]:
+        limit: asyncio.Semaphore = asyncio.Semaphore(2)
+
+        async def count() -> int:
+            async with aio.AsyncHandler(anki_pkg, limit=limit) as handler:
+                return len(await handler.query("SELECT id FROM notes"))
+
+        return await asyncio.gather(*(count() for _ in range(6)))
+
+    assert asyncio.run(serve()) == [3] * 6
+    assert opening[1] == 2
+
+
+def test_cancelled_open_is_cleaned_up(
+    anki_pkg: Configuration, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests a task cancelled while its package opens leaves nothing behind.
+
+    GIVEN a request cancelled while its handler is being opened on a thread,
+    WHEN the thread finishes opening,
+    THEN the handler's work area is removed, and the package untouched.
+    """
+    conf: Configuration = anki_pkg.copy(update={"work_dir": tmp_path})
+    started: threading.Event = threading.Event()
+    open_handler = aio._open
+
+    def slow_open(conf: Configuration) -> mgr.Handler:
+        started.set()
+        time.sleep(0.05)
+        return open_handler(conf)
+
+    monkeypatch.setattr(aio, "_open", slow_open)
+    executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1)
+
+    async def cancel() -> None:
+        async def use() -> None:
+            async with aio.AsyncHandler(conf, executor=executor) as handler:
+                await handler.run(lambda h: h.write("extra.txt", b"Moien"))
+
+        task: asyncio.Task[None] = asyncio.ensure_future(use())
+        while not started.is_set():
+            await asyncio.sleep(0.001)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    timestamp: float = conf.zip_path.stat().st_mtime
+    asyncio.run(cancel())
+    executor.shutdown(wait=True)
+    assert list(tmp_path.iterdir()) == []
+    assert conf.zip_path.stat().st_mtime == timestamp
+
+
+def test_cancelled_exit_is_discarded(anki_pkg: Configuration, tmp_path: Path) -> None:
+    """Tests a task cancelled while waiting to export discards its changes.
+
+    GIVEN a handler with changes, leaving its block while all slots are taken,
+    WHEN it's cancelled waiting for a slot,
+    THEN its handler is closed without export, its work area removed.
+    """
+    conf: Configuration = anki_pkg.copy(update={"work_dir": tmp_path})
+    executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1)
+
+    async def cancel() -> None:
+        limit: asyncio.Semaphore = asyncio.Semaphore(1)
+        handler = await aio.AsyncHandler(conf, executor, limit).__aenter__()
+        await handler.run(_delete_first_note)
+        await limit.acquire()  # slot taken, e.g. by another package's export
+        leaving = asyncio.ensure_future(handler.__aexit__(None, None, None))
+        await asyncio.sleep(0.01)
+        leaving.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leaving
+        limit.release()
+
+    timestamp: float = conf.zip_path.stat().st_mtime
+    asyncio.run(cancel())
+    executor.shutdown(wait=True)
+    assert list(tmp_path.iterdir()) == []
+    assert conf.zip_path.stat().st_mtime == timestamp
+
+
+def test_handler_outside_block(anki_pkg: Configuration) -> None:
+    """Tests the handler isn't available outside async with, nor a failed open's.
+
+    A handler whose opening failed leaves nothing to clean up on cancellation.
+    """
+    with pytest.raises(RuntimeError):
+        aio.AsyncHandler(anki_pkg).handler
+    failed: Future[mgr.Handler] = Future()
+    failed.set_exception(FileNotFoundError(anki_pkg.zip_path))
+    aio._discard(failed, ThreadPoolExecutor(max_workers=1))
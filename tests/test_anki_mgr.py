@@ -1,14 +1,17 @@
 """Tests exercising anki_mgr, a module that manages Anki artifacts, import, export."""
+import json
 import os
 import shutil
+import sqlite3
 from pathlib import Path
 from tempfile import mkdtemp, mkstemp
-from zipfile import ZipFile
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile, ZipInfo
 
 import pytest
 
-from anki_lu.anki import mgr
+from anki_lu.anki import archive, mgr, pack, work
 from anki_lu.anki.conf import Configuration
+from tests.conftest import needs_deserialize, note_ids
 
 _m_deck_sfx: str = ".anki21"
 _m_zip_name: str = "test.apkg"
@@ -46,10 +49,10 @@ def mock_artifacts() -> Configuration:  # type: ignore[misc]
 def test_anki_mgr_clean_up(mock_artifacts: Configuration) -> None:
     """Ensures no temp files remain after clean-up function called."""
     test_handler = mgr.Handler(mock_artifacts)
-    count: int = len(list(mgr._work_deck_loc.glob(f"{mgr._work_deck_prefix}*")))
+    count: int = len(list(work._work_deck_loc.glob(f"{work._work_deck_prefix}*")))
     assert count > 0
     test_handler._clean_up()
-    count = len(list(mgr._work_deck_loc.glob(f"{mgr._work_deck_prefix}*")))
+    count = len(list(work._work_deck_loc.glob(f"{work._work_deck_prefix}*")))
     assert count == 0
 
 
@@ -106,3 +109,346 @@ def test_unchanged_files_not_exported(mock_artifacts: Configuration) -> None:
     handler: mgr.Handler = mgr.Handler(mock_artifacts)
     handler.__del__()
     assert os.stat(mock_artifacts.zip_path).st_mtime == timestamp
+
+
+def test_raw_repack_keeps_unchanged_members(mock_artifacts: Configuration) -> None:
+    """Ensure unchanged members are copied without re-compression.
+
+    GIVEN a changed Anki deck file, and an unchanged (stored) member,
+    WHEN anki handler shuts down,
+    THEN
+        the unchanged member keeps its original compression and crc,
+        the deck member has its new content.
+    """
+    conf: Configuration = mock_artifacts
+    with ZipFile(conf.zip_path, mode="a") as z:
+        z.writestr("media", '{"0": "lb.mp3"}')  # default ZIP_STORED
+    handler: mgr.Handler = mgr.Handler(conf)
+    with open(handler.deck, mode="a") as f:
+        f.write("Something changed.")
+    deck_name: str = handler.deck.name
+    handler.__del__()
+
+    with ZipFile(conf.zip_path) as new:
+        media: ZipInfo = new.getinfo("media")
+        assert media.compress_type == ZIP_STORED
+        assert new.read("media") == b'{"0": "lb.mp3"}'
+        assert new.read(deck_name) == b"Something changed."
+        assert new.testzip() is None
+
+
+def test_lazy_extraction(mock_artifacts: Configuration) -> None:
+    """Ensure only the deck is extracted up front, other members on request.
+
+    GIVEN an Anki package with a deck and a media manifest,
+    WHEN anki handler is created,
+    THEN
+        the deck is the only file in the work dir,
+        other members are extracted when asked for,
+        unknown members raise a KeyError.
+    """
+    conf: Configuration = mock_artifacts
+    with ZipFile(conf.zip_path, mode="a") as z:
+        z.writestr("media", "{}")
+    handler: mgr.Handler = mgr.Handler(conf)
+    assert [p.name for p in handler.deck.parent.iterdir()] == [handler.deck.name]
+    assert handler.extract("media").read_text() == "{}"
+    with pytest.raises(KeyError):
+        handler.extract("doesnt_exist")
+    handler.__del__()
+
+
+def test_touched_deck_not_exported(mock_artifacts: Configuration) -> None:
+    """Ensure a newer mtime alone doesn't count as a change.
+
+    GIVEN a deck file that is touched, but whose content is unchanged,
+    WHEN anki handler shuts down,
+    THEN the source files are untouched.
+    """
+    timestamp: float = os.stat(mock_artifacts.zip_path).st_mtime
+    handler: mgr.Handler = mgr.Handler(mock_artifacts)
+    os.utime(handler.deck, (timestamp + 10, timestamp + 10))
+    handler.__del__()
+    assert os.stat(mock_artifacts.zip_path).st_mtime == timestamp
+
+
+def test_same_size_change_exported(mock_artifacts: Configuration) -> None:
+    """Ensure a content change is found, even if size and mtime are the same.
+
+    GIVEN a deck file overwritten with same-size content and its old mtime,
+    WHEN anki handler shuts down,
+    THEN the updated deck is exported.
+    """
+    conf: Configuration = mock_artifacts
+    with ZipFile(conf.zip_path, mode="w") as z:
+        z.writestr(f"deck{_m_deck_sfx}", "version 1")
+    handler: mgr.Handler = mgr.Handler(conf)
+    stat: os.stat_result = os.stat(handler.deck)
+    handler.deck.write_text("version 2")
+    os.utime(handler.deck, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    handler.__del__()
+    with ZipFile(conf.zip_path) as new:
+        assert new.read(f"deck{_m_deck_sfx}") == b"version 2"
+
+
+@needs_deserialize
+def test_memory_work_area(mock_artifacts: Configuration) -> None:
+    """Ensure deck edits are exported from an in-memory work area.
+
+    GIVEN a handler with a memory work area,
+    WHEN the deck is modified through its connection, and handler shuts down,
+    THEN
+        nothing was written to a work dir,
+        asking for a path of the deck or a member fails,
+        the exported deck holds the change.
+    """
+    conf: Configuration = mock_artifacts
+    conf.work_area = "memory"
+    with ZipFile(conf.zip_path, mode="a") as z:
+        z.writestr("media", "{}")
+    before: int = len(list(work._work_deck_loc.glob(f"{work._work_deck_prefix}*")))
+    handler: mgr.Handler = mgr.Handler(conf)
+    after: int = len(list(work._work_deck_loc.glob(f"{work._work_deck_prefix}*")))
+    assert before == after
+    assert handler.read("media") == b"{}"
+    with pytest.raises(RuntimeError, match="held in memory"):
+        handler.extract("media")
+    with pytest.raises(RuntimeError, match="held in memory"):
+        sqlite3.connect(handler.deck)
+    conn: sqlite3.Connection = handler.connect()
+    conn.execute("create table notes (id integer primary key)")
+    conn.commit()
+    deck_name: str = handler._deck_name
+    handler.__del__()
+
+    with ZipFile(conf.zip_path) as new:
+        deck_data: bytes = new.read(deck_name)
+        assert new.read("media") == b"{}"
+    check: sqlite3.Connection = sqlite3.connect(":memory:")
+    check.deserialize(deck_data)
+    assert check.execute("select name from sqlite_master").fetchone() == ("notes",)
+
+
+def test_explicit_work_dir(mock_artifacts: Configuration) -> None:
+    """Ensure the disk work area is created in a configured directory."""
+    conf: Configuration = mock_artifacts
+    conf.work_dir = conf.zip_path.parent
+    handler: mgr.Handler = mgr.Handler(conf)
+    assert handler.deck.parent.parent == conf.work_dir
+    handler.write("new_member", b"added")
+    handler.__del__()
+    with ZipFile(conf.zip_path) as new:
+        assert new.read("new_member") == b"added"
+
+
+def test_export_compression_policy(anki_pkg: Configuration) -> None:
+    """Ensure compressed media is stored on export, other members deflated.
+
+    GIVEN a full repack of a changed deck, with new media written,
+    WHEN anki handler shuts down,
+    THEN
+        media named in the manifest as audio/images, or starting like them, is
+        stored as is (even if it would deflate),
+        the deck, the manifest and other new members are deflated,
+        all members read back with their content.
+    """
+    conf: Configuration = anki_pkg.copy(
+        update={"repack": "full", "compress_level": 1, "compress_workers": 2}
+    )
+    handler: mgr.Handler = mgr.Handler(conf)
+    with handler.db.transaction() as conn:
+        conn.execute("DELETE FROM notes WHERE id = 3")
+    manifest: dict[str, str] = {str(i): f"wuert{i}.mp3" for i in range(50)}
+    manifest["1"] = "hond.jpg"
+    handler.write("media", json.dumps(manifest).encode())
+    handler.write("1", bytes(4096))
+    handler.write("2", b"\x89PNG" + bytes(4096))
+    handler.write("notes.txt", b"Moien " * 1000)
+    deck_name: str = handler.deck.name
+    handler.__del__()
+
+    with ZipFile(conf.zip_path) as new:
+        types = {i.filename: i.compress_type for i in new.infolist()}
+        assert types == {
+            deck_name: ZIP_DEFLATED,
+            "media": ZIP_DEFLATED,
+            "0": ZIP_STORED,
+            "1": ZIP_STORED,
+            "2": ZIP_STORED,
+            "notes.txt": ZIP_DEFLATED,
+        }
+        assert new.testzip() is None
+        assert new.read("1") == bytes(4096)
+        assert new.read("notes.txt") == b"Moien " * 1000
+
+
+@pytest.mark.parametrize(
+    "data, expected",
+    [
+        (b"RIFF\0\0\0\0WEBPVP8 ", True),
+        (b"RIFF\0\0\0\0WAVEfmt ", False),
+        (b"\0\0\0\x20ftypM4A ", True),
+        (b"\xff\xd8\xff\xe0", True),
+        (b"Moien", False),
+    ],
+)
+def test_already_compressed(data: bytes, expected: bool) -> None:
+    """Tests compressed formats are told apart by their leading bytes."""
+    assert pack.already_compressed(data) is expected
+
+
+def test_packer_failure(tmp_path: Path) -> None:
+    """Ensure members pending when adding fails aren't written.
+
+    GIVEN a packer with members pending compression,
+    WHEN adding members fails,
+    THEN the pending members are dropped, none is written.
+    """
+    with ZipFile(tmp_path / "out.zip", "w") as dst:
+        with pytest.raises(RuntimeError):
+            with pack.Packer(dst, level=1, workers=1, window=4) as packer:
+                for i in range(3):
+                    packer.add(ZipInfo(str(i)), b"Moien " * 1000, store=False)
+                packer.add_raw(ZipInfo("3"), b"Moien")
+                raise RuntimeError("export failed")
+        assert dst.namelist() == []
+
+
+def test_copy_raw(anki_pkg: Configuration, tmp_path: Path) -> None:
+    """Ensure members copied raw read back, and bad local headers are caught.
+
+    GIVEN a package, and a copy of it with a member's local header damaged,
+    WHEN its members are copied raw into a new archive, and from the copy,
+    THEN
+        the new archive's members read back as in the package,
+        copying the damaged member raises ValueError.
+    """
+    dst_path: Path = tmp_path / "copy.apkg"
+    with ZipFile(anki_pkg.zip_path) as src, ZipFile(dst_path, "w") as dst:
+        for info in src.infolist():
+            archive.copy_raw(src, dst, info)
+        expected = {i.filename: src.read(i) for i in src.infolist()}
+    with ZipFile(dst_path) as new:
+        assert new.testzip() is None
+        assert {n: new.read(n) for n in new.namelist()} == expected
+
+    damaged: bytearray = bytearray(dst_path.read_bytes())
+    damaged[:4] = b"PK\0\0"
+    dst_path.write_bytes(bytes(damaged))
+    with ZipFile(dst_path) as src, ZipFile(tmp_path / "out.zip", "w") as dst:
+        with pytest.raises(ValueError, match="Bad local header"):
+            archive.copy_raw(src, dst, src.infolist()[0])
+
+
+def _delete_note(handler: mgr.Handler, nid: int) -> None:
+    """Changes deck, so that handler exports on close."""
+    with handler.db.transaction() as conn:
+        conn.execute("DELETE FROM notes WHERE id = ?", (nid,))
+
+
+def _note_ids(pkg: Path, tmp: Path) -> list[int]:
+    """Note ids in deck of Anki export file, extracted to tmp."""
+    with ZipFile(pkg) as z:
+        return note_ids(z.read("collection.anki21"), tmp)
+
+
+def test_context_manager_export(anki_pkg: Configuration, tmp_path: Path) -> None:
+    """Ensure leaving a with block exports, replacing the original atomically.
+
+    GIVEN a handler used as context manager, with a changed deck,
+    WHEN the with block is left,
+    THEN
+        the package has the change,
+        the backup is a hard link to the original file (no copy made),
+        no temp files are left next to the package.
+    """
+    pkg: Path = anki_pkg.zip_path
+    inode: int = pkg.stat().st_ino
+    with mgr.Handler(anki_pkg) as handler:
+        _delete_note(handler, 1)
+    assert _note_ids(pkg, tmp_path) == [2, 3]
+    backup: Path = pkg.with_stem(pkg.stem + mgr._orig_pkg_flag)
+    assert backup.stat().st_ino == inode
+    assert _note_ids(backup, tmp_path) == [1, 2, 3]
+    assert sorted(p.name for p in pkg.parent.iterdir()) == [backup.name, pkg.name]
+
+
+def test_backup_without_hard_links(
+    anki_pkg: Configuration, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Ensure the backup is a copy where the file system has no hard links."""
+
+    def no_link(src: object, dst: object) -> None:
+        """Stands in for os.link, on a file system without hard links."""
+        raise OSError("hard links not supported")
+
+    monkeypatch.setattr(os, "link", no_link)
+    pkg: Path = anki_pkg.zip_path
+    inode: int = pkg.stat().st_ino
+    with mgr.Handler(anki_pkg) as handler:
+        _delete_note(handler, 1)
+    backup: Path = pkg.with_stem(pkg.stem + mgr._orig_pkg_flag)
+    assert backup.stat().st_ino != inode
+    assert _note_ids(backup, tmp_path) == [1, 2, 3]
+    assert sorted(p.name for p in pkg.parent.iterdir()) == [backup.name, pkg.name]
+
+
+def test_context_manager_discards_on_error(anki_pkg: Configuration) -> None:
+    """Ensure changes are discarded when the with block raises."""
+    timestamp: float = anki_pkg.zip_path.stat().st_mtime
+    with pytest.raises(ZeroDivisionError):
+        with mgr.Handler(anki_pkg) as handler:
+            _delete_note(handler, 1)
+            raise ZeroDivisionError
+    assert anki_pkg.zip_path.stat().st_mtime == timestamp
+    assert len(list(anki_pkg.zip_path.parent.iterdir())) == 1
+
+
+def test_failed_export_keeps_original(
+    anki_pkg: Configuration, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Ensure an export failing part way leaves no partial archive behind.
+
+    GIVEN a changed deck,
+    WHEN export fails after writing part of the new archive,
+    THEN the original package is untouched, with no backup or temp file.
+    """
+    export = mgr.Handler._export
+
+    def failing(self: mgr.Handler, dst: Path, changed: set[str]) -> None:
+        export(self, dst, changed)
+        with open(dst, "r+b") as f:
+            f.truncate(100)
+        raise OSError("disk full")
+
+    monkeypatch.setattr(mgr.Handler, "_export", failing)
+    content: bytes = anki_pkg.zip_path.read_bytes()
+    handler: mgr.Handler = mgr.Handler(anki_pkg)
+    _delete_note(handler, 1)
+    with pytest.raises(OSError):
+        handler.close()
+    assert anki_pkg.zip_path.read_bytes() == content
+    assert list(anki_pkg.zip_path.parent.iterdir()) == [anki_pkg.zip_path]
+
+
+@pytest.mark.parametrize("backup", ["none", "rotate"])
+def test_backup_modes(anki_pkg: Configuration, backup: str, tmp_path: Path) -> None:
+    """Ensure backups are skipped, or rotated up to backup_count.
+
+    GIVEN three exports in a row, each deleting a note,
+    WHEN backup is none, or rotate with backup_count 2,
+    THEN no backups are kept, or the two previous versions.
+    """
+    conf: Configuration = anki_pkg.copy(update={"backup": backup, "backup_count": 2})
+    pkg: Path = conf.zip_path
+    for nid in (1, 2, 3):
+        with mgr.Handler(conf) as handler:
+            _delete_note(handler, nid)
+    assert _note_ids(pkg, tmp_path) == []
+    backups: list[Path] = sorted(p for p in pkg.parent.iterdir() if p != pkg)
+    if backup == "none":
+        assert backups == []
+    else:
+        assert [p.name for p in backups] == ["test(old 2).apkg", "test(old).apkg"]
+        assert _note_ids(backups[1], tmp_path) == [3]
+        assert _note_ids(backups[0], tmp_path) == [2, 3]
@@ -0,0 +1,67 @@
+"""Tests batch processing of many packages."""
+import shutil
+from pathlib import Path
+
+from click.testing import CliRunner
+
+from anki_lu import __main__, batch
+from anki_lu.anki.conf import Configuration
+
+
+def _packages(conf: Configuration, count: int) -> list[Path]:
+    """Copies of the fixture package, plus one broken archive."""
+    copies: list[Path] = []
+    for i in range(count):
+        copies.append(conf.zip_path.with_name(f"class{i}.apkg"))
+        shutil.copy(conf.zip_path, copies[-1])
+    broken: Path = conf.zip_path.with_name("class_broken.apkg")
+    broken.write_bytes(b"not a zip")
+    return [*copies, broken]
+
+
+def test_run_batch(anki_pkg: Configuration) -> None:
+    """Tests results come back per package, failures included.
+
+    GIVEN two good packages and a broken one,
+    WHEN they're processed in a pool of two workers,
+    THEN the good ones succeed, and the broken one is reported as failed.
+    """
+    packages: list[Path] = _packages(anki_pkg, 2)
+    results = batch.run_batch(anki_pkg, packages, workers=2)
+    assert [r.path for r in results] == packages
+    assert [r.ok for r in results] == [True, True, False]
+    assert results[0].detail == "3 notes"
+    assert "BadZipFile" in results[2].detail
+
+
+def test_run_batch_in_process(anki_pkg: Configuration) -> None:
+    """Tests one worker processes packages in this process, with like results."""
+    packages: list[Path] = _packages(anki_pkg, 1)
+    results = batch.run_batch(anki_pkg, packages, workers=1)
+    assert [r.path for r in results] == packages
+    assert [r.ok for r in results] == [True, False]
+    assert results[0].detail == "3 notes"
+    assert results[1].detail.startswith("BadZipFile")
+
+
+def test_expand(anki_pkg: Configuration) -> None:
+    """Tests glob patterns expand, and duplicates are dropped."""
+    packages: list[Path] = _packages(anki_pkg, 2)
+    pattern: str = str(anki_pkg.zip_path.with_name("class*.apkg"))
+    assert batch.expand([pattern, str(packages[0])]) == sorted(packages)
+
+
+def test_batch_command(anki_pkg: Configuration) -> None:
+    """Tests batch subcommand prints a summary, and fails if a package does."""
+    _packages(anki_pkg, 1)
+    pattern: str = str(anki_pkg.zip_path.with_name("class*.apkg"))
+    result = CliRunner().invoke(__main__.main, ["batch", "-w", "2", pattern])
+    assert result.exit_code == 1
+    assert result.output.splitlines()[-1] == "1 ok, 1 failed"
+
+
+def test_batch_command_ok(anki_pkg: Configuration) -> None:
+    """Tests batch subcommand succeeds when every package does."""
+    result = CliRunner().invoke(__main__.main, ["batch", str(anki_pkg.zip_path)])
+    assert result.exit_code == 0
+    assert result.output.splitlines()[-1] == "1 ok, 0 failed"
@@ -0,0 +1,136 @@
+"""Tests the persistent extraction cache."""
+import os
+import sqlite3
+from pathlib import Path
+from typing import Optional
+from zipfile import ZipFile
+
+import pytest
+
+from anki_lu.anki import mgr, work
+from anki_lu.anki.cache import CachedMember, ExtractCache
+from anki_lu.anki.conf import Configuration
+from tests.conftest import work_areas
+
+
+def _no_archive_load(*args: object, **kwargs: object) -> None:
+    """Stands in for WorkArea.load, where loading must come from cache."""
+    raise AssertionError("deck loaded from archive")
+
+
+@pytest.mark.parametrize("work_area", work_areas)
+def test_repeat_open_hits_cache(
+    anki_pkg: Configuration,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    work_area: str,
+) -> None:
+    """Tests unchanged package is served from cache, changed one isn't.
+
+    GIVEN a package opened once with the extraction cache enabled,
+    WHEN it's opened again, changed, and opened once more,
+    THEN
+        the second open clones the deck from cache (nothing from archive),
+        changes to the clone don't reach the cached deck,
+        the changed package misses the cache, and is stored as a new entry.
+    """
+    conf: Configuration = anki_pkg.copy(
+        update={"extract_cache": tmp_path, "work_area": work_area}
+    )
+    mgr.Handler(conf).__del__()
+    assert len(list(tmp_path.iterdir())) == 1
+
+    with monkeypatch.context() as m:
+        m.setattr(work.DiskArea, "load", _no_archive_load)
+        m.setattr(work.MemoryArea, "load", _no_archive_load)
+        handler: mgr.Handler = mgr.Handler(conf)
+        with handler.db.transaction() as conn:
+            conn.execute("DELETE FROM notes WHERE id = 1")
+        handler.__del__()
+    cached: Path = next(p for p in tmp_path.glob("*/collection.anki21"))
+    check: sqlite3.Connection = sqlite3.connect(cached)
+    assert check.execute("SELECT count() FROM notes").fetchone()[0] == 3
+    check.close()
+
+    handler = mgr.Handler(conf)
+    assert len(handler.db.notes(handler.db.note(2)["mid"])) == 2  # type: ignore
+    handler.__del__()
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_cache_hit_unchanged(anki_pkg: Configuration, tmp_path: Path) -> None:
+    """Tests a deck cloned from cache isn't taken for a changed one."""
+    conf: Configuration = anki_pkg.copy(update={"extract_cache": tmp_path})
+    mgr.Handler(conf).__del__()
+    timestamp: float = conf.zip_path.stat().st_mtime
+    handler: mgr.Handler = mgr.Handler(conf)
+    handler.db.note(1)
+    handler.__del__()
+    assert conf.zip_path.stat().st_mtime == timestamp
+
+
+def test_rewritten_package_misses(anki_pkg: Configuration, tmp_path: Path) -> None:
+    """Tests a package rewritten with the same members (and CRCs) is a miss."""
+    conf: Configuration = anki_pkg.copy(update={"extract_cache": tmp_path})
+    mgr.Handler(conf).__del__()
+    conf.zip_path.write_bytes(conf.zip_path.read_bytes())  # new file version
+    mgr.Handler(conf).__del__()
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_lru_eviction(tmp_path: Path) -> None:
+    """Tests entries beyond the size cap are evicted, least recently used first.
+
+    GIVEN a cache with room for two entries, holding entries a, b and new c,
+        and an entry being stored, and a stray file,
+    WHEN a is used (b becoming least recently used), and cache is evicted,
+        then evicted down to nothing,
+    THEN
+        b is removed, a and c are kept,
+        then a is removed too, c (kept) and the others are left alone.
+    """
+    for age, key in enumerate(("c", "b", "a")):
+        (tmp_path / key).mkdir()
+        (tmp_path / key / "deck").write_bytes(bytes(100))
+        (tmp_path / key / "baseline.json").write_text('{"deck": [100, 0]}')
+        os.utime(tmp_path / key, (1000 - age, 1000 - age))
+    cache: ExtractCache = ExtractCache(tmp_path, max_bytes=250)
+    hit: Optional[CachedMember] = cache.get("a", "deck")
+    assert hit is not None and hit.baseline == (100, 0)
+    assert cache.get("a", "missing") is None
+
+    (tmp_path / "d.1.tmp").mkdir()
+    (tmp_path / "stray").write_bytes(bytes(100))
+
+    cache.evict(keep="c")
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a", "c", "d.1.tmp", "stray"]
+    ExtractCache(tmp_path, max_bytes=0).evict(keep="c")
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["c", "d.1.tmp", "stray"]
+
+
+def test_put_failure(anki_pkg: Configuration, tmp_path: Path) -> None:
+    """Tests a member that can't be stored leaves the cache as it was.
+
+    GIVEN a cache holding a package's deck,
+    WHEN it's stored again under the same key (as a racing process would),
+    THEN storing fails quietly, the entry is kept and no temporary one is left.
+    """
+    conf: Configuration = anki_pkg.copy(update={"extract_cache": tmp_path})
+    mgr.Handler(conf).__del__()
+    entry: Path = next(tmp_path.iterdir())
+    cache: ExtractCache = ExtractCache(tmp_path, max_bytes=1 << 30)
+    with ZipFile(conf.zip_path) as z, mgr.Handler(anki_pkg) as handler:
+        handler.db.note(1)
+        cache.put(entry.name, z.getinfo("collection.anki21"), handler._area)
+    assert list(tmp_path.iterdir()) == [entry]
+    assert cache.get(entry.name, "collection.anki21") is not None
+
+
+def test_evicted_meanwhile(anki_pkg: Configuration, tmp_path: Path) -> None:
+    """Tests a deck removed from cache after lookup is read from archive."""
+    conf: Configuration = anki_pkg.copy(update={"extract_cache": tmp_path})
+    mgr.Handler(conf).__del__()
+    next(tmp_path.glob("*/collection.anki21")).unlink()
+    handler: mgr.Handler = mgr.Handler(conf)
+    assert handler.db.query("SELECT count() FROM notes")[0][0] == 3
+    handler.__del__()
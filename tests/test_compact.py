@@ -0,0 +1,135 @@
+"""Tests compacting decks before export."""
+import sqlite3
+from pathlib import Path
+
+import pydantic
+import pytest
+from click.testing import CliRunner
+
+from anki_lu.anki import compact, mgr
+from anki_lu.anki.conf import Configuration
+from tests.conftest import work_areas
+
+
+@pytest.fixture()
+def bloated(anki_pkg: Configuration) -> Configuration:
+    """Seeded package, whose deck holds the free pages of deleted notes.
+
+    Args:
+        anki_pkg: conf of seeded package
+
+    Returns:
+        conf of package.
+    """
+    with mgr.Handler(anki_pkg) as handler:
+        with handler.db.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO notes VALUES (?, ?, 1, 0, 0, '', ?, '', 0, 0, '')",
+                [(i, f"g{i}", f"{i:x}" * 300) for i in range(100, 1100)],
+            )
+        with handler.db.transaction() as conn:
+            conn.execute("DELETE FROM notes WHERE id >= 100")
+    return anki_pkg
+
+
+def _deck_pragma(conf: Configuration, pragma: str) -> int:
+    """Value of a pragma of package's deck."""
+    with mgr.Handler(conf) as handler:
+        return int(handler.db.query(f"PRAGMA {pragma}")[0][0])
+
+
+@pytest.mark.parametrize("work_area", work_areas)
+def test_compact_on_export(bloated: Configuration, work_area: str) -> None:
+    """Tests an edited deck is compacted on export, past the threshold only.
+
+    GIVEN a package with free pages in its deck, and a compaction threshold,
+    WHEN the deck is opened without edits, then edited,
+    THEN
+        an unedited deck isn't compacted (nor exported),
+        the edited deck is compacted, shrinking the package, notes intact,
+        a threshold above the reclaimable share leaves the deck as it is.
+    """
+    conf: Configuration = bloated.copy(
+        update={"compact_threshold": 0.5, "work_area": work_area}
+    )
+    size: int = conf.zip_path.stat().st_size
+    with mgr.Handler(conf) as handler:
+        pass
+    assert handler.compaction is None
+    with mgr.Handler(conf) as handler:
+        with handler.db.transaction() as conn:
+            conn.execute("UPDATE notes SET flds = 'Moien\x1fHi' WHERE id = 1")
+    assert handler.compaction is not None and handler.compaction.applied
+    assert handler.compaction.free_ratio >= 0.5
+    assert 0 < handler.compaction.bytes_after < handler.compaction.bytes_before
+    assert conf.zip_path.stat().st_size < size
+    assert _deck_pragma(conf, "freelist_count") == 0
+
+    with mgr.Handler(conf) as handler:
+        assert len(handler.db.query("SELECT * FROM sqlite_stat1"))  # analyzed
+        assert handler.db.query("SELECT count() FROM notes")[0][0] == 3
+        result = handler.compact(threshold=1.0)
+    assert not result.applied and result.saved == 0
+
+
+def test_compact_cli(bloated: Configuration, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests compact command reports bytes saved, and sets page size."""
+    from anki_lu import __main__, conf_mgr
+
+    app_conf = conf_mgr.get_config_obj().copy(update={"anki": bloated})
+    monkeypatch.setattr(conf_mgr, "get_config_obj", lambda: app_conf)
+    result = CliRunner().invoke(__main__.main, ["compact", "--page-size", "1024"])
+    assert result.exit_code == 0
+    assert "bytes saved" in result.output
+    assert _deck_pragma(bloated, "page_size") == 1024
+    result = CliRunner().invoke(__main__.main, ["compact", "--threshold", "1"])
+    assert result.exit_code == 0
+    assert result.output.startswith("not compacted: ")
+
+
+def test_page_size_validated(bloated: Configuration) -> None:
+    """Tests page sizes that SQLite doesn't support are rejected."""
+    with pytest.raises(pydantic.ValidationError):
+        Configuration(**{**bloated.dict(), "compact_page_size": 1000})
+
+
+def test_free_ratio_estimates(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests an empty deck has nothing to reclaim, and dbstat is optional.
+
+    GIVEN an empty deck, and one with the free pages of deleted rows,
+    WHEN their reclaimable share is estimated, with and without dbstat,
+    THEN the empty deck's is 0, the other's at least its free pages' share.
+    """
+    conn: sqlite3.Connection = sqlite3.connect(":memory:")
+    assert compact.free_ratio(conn) == 0.0
+    conn.execute("CREATE TABLE t (x)")
+    conn.executemany("INSERT INTO t VALUES (?)", [("x" * 1000,)] * 100)
+    conn.execute("DELETE FROM t")
+    pages: float = compact._pragma(conn, "freelist_count") / compact._pragma(
+        conn, "page_count"
+    )
+    monkeypatch.setattr(compact, "_unused_sql", "SELECT sum(unused) FROM nodbstat")
+    assert compact.free_ratio(conn) == pytest.approx(pages)
+    conn.close()
+
+
+def test_compact_without_analyze(bloated: Configuration) -> None:
+    """Tests query planner statistics are left alone, if not to be refreshed."""
+    conf: Configuration = bloated.copy(update={"compact_analyze": False})
+    with mgr.Handler(conf) as handler:
+        assert handler.compact().applied
+        assert not handler.db.query(
+            "SELECT * FROM sqlite_master WHERE name = 'sqlite_stat1'"
+        )
+
+
+def test_vacuum_failure(tmp_path: Path) -> None:
+    """Tests a failed VACUUM INTO leaves no compacted file behind."""
+    deck: Path = tmp_path / "collection.anki21"
+    conn: sqlite3.Connection = sqlite3.connect(deck)
+    conn.execute("CREATE TABLE t (x)")
+    conn.execute("INSERT INTO t VALUES (1)")  # VACUUM can't run in a transaction
+    with pytest.raises(sqlite3.OperationalError):
+        compact._vacuum_into(conn, deck)
+    conn.close()
+    assert [p.name for p in tmp_path.iterdir()] == [deck.name]
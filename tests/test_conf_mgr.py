@@ -1,5 +1,6 @@
 """Tests conf_mgr."""
 
+import json
 import shutil
 from pathlib import Path
 from tempfile import mkdtemp
@@ -99,3 +100,97 @@ def test_get_config_with_bad_class(conf_dir_struct: dict[str, Any]) -> None:
             module=conf_dir_struct["module_name"],
             model="doesnt_exist",
         )
+
+
+def test_get_config_cached(
+    conf_dir_struct: dict[str, Any], monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    """Tests repeated calls are served from cache, until a source file changes.
+
+    GIVEN a config that was loaded once
+    WHEN it is loaded again, after the data file is rewritten, and after a
+        module of nested models changes
+    THEN the second load skips validation, the others validate again
+    """
+    monkeypatch.setattr(conf_mgr, "_cache_dir", tmp_path / "cache")
+    nested_models: Path = tmp_path / "nested.py"
+    nested_models.write_text("")
+    monkeypatch.setattr(conf_mgr, "_model_sources", (nested_models,))
+    kwargs: dict[str, Any] = {
+        "data": conf_dir_struct["data_path"],
+        "pkg_dir": Path(conf_dir_struct["pkg_path"]),
+        "module": conf_dir_struct["module_name"],
+        "model": conf_dir_struct["model_name"],
+    }
+    first = conf_mgr.get_config_obj(**kwargs)
+    calls: list[str] = []
+    validated = conf_mgr._validated
+
+    def counted(*args: Any) -> Any:
+        calls.append("x")
+        return validated(*args)
+
+    monkeypatch.setattr(conf_mgr, "_validated", counted)
+    second = conf_mgr.get_config_obj(**kwargs)
+    assert second == first and second is not first
+    assert calls == []
+
+    data_file: Path = kwargs["pkg_dir"] / kwargs["data"]
+    data_file.write_text('{"string_key": "new", "path_key": "/tmp"}')
+    third = conf_mgr.get_config_obj(**kwargs)
+    assert calls == ["x"]
+    assert third.dict()["string_key"] == "new"
+
+    nested_models.write_text("# new default")
+    conf_mgr.get_config_obj(**kwargs)
+    assert calls == ["x", "x"]
+
+
+def test_get_config_disk_cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests package config is served from the on-disk cache on a cold start.
+
+    GIVEN the package config, loaded once with an empty in-process cache
+    WHEN in-process cache is cleared (as in a new process), and it's loaded again
+    THEN it comes from the JSON cache entry, without reading the data file
+    """
+    monkeypatch.setattr(conf_mgr, "_cache_dir", tmp_path)
+    monkeypatch.setattr(conf_mgr, "_mem_cache", {})
+    first = conf_mgr.get_config_obj()
+    assert len(list(tmp_path.glob("*.json"))) == 1
+
+    monkeypatch.setattr(conf_mgr, "_mem_cache", {})
+    monkeypatch.setattr(conf_mgr, "_validated", None)
+    assert conf_mgr.get_config_obj() == first
+
+
+def test_get_config_disk_cache_stale(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests cache entries the model rejects are misses.
+
+    GIVEN an on-disk cache entry of the package config that lacks a field
+    WHEN the config is loaded on a cold start
+    THEN it is validated again, rather than served incomplete
+    """
+    monkeypatch.setattr(conf_mgr, "_cache_dir", tmp_path)
+    monkeypatch.setattr(conf_mgr, "_mem_cache", {})
+    first = conf_mgr.get_config_obj()
+    entry: Path = next(tmp_path.glob("*.json"))
+    stale: dict[str, Any] = json.loads(entry.read_text())
+    del stale["anki"]["deck_suffix"]
+    entry.write_text(json.dumps(stale))
+
+    monkeypatch.setattr(conf_mgr, "_mem_cache", {})
+    assert conf_mgr.get_config_obj() == first
+
+
+def test_get_config_disk_cache_unwritable(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests the config is loaded, uncached, when the cache can't be written."""
+    taken: Path = tmp_path / "cache"
+    taken.write_bytes(b"")
+    monkeypatch.setattr(conf_mgr, "_cache_dir", taken)
+    monkeypatch.setattr(conf_mgr, "_mem_cache", {})
+    assert conf_mgr.get_config_obj().dict()["anki"]
+    assert taken.read_bytes() == b""
@@ -0,0 +1,121 @@
+"""Tests pooled deck database access."""
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from zipfile import ZipFile
+
+import pytest
+
+from anki_lu.anki import mgr
+from anki_lu.anki.conf import Configuration
+from tests.conftest import note_ids, words, work_areas
+
+
+def test_common_lookups(anki_pkg: Configuration) -> None:
+    """Tests notes/cards lookups on seeded collection.
+
+    GIVEN a deck with one note and card per word,
+    WHEN notes and cards are looked up through the handler db,
+    THEN rows are returned, and unknown ids give None.
+    """
+    handler: mgr.Handler = mgr.Handler(anki_pkg)
+    note = handler.db.note(1)
+    assert note is not None
+    assert note["flds"].split("\x1f") == list(words[0])
+    assert handler.db.note(999) is None
+    assert handler.db.note_by_guid("guid2")["id"] == 2  # type: ignore[index]
+    assert len(handler.db.notes(note["mid"])) == len(words)
+    assert [c["nid"] for c in handler.db.cards(1)] == [1]
+    assert handler.db.revlog(1) == []
+    handler.__del__()
+
+
+def test_pragmas_applied(anki_pkg: Configuration) -> None:
+    """Tests pool connections get the configured pragmas."""
+    anki_pkg.db.cache_size = -1234
+    handler: mgr.Handler = mgr.Handler(anki_pkg)
+    with handler.db.connection() as conn:
+        assert conn.execute("PRAGMA cache_size").fetchone()[0] == -1234
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "memory"
+    handler.__del__()
+
+
+def test_pool_is_bounded(anki_pkg: Configuration) -> None:
+    """Tests concurrent use never opens more connections than the pool size."""
+    anki_pkg.db.pool_size = 2
+    handler: mgr.Handler = mgr.Handler(anki_pkg)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        counts = list(pool.map(lambda i: len(handler.db.notes(i)), range(50)))
+    assert counts == [0] * 50
+    assert len(handler.db._opened) <= 2
+    handler.__del__()
+
+
+@pytest.mark.parametrize("work_area", work_areas)
+def test_transaction(
+    anki_pkg: Configuration, work_area: str, tmp_path: Path
+) -> None:
+    """Tests committed transactions are exported, failed ones rolled back.
+
+    GIVEN a handler (disk or memory work area),
+    WHEN one transaction deletes a note, and another fails after a delete,
+    THEN the exported deck misses only the first note.
+    """
+    anki_pkg.work_area = work_area  # type: ignore[assignment]
+    handler: mgr.Handler = mgr.Handler(anki_pkg)
+    deck_name: str = handler._deck_name
+    with handler.db.transaction() as conn:
+        conn.execute("DELETE FROM notes WHERE id = 1")
+    with pytest.raises(ZeroDivisionError):
+        with handler.db.transaction() as conn:
+            conn.execute("DELETE FROM notes WHERE id = 2")
+            raise ZeroDivisionError
+    handler.__del__()
+
+    with ZipFile(anki_pkg.zip_path) as new:
+        assert note_ids(new.read(deck_name), tmp_path) == [2, 3]
+
+
+@pytest.mark.parametrize("work_area", work_areas)
+def test_nested_checkout(anki_pkg: Configuration, work_area: str) -> None:
+    """Tests lookups inside a transaction reuse its connection.
+
+    GIVEN a handler (disk or memory work area) with a pool of one connection,
+    WHEN notes are looked up inside a transaction that deleted one,
+    THEN the lookups don't wait for the transaction's connection, and see
+    its uncommitted delete.
+    """
+    anki_pkg.work_area = work_area  # type: ignore[assignment]
+    anki_pkg.db.pool_size = 1
+    with mgr.Handler(anki_pkg) as handler:
+        with handler.db.transaction() as conn:
+            conn.execute("DELETE FROM notes WHERE id = 1")
+            assert handler.db.note(1) is None
+            assert handler.db.note(2) is not None
+            with handler.db.connection() as nested:
+                assert nested is conn
+        assert handler.db.note(1) is None
+
+
+@pytest.mark.parametrize("work_area", work_areas)
+def test_nested_transaction(anki_pkg: Configuration, work_area: str) -> None:
+    """Tests a transaction within a transaction runs in a savepoint.
+
+    GIVEN a handler (disk or memory work area),
+    WHEN a transaction deletes a note, and nested transactions delete one
+        more (committed) and another (failing),
+    THEN only the failed nested transaction's delete is rolled back.
+    """
+    anki_pkg.work_area = work_area  # type: ignore[assignment]
+    with mgr.Handler(anki_pkg) as handler:
+        with handler.db.transaction() as conn:
+            conn.execute("DELETE FROM notes WHERE id = 1")
+            with handler.db.transaction() as nested:
+                assert nested is conn
+                nested.execute("DELETE FROM notes WHERE id = 2")
+            with pytest.raises(ZeroDivisionError):
+                with handler.db.transaction() as nested:
+                    nested.execute("DELETE FROM notes WHERE id = 3")
+                    raise ZeroDivisionError
+            still_open: bool = conn.in_transaction
+        assert still_open and not conn.in_transaction
+        assert [n for n in (1, 2, 3) if handler.db.note(n)] == [3]
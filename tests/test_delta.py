@@ -0,0 +1,157 @@
+"""Tests note-level deltas between package versions."""
+import json
+import shutil
+import sqlite3
+from pathlib import Path
+from zipfile import ZipFile
+
+import pytest
+from click.testing import CliRunner
+
+from anki_lu import __main__, conf_mgr
+from anki_lu.anki import delta, mgr
+from anki_lu.anki.conf import Configuration
+
+
+def _rows(conf: Configuration, table: str) -> list[tuple[object, ...]]:
+    """All rows of deck table, by id."""
+    with mgr.Handler(conf) as handler:
+        rows = handler.db.query(f"SELECT * FROM {table} ORDER BY id")  # noqa: S608
+        return [tuple(row) for row in rows]
+
+
+@pytest.fixture()
+def versions(anki_pkg: Configuration) -> tuple[Configuration, Configuration]:
+    """Original package, and a modified copy of it.
+
+    The copy has note 1 corrected, note 2 (and its card) deleted, a note with
+    card added, and a media file added.
+
+    Args:
+        anki_pkg: conf of original package
+
+    Returns:
+        confs of original and modified package.
+    """
+    modified: Configuration = anki_pkg.copy(
+        update={"zip_path": anki_pkg.zip_path.with_name("modified.apkg")}
+    )
+    shutil.copy(anki_pkg.zip_path, modified.zip_path)
+    with mgr.Handler(modified) as handler:
+        with handler.db.transaction() as conn:
+            conn.execute("UPDATE notes SET flds = 'Moien!', mod = 5 WHERE id = 1")
+            conn.execute("DELETE FROM notes WHERE id = 2")
+            conn.execute("DELETE FROM cards WHERE nid = 2")
+            conn.execute(
+                "INSERT INTO notes SELECT 4, 'g4', mid, 5, -1, '', "
+                "'Kaz\x1fcat', 'Kaz', 0, 0, '' FROM notes WHERE id = 1"
+            )
+            conn.execute(
+                "INSERT INTO cards SELECT 4, 4, did, 0, 5, -1, 0, 0, 4, "
+                "0, 0, 0, 0, 0, 0, 0, 0, '' FROM cards WHERE id = 1"
+            )
+        handler.write("media", json.dumps({"0": "moien.mp3", "1": "kaz.jpg"}).encode())
+        handler.write("1", b"\xff\xd8\xff" + bytes(64))
+    return anki_pkg, modified
+
+
+def test_diff_and_apply(
+    versions: tuple[Configuration, Configuration], tmp_path: Path
+) -> None:
+    """Tests a delta brings a copy of the original to the modified state.
+
+    GIVEN an original package and a modified copy,
+    WHEN their delta is applied to another copy of the original (twice),
+    THEN
+        the delta holds only the changed rows and media,
+        the copy's notes and cards match the modified package's,
+        its media member and manifest are updated, others kept.
+    """
+    original, modified = versions
+    target: Configuration = original.copy(update={"zip_path": tmp_path / "t.apkg"})
+    shutil.copy(original.zip_path, target.zip_path)
+    delta_file: Path = tmp_path / "fix.delta"
+
+    summary = delta.diff(original, modified, delta_file)
+    assert summary == delta.DeltaSummary(notes=2, cards=1, deleted=2, members=2)
+    with ZipFile(delta_file) as z:
+        assert sorted(z.namelist()) == ["1", "delta.sqlite", "media"]
+
+    for _ in range(2):
+        assert delta.apply(target, delta_file) == summary
+    for table in ("notes", "cards"):
+        assert _rows(target, table) == _rows(modified, table)
+    with ZipFile(target.zip_path) as z:
+        assert json.loads(z.read("media"))["1"] == "kaz.jpg"
+        assert z.read("0") == b"ID3" + bytes(256)
+
+
+def test_removed_member(
+    versions: tuple[Configuration, Configuration], tmp_path: Path
+) -> None:
+    """Tests members removed from modified package are removed on applying."""
+    original, modified = versions
+    with mgr.Handler(modified) as handler:
+        handler.extract("0").unlink()
+    delta_file: Path = tmp_path / "fix.delta"
+    delta.diff(original, modified, delta_file)
+    for _ in range(2):  # "0" is already gone the second time
+        delta.apply(original, delta_file)
+    with ZipFile(original.zip_path) as z:
+        assert "0" not in z.namelist()
+        assert "1" in z.namelist()
+
+
+def test_unsupported_delta(
+    versions: tuple[Configuration, Configuration], tmp_path: Path
+) -> None:
+    """Tests a delta of a newer format is rejected, the package left as is."""
+    original, modified = versions
+    delta_file: Path = tmp_path / "fix.delta"
+    delta.diff(original, modified, delta_file)
+    with ZipFile(delta_file) as z:
+        members: dict[str, bytes] = {n: z.read(n) for n in z.namelist()}
+    db: Path = tmp_path / delta._delta_db
+    db.write_bytes(members[delta._delta_db])
+    conn: sqlite3.Connection = sqlite3.connect(db)
+    conn.execute(f"PRAGMA user_version = {delta._delta_version + 1}")
+    conn.close()
+    members[delta._delta_db] = db.read_bytes()
+    with ZipFile(delta_file, "w") as z:
+        for name, data in members.items():
+            z.writestr(name, data)
+
+    before: bytes = original.zip_path.read_bytes()
+    with pytest.raises(ValueError, match="unsupported delta version"):
+        delta.apply(original, delta_file)
+    assert original.zip_path.read_bytes() == before
+
+
+def test_diff_and_apply_cli(
+    versions: tuple[Configuration, Configuration],
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Tests diff and apply commands write, then apply and report a delta."""
+    original, modified = versions
+    app_conf = conf_mgr.get_config_obj().copy(update={"anki": original})
+    monkeypatch.setattr(conf_mgr, "get_config_obj", lambda: app_conf)
+    target: Path = tmp_path / "t.apkg"
+    shutil.copy(original.zip_path, target)
+    delta_file: Path = tmp_path / "fix.delta"
+    report: str = (
+        "2 notes and 1 cards added or updated, 2 deleted, 2 media members changed"
+    )
+
+    result = CliRunner().invoke(
+        __main__.main,
+        ["diff", str(original.zip_path), str(modified.zip_path), str(delta_file)],
+    )
+    assert result.exit_code == 0
+    assert result.output == f"{report}\n"
+    result = CliRunner().invoke(__main__.main, ["apply", str(delta_file), str(target)])
+    assert result.exit_code == 0
+    assert result.output == f"{target}: {report}\n"
+    assert _rows(original.copy(update={"zip_path": target}), "notes") == _rows(
+        modified, "notes"
+    )
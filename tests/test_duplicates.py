@@ -0,0 +1,111 @@
+"""Tests finding duplicate and near-duplicate notes."""
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from anki_lu.anki import mgr
+from anki_lu.anki.conf import Configuration
+from anki_lu.anki.duplicates import (
+    DuplicateGroup,
+    DuplicateIndex,
+    find_duplicates,
+    fold,
+)
+
+#  first fields of notes added to the seeded ones (Moien, <b>Äddi</b>, den Hond)
+_added: list[str] = [
+    "d'Hond",
+    "<i>Addi</i>",
+    "Hund",
+    "Kaz",
+    "Katz",
+    "Ech hunn en décke Pak Bicher",
+    "Ech hunn e décke Pak Bicher kaaft",
+    "Ech hunn eng Kaz",
+]
+
+
+@pytest.fixture()
+def duplicated(anki_pkg: Configuration) -> Configuration:
+    """Seeded package, with notes duplicating others (ids 4 on).
+
+    Args:
+        anki_pkg: conf of seeded package
+
+    Returns:
+        conf of package.
+    """
+    with mgr.Handler(anki_pkg) as handler:
+        with handler.db.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO notes VALUES (?, ?, 1, 0, 0, '', ?, '', 0, 0, '')",
+                [(i, f"dup{i}", f"{text}\x1fx") for i, text in enumerate(_added, 4)],
+            )
+    return anki_pkg
+
+
+def test_fold() -> None:
+    """Tests keys ignore case, diacritics, HTML, n-rule and articles."""
+    assert fold("<b>den Hond</b>") == fold("d'Hond") == "hond"
+    assert fold("Äddi") == "addi"
+    assert fold("de") == "de"  # nothing but an article
+
+
+def test_find_duplicates(duplicated: Configuration) -> None:
+    """Tests exact and near-duplicate groups of a deck.
+
+    GIVEN a deck with notes differing in formatting, articles and spelling,
+    WHEN its duplicates are found,
+    THEN
+        notes with the same folded first field are exact groups,
+        words one letter apart, and sentences mostly alike, are near groups,
+        notes sharing only some words aren't grouped.
+    """
+    with mgr.Handler(duplicated) as handler:
+        groups = find_duplicates(handler.db)
+    assert groups == [
+        DuplicateGroup("exact", ("addi",), (2, 5)),
+        DuplicateGroup("exact", ("hond",), (3, 4)),
+        DuplicateGroup("near", ("hond", "hund"), (3, 4, 6)),
+        DuplicateGroup("near", ("katz", "kaz"), (7, 8)),
+        DuplicateGroup(
+            "near",
+            ("ech hunn decke pak bicher", "ech hunn decke pak bicher kaaft"),
+            (9, 10),
+        ),
+    ]
+    with mgr.Handler(duplicated) as handler:
+        assert find_duplicates(handler.db, field=1) == [
+            DuplicateGroup("exact", ("x",), tuple(range(4, 12)))
+        ]
+
+
+def test_match() -> None:
+    """Tests lookups of text against indexed notes, and threshold bounds."""
+    index: DuplicateIndex = DuplicateIndex()
+    for nid, text in enumerate(["Schoul", "Bréif", "Fënster"]):
+        index.add(nid, text)
+    index.add(3, "<img src=x.jpg>")  # no key, not indexed
+    assert index.match("Schull") == [0]
+    assert index.match("<b>Breif</b>") == [1]
+    assert index.match("Fenstere") == [2]
+    assert index.match("Schaf") == index.match("") == []
+    strict: DuplicateIndex = DuplicateIndex(threshold=0.95)
+    strict.add(0, "Bréif")
+    assert strict.match("Bréifs") == []  # too different in length
+    with pytest.raises(ValueError):
+        DuplicateIndex(threshold=0)
+
+
+def test_cli(duplicated: Configuration, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests dupes command lists groups, as text or JSON."""
+    from anki_lu import __main__, conf_mgr
+
+    app_conf = conf_mgr.get_config_obj().copy(update={"anki": duplicated})
+    monkeypatch.setattr(conf_mgr, "get_config_obj", lambda: app_conf)
+    result = CliRunner().invoke(__main__.main, ["dupes"])
+    assert result.exit_code == 0
+    assert result.output.splitlines()[0] == "exact 2 5: addi"
+    result = CliRunner().invoke(__main__.main, ["dupes", "--json", "--all-fields"])
+    assert json.loads(result.output)[0]["note_ids"] == [4, 6]  # not exact now
@@ -0,0 +1,124 @@
+"""Tests bulk vocabulary import."""
+import json
+from pathlib import Path
+
+import pytest
+
+from anki_lu.anki import importer, mgr
+from anki_lu.anki.conf import Configuration
+from tests.conftest import words
+
+
+def test_import_upserts(anki_pkg: Configuration) -> None:
+    """Tests new words are added and known words updated, not duplicated.
+
+    GIVEN a deck holding some words,
+    WHEN a CSV with a changed known word and two new words is imported twice,
+    THEN
+        the first import adds two notes (and cards), and updates one,
+        the second import changes nothing,
+        the new notes have Anki checksums, sort fields and guids.
+    """
+    data: Path = anki_pkg.zip_path.with_name("words.csv")
+    data.write_text(
+        "Lëtzebuergesch,English,tags\n"
+        "Moien,Hi,greeting\n"
+        "<i>Merci</i>,Thanks,\n"
+        "Kaz,cat,animal\n",
+        encoding="utf-8",
+    )
+    handler: mgr.Handler = mgr.Handler(anki_pkg)
+    result = importer.import_file(handler.db, data, "Basic")
+    assert result == importer.ImportResult(added=2, updated=1, unchanged=0)
+    again = importer.import_file(handler.db, data, "Basic")
+    assert again == importer.ImportResult(added=0, updated=0, unchanged=3)
+
+    rows = handler.db.query("SELECT id, guid, flds, sfld, csum, tags FROM notes")
+    assert len(rows) == len(words) + 2
+    merci = [r for r in rows if r["flds"].startswith("<i>Merci")][0]
+    assert merci["sfld"] == "Merci"
+    assert merci["csum"] == importer.field_checksum("Merci")
+    assert merci["guid"] and merci["guid"] not in {r["guid"] for r in rows[:3]}
+    assert handler.db.note(1)["flds"] == "Moien\x1fHi"  # type: ignore[index]
+    assert handler.db.note(1)["tags"] == " greeting "  # type: ignore[index]
+    assert len(handler.db.cards(merci["id"])) == 1
+    handler.__del__()
+
+
+def test_import_jsonl_batches(anki_pkg: Configuration, tmp_path: Path) -> None:
+    """Tests JSONL rows written over several batches, matched on guid."""
+    data: Path = tmp_path / "words.jsonl"
+    with open(data, "w", encoding="utf-8") as f:
+        for i in range(25):
+            f.write(json.dumps({"Lëtzebuergesch": f"Wuert {i}", "English": i}))
+            f.write("\n")
+        f.write("\n")  # blank lines are skipped
+        f.write(json.dumps({"guid": "guid3", "Lëtzebuergesch": "de Hond"}) + "\n")
+    handler: mgr.Handler = mgr.Handler(anki_pkg)
+    result = importer.Importer(handler.db, "Basic", batch_size=4).run(
+        importer.read_rows(data)
+    )
+    assert result == importer.ImportResult(added=25, updated=1, unchanged=0)
+    ids = [r[0] for r in handler.db.query("SELECT id FROM cards")]
+    assert len(ids) == len(set(ids)) == len(words) + 25
+    assert handler.db.note(3)["flds"] == "de Hond\x1fthe dog"  # type: ignore[index]
+    handler.__del__()
+
+
+def test_import_merges_updates(anki_pkg: Configuration) -> None:
+    """Tests updates keep the fields and tags rows have no columns for.
+
+    GIVEN a note with tags,
+    WHEN rows with some of its fields are imported, over several batches,
+        the later ones matching on guid,
+    THEN
+        fields and tags missing from a row are kept,
+        a row repeating an earlier update in the same run is unchanged.
+    """
+    handler: mgr.Handler = mgr.Handler(anki_pkg)
+    with handler.db.transaction() as conn:
+        conn.execute("UPDATE notes SET tags = ' greeting ' WHERE id = 1")
+    rows = [
+        {"Lëtzebuergesch": "Moien", "English": "Hi"},
+        {"guid": "guid1", "Lëtzebuergesch": "Moien!"},
+        {"guid": "guid1", "English": "Hello!"},
+        {"guid": "guid1", "English": "Hello!"},
+    ]
+    result = importer.Importer(handler.db, "Basic", batch_size=2).run(rows)
+    assert result == importer.ImportResult(added=0, updated=3, unchanged=1)
+    note = handler.db.note(1)
+    assert note is not None
+    assert (note["flds"], note["tags"]) == ("Moien!\x1fHello!", " greeting ")
+    assert note["sfld"] == "Moien!"
+    handler.__del__()
+
+
+def test_import_errors(anki_pkg: Configuration, tmp_path: Path) -> None:
+    """Tests unknown and cloze note types, and unknown formats are rejected."""
+    handler: mgr.Handler = mgr.Handler(anki_pkg)
+    with pytest.raises(KeyError):
+        importer.Importer(handler.db, "doesnt_exist")
+    with handler.db.transaction() as conn:
+        models = json.loads(conn.execute("SELECT models FROM col").fetchone()[0])
+        for model in models.values():
+            model["type"] = 1  # cloze
+        conn.execute("UPDATE col SET models = ?", (json.dumps(models),))
+    with pytest.raises(ValueError, match="cloze"):
+        importer.Importer(handler.db, "Basic")
+    with pytest.raises(ValueError):
+        list(importer.read_rows(tmp_path / "words.xls"))
+    handler.__del__()
+
+
+def test_import_skips_duplicates(anki_pkg: Configuration) -> None:
+    """Tests new rows duplicating a note, or an earlier row, are skipped."""
+    handler: mgr.Handler = mgr.Handler(anki_pkg)
+    rows = [
+        {"Lëtzebuergesch": "Hond", "English": "dog"},  # den Hond, article dropped
+        {"Lëtzebuergesch": "Addi", "English": "bye"},  # <b>Äddi</b>
+        {"Lëtzebuergesch": "Katz", "English": "cat"},
+        {"Lëtzebuergesch": "<i>Kaz</i>", "English": "cat"},  # one letter apart
+    ]
+    result = importer.Importer(handler.db, "Basic", skip_duplicates=True).run(rows)
+    assert result == importer.ImportResult(added=1, updated=0, unchanged=0, skipped=3)
+    handler.__del__()
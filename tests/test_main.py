@@ -1,4 +1,7 @@
 """Module covering main.py (main control path)."""
+import subprocess  # noqa: S404
+import sys
+
 import pytest
 from click.testing import CliRunner
 
@@ -16,3 +19,14 @@ def test_main_succeeds(runner: CliRunner) -> None:
     # noinspection PyTypeChecker
     result = runner.invoke(__main__.main)
     assert result.exit_code == 0
+
+
+def test_cli_imports_are_lazy() -> None:
+    """Heavy modules are imported by commands, not at CLI start-up."""
+    code: str = "import sys, anki_lu.__main__; print(' '.join(sys.modules))"
+    proc = subprocess.run(  # noqa: S603
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    loaded: set[str] = set(proc.stdout.split())
+    for name in ("pydantic", "zipfile", "sqlite3", "anki_lu.anki.mgr"):
+        assert name not in loaded
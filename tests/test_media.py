@@ -0,0 +1,240 @@
+"""Tests the content-addressed media store shared by packages."""
+import errno
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Callable
+
+import pytest
+from click.testing import CliRunner
+
+from anki_lu import __main__
+from anki_lu.anki import mgr, work
+from anki_lu.anki.conf import Configuration
+from anki_lu.anki.media import GcSummary, MediaStore
+from tests.conftest import work_areas
+
+
+def _deck_only(load: Callable[..., None]) -> Callable[..., None]:
+    """Wraps WorkArea.load, to fail for members other than decks."""
+
+    def deck_only(
+        self: work.WorkArea, src: Any, info: Any, deck: bool = False, **kwargs: Any
+    ) -> None:
+        """Loads deck from archive, fails for other members."""
+        assert deck, f"{info.filename} loaded from archive"
+        load(self, src, info, deck=deck, **kwargs)
+
+    return deck_only
+
+
+def _counted(load: Callable[..., None], loads: list[str]) -> Callable[..., None]:
+    """Wraps WorkArea.load, to record names of members loaded from archive."""
+
+    def counted(self: work.WorkArea, src: Any, info: Any, **kwargs: Any) -> None:
+        """Records member name, and loads it from archive."""
+        loads.append(info.filename)
+        load(self, src, info, **kwargs)
+
+    return counted
+
+
+@pytest.mark.parametrize("work_area", work_areas)
+def test_shared_media(
+    anki_pkg: Configuration,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    work_area: str,
+) -> None:
+    """Tests media of packages is stored once, and loaded from store.
+
+    GIVEN two packages with the same media, and a media store,
+    WHEN both are opened (fully extracted), then the second one again, and
+        its media changed,
+    THEN
+        the store holds one blob per distinct member,
+        the second open of a package loads members from store, not its
+        archive (on disk, as hard links of the blobs),
+        changing a loaded member doesn't change its blob.
+    """
+    store: Path = tmp_path / "store"
+    conf: Configuration = anki_pkg.copy(
+        update={"media_store": store, "extract": "full", "work_area": work_area}
+    )
+    other: Configuration = conf.copy(update={"zip_path": tmp_path / "other.apkg"})
+    shutil.copy(conf.zip_path, other.zip_path)
+    mgr.Handler(conf).close()
+    mgr.Handler(other).close()
+    blobs: list[Path] = sorted((store / "blobs").glob("*/*"))
+    assert len(blobs) == 2  # media manifest, "0"
+
+    with monkeypatch.context() as m:
+        for area in (work.DiskArea, work.MemoryArea):
+            m.setattr(area, "load", _deck_only(area.load))
+        with mgr.Handler(other) as handler:
+            assert handler.read("0") == b"ID3" + bytes(256)
+            if work_area == "disk":
+                linked: Path = handler._area.path("0")  # type: ignore[assignment]
+                assert linked.stat().st_ino in {b.stat().st_ino for b in blobs}
+            handler.write("0", b"ID3 changed")
+    assert sorted((store / "blobs").glob("*/*")) == blobs
+    assert {b.read_bytes() for b in blobs} >= {b"ID3" + bytes(256)}
+
+
+def test_crc_collision(
+    anki_pkg: Configuration, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests a member's CRC and size are only trusted within its package file.
+
+    GIVEN a store holding a package's media,
+    WHEN a copy of it (same member CRCs and sizes) is opened, and the package
+        itself once it's rewritten,
+    THEN their members are read from their own archives, not found by CRC.
+    """
+    store: Path = tmp_path / "store"
+    conf: Configuration = anki_pkg.copy(
+        update={"media_store": store, "extract": "full"}
+    )
+    other: Configuration = conf.copy(update={"zip_path": tmp_path / "other.apkg"})
+    shutil.copy(conf.zip_path, other.zip_path)
+    mgr.Handler(conf).close()
+    loads: list[str] = []
+    monkeypatch.setattr(work.DiskArea, "load", _counted(work.DiskArea.load, loads))
+
+    mgr.Handler(conf).close()
+    assert loads == ["collection.anki21"]
+    mgr.Handler(other).close()
+    assert sorted(loads[1:]) == ["0", "collection.anki21", "media"]
+    conf.zip_path.write_bytes(conf.zip_path.read_bytes())  # new file version
+    loads.clear()
+    mgr.Handler(conf).close()
+    assert sorted(loads) == ["0", "collection.anki21", "media"]
+
+
+def test_extract_unshares(anki_pkg: Configuration, tmp_path: Path) -> None:
+    """Tests a member extracted for changes in place isn't a link to its blob."""
+    conf: Configuration = anki_pkg.copy(update={"media_store": tmp_path})
+    with mgr.Handler(conf) as handler:
+        handler.read("0")
+    with mgr.Handler(conf) as handler:
+        path: Path = handler.extract("0")
+        assert path.stat().st_nlink == 1
+        path.write_bytes(b"ID3 changed")
+    blob: Path = next((tmp_path / "blobs").glob("*/*"))
+    assert blob.read_bytes() == b"ID3" + bytes(256)
+
+
+def _no_link(src: object, dst: object) -> None:
+    """Stands in for os.link, as if the store were on another device."""
+    raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+
+def test_store_fallbacks(
+    anki_pkg: Configuration, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests members are loaded even if store blobs can't be linked or are gone.
+
+    GIVEN a store holding a package's media,
+    WHEN it's opened with the store on another device, then with the blobs
+        removed (by a concurrent gc),
+    THEN
+        members are cloned from store, not linked,
+        then read from the archive, and stored again.
+    """
+    store: Path = tmp_path / "store"
+    conf: Configuration = anki_pkg.copy(
+        update={"media_store": store, "extract": "full"}
+    )
+    mgr.Handler(conf).close()
+    blobs: list[Path] = sorted((store / "blobs").glob("*/*"))
+
+    with monkeypatch.context() as m:
+        m.setattr(work.DiskArea, "load", _deck_only(work.DiskArea.load))
+        m.setattr(os, "link", _no_link)
+        with mgr.Handler(conf) as handler:
+            path: Path = handler._area.path("0")  # type: ignore[assignment]
+            assert path.stat().st_nlink == 1
+            assert path.read_bytes() == b"ID3" + bytes(256)
+
+    for blob in blobs:
+        blob.chmod(0o644)
+        blob.unlink()
+    loads: list[str] = []
+    monkeypatch.setattr(work.DiskArea, "load", _counted(work.DiskArea.load, loads))
+    with mgr.Handler(conf) as handler:
+        assert handler.read("0") == b"ID3" + bytes(256)
+    assert sorted(loads) == ["0", "collection.anki21", "media"]
+    assert sorted((store / "blobs").glob("*/*")) == blobs
+
+
+@pytest.mark.parametrize(
+    "taken, collected",
+    [("digests", GcSummary(1, 259, 1)), ("blobs", GcSummary(0, 0, 1))],
+)
+def test_store_failure(
+    anki_pkg: Configuration, tmp_path: Path, taken: str, collected: GcSummary
+) -> None:
+    """Tests a store that can't be written to leaves members loaded.
+
+    GIVEN a store whose digest or blob directory is taken by a file,
+    WHEN a package is opened with it,
+    THEN
+        its members are loaded from archive, though not recorded in store,
+        no temp file is left, and gc removes the unrecorded blob (if any).
+    """
+    store: Path = tmp_path / "store"
+    conf: Configuration = anki_pkg.copy(update={"media_store": store})
+    store.mkdir()
+    (store / taken).write_bytes(b"")
+    with mgr.Handler(conf) as handler:
+        assert handler.read("0") == b"ID3" + bytes(256)
+    assert not list(store.glob("**/*.tmp"))
+    assert MediaStore(store).gc() == collected
+    assert MediaStore(tmp_path / "none").gc() == GcSummary(0, 0, 0)
+
+
+def test_gc(anki_pkg: Configuration, tmp_path: Path) -> None:
+    """Tests gc keeps blobs of recorded packages, removes others.
+
+    GIVEN a store used by two packages with the same media,
+    WHEN one package, then the other is removed, with gc after each,
+    THEN blobs are kept while a package holds them, then removed.
+    """
+    store: Path = tmp_path / "store"
+    conf: Configuration = anki_pkg.copy(
+        update={"media_store": store, "extract": "full"}
+    )
+    other: Configuration = conf.copy(update={"zip_path": tmp_path / "other.apkg"})
+    shutil.copy(conf.zip_path, other.zip_path)
+    for package in (conf, other):
+        mgr.Handler(package).close()
+    other.zip_path.write_bytes(other.zip_path.read_bytes())  # new file version
+
+    assert MediaStore(store).gc() == GcSummary(0, 0, 2)
+    assert len(list((store / "digests").iterdir())) == 1
+    other.zip_path.unlink()
+    assert MediaStore(store).gc() == GcSummary(0, 0, 1)
+    conf.zip_path.rename(tmp_path / "moved.apkg")
+    result = CliRunner().invoke(__main__.main, ["gc", "--store", str(store)])
+    assert result.exit_code == 0
+    assert result.output.startswith("2 blobs removed")
+    assert not list((store / "blobs").glob("*/*"))
+
+
+def test_gc_cli_configured_store(
+    anki_pkg: Configuration, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests gc command uses the configured store, and needs one."""
+    from anki_lu import conf_mgr
+
+    app_conf = conf_mgr.get_config_obj().copy(update={"anki": anki_pkg})
+    monkeypatch.setattr(conf_mgr, "get_config_obj", lambda: app_conf)
+    result = CliRunner().invoke(__main__.main, ["gc"])
+    assert result.exit_code == 2
+    assert "no media store" in result.output
+
+    anki_pkg.media_store = tmp_path / "store"
+    mgr.Handler(anki_pkg).close()
+    result = CliRunner().invoke(__main__.main, ["gc"])
+    assert result.exit_code == 0
+    assert result.output.startswith("0 blobs removed")
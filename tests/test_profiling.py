@@ -0,0 +1,75 @@
+"""Tests timing spans around config, open, change detection and export."""
+import json
+from pathlib import Path
+
+from click.testing import CliRunner
+
+from anki_lu import __main__, profiling
+from anki_lu.anki import mgr
+from anki_lu.anki.conf import Configuration
+
+
+def test_handler_phases(anki_pkg: Configuration) -> None:
+    """Tests a hook sees each phase of an edit, with its byte counters.
+
+    GIVEN a recorder registered as hook,
+    WHEN a package is opened, edited and exported,
+    THEN
+        open, detect and export phases are recorded once each, in order,
+        export counts the bytes it read and wrote,
+        spans stop being recorded once the hook is removed.
+    """
+    recorder: profiling.Recorder = profiling.Recorder()
+    profiling.add_hook(recorder)
+    try:
+        with mgr.Handler(anki_pkg) as handler:
+            with handler.db.transaction() as conn:
+                conn.execute("DELETE FROM notes WHERE id = 1")
+    finally:
+        profiling.remove_hook(recorder)
+    mgr.Handler(anki_pkg).close()
+
+    summary = recorder.summary()
+    assert list(summary) == [
+        "open",
+        "close.db",
+        "detect",
+        "export.zip",
+        "export.fsync",
+        "export.publish",
+    ]
+    assert all(total["count"] == 1 for total in summary.values())
+    assert summary["open"]["counters"]["bytes_loaded"] > 0
+    zipped: dict[str, int] = summary["export.zip"]["counters"]
+    assert zipped["bytes_written"] == anki_pkg.zip_path.stat().st_size
+    assert zipped["bytes_read"] > 0
+    assert "export.zip" in recorder.table()
+
+
+def test_span_without_hooks() -> None:
+    """Tests spans run their block, and report nothing, without hooks."""
+    with profiling.span("idle") as counters:
+        counters["bytes"] = 1
+    assert counters == {"bytes": 1}
+
+
+def test_cli_profile_json(tmp_path: Path) -> None:
+    """Tests --profile-json writes the spans of the command it wraps.
+
+    The command fails (no package matches), which is still profiled.
+    """
+    out: Path = tmp_path / "profile.json"
+    result = CliRunner().invoke(
+        __main__.main, ["--profile-json", str(out), "batch", str(tmp_path / "*.apkg")]
+    )
+    assert result.exit_code == 1
+    assert json.loads(out.read_text())["config"]["count"] == 1
+
+
+def test_cli_profile_table(tmp_path: Path) -> None:
+    """Tests --profile prints a table of the spans of the command it wraps."""
+    result = CliRunner().invoke(
+        __main__.main, ["--profile", "batch", str(tmp_path / "*.apkg")]
+    )
+    assert result.exit_code == 1
+    assert "span" in result.output and "config" in result.output
@@ -0,0 +1,86 @@
+"""Tests the full-text search index over deck notes."""
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+
+from anki_lu import __main__, conf_mgr
+from anki_lu.anki import mgr, search
+from anki_lu.anki.conf import Configuration
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("<b>Äddi</b>", "addi"),
+        ("den Hond", "de hond"),
+        ("Schwëster&nbsp;an\x1fBrudder", "schwester a brudder"),
+        ("Wann ech Zäit hunn", "wann ech zait hunn"),
+        ("Léierbuch", "leierbuch"),
+    ],
+)
+def test_normalise(text: str, expected: str) -> None:
+    """Tests diacritics, case, HTML and n-rule forms are folded."""
+    assert search.normalise(text) == expected
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ('Hond "Kaz"', '"hond" "kaz"'),
+        ('"OR NOT', '"or" "not"'),
+        ("schw*", '"schw"*'),
+    ],
+)
+def test_match_expression(query: str, expected: str) -> None:
+    """Tests query words become quoted FTS5 strings, operators included."""
+    assert search._match_expression(query) == expected
+
+
+def test_search_and_update(anki_pkg: Configuration, tmp_path: Path) -> None:
+    """Tests lookups across spelling variants, and incremental updates.
+
+    GIVEN an index of the seeded notes (Moien, Äddi, den Hond),
+    WHEN it's searched, then a note is changed, one removed, and it's updated,
+    THEN
+        variants and prefixes match, all query words must match,
+        only the changed and removed notes are re-indexed,
+        an index opened again (another run) is up to date.
+    """
+    conf: Configuration = anki_pkg.copy(update={"search_index": tmp_path / "idx"})
+    with mgr.Handler(conf) as handler, search.SearchIndex.for_package(conf) as index:
+        assert index.update(handler.db) == 3
+        assert index.update(handler.db) == 0
+        assert index.search("addi") == [2]
+        assert index.search("de hond") == [3]
+        assert index.search("Hon*") == [3]
+        assert index.search("hond moien") == []
+        assert index.search("  ") == []
+        assert index.search('"den" Hond"') == [3]  # quotes aren't FTS5 syntax
+        assert index.search("hond OR moien") == []  # nor are operators
+
+        with handler.db.transaction() as conn:
+            conn.execute("UPDATE notes SET flds = 'Moien Welt', mod = 1 WHERE id = 1")
+            conn.execute("DELETE FROM notes WHERE id = 2")
+        assert index.update(handler.db) == 2
+        assert index.search("welt") == [1]
+        assert index.search("addi") == []
+
+    with mgr.Handler(conf) as handler, search.SearchIndex(tmp_path / "idx") as index:
+        assert index.update(handler.db) == 0
+        assert index.search("moien") == [1]
+
+
+def test_search_cli(
+    anki_pkg: Configuration, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests search command lists matching notes, fields separated."""
+    conf: Configuration = anki_pkg.copy(update={"search_index": tmp_path / "idx"})
+    app_conf = conf_mgr.get_config_obj().copy(update={"anki": conf})
+    monkeypatch.setattr(conf_mgr, "get_config_obj", lambda: app_conf)
+    result = CliRunner().invoke(__main__.main, ["search", "De Hond"])
+    assert result.exit_code == 0
+    assert result.output == "3: den Hond | the dog\n"
+    result = CliRunner().invoke(__main__.main, ["search", "-n", "1", "kaz"])
+    assert result.exit_code == 0
+    assert result.output == ""
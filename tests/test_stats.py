@@ -0,0 +1,128 @@
+"""Tests review-log analytics."""
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from anki_lu.anki import mgr
+from anki_lu.anki.conf import Configuration
+
+pytest.importorskip("numpy")
+
+from anki_lu.anki import stats  # noqa: E402
+
+_crt: int = 1600000000  # see conftest
+_now: float = _crt + 100 * 86400 + 3600  # Anki day 100
+#  (cid, ease, lastIvl, type) of reviews; card 99 was deleted since
+_reviews: list[tuple[int, int, int, int]] = [
+    (1, 1, 1, 1),
+    (1, 3, 1, 1),
+    (1, 3, 10, 1),
+    (2, 1, 3, 1),
+    (2, 1, 3, 1),
+    (2, 4, 200, 1),
+    (3, 1, -60, 0),  # learning step, not a review
+    (3, 3, 400, 1),
+    (99, 3, 1, 1),
+]
+
+
+@pytest.fixture()
+def reviewed(anki_pkg: Configuration) -> Configuration:
+    """Seeded package, with reviews, and cards due on days 0 and 3.
+
+    Args:
+        anki_pkg: conf of seeded package
+
+    Returns:
+        conf of package.
+    """
+    with mgr.Handler(anki_pkg) as handler:
+        with handler.db.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO revlog VALUES (?, ?, 0, ?, 0, ?, 2500, 5000, ?)",
+                [(i, *review) for i, review in enumerate(_reviews)],
+            )
+            conn.execute("UPDATE cards SET queue = 2, due = 100 WHERE id = 1")
+            conn.execute("UPDATE cards SET queue = 2, due = 103 WHERE id = 2")
+            conn.execute(
+                "UPDATE cards SET queue = 1, due = ? WHERE id = 3", (int(_now) + 100,)
+            )
+    return anki_pkg
+
+
+def test_report(reviewed: Configuration) -> None:
+    """Tests retention by interval, due forecast and lapse rates.
+
+    GIVEN a deck with reviews at several intervals, and cards due,
+    WHEN its report is made,
+    THEN
+        reviews (not learning steps) are bucketed by interval before review,
+        review and learning cards are forecast by day, overdue ones today,
+        notes with enough reviews are listed by lapse rate.
+    """
+    with mgr.Handler(reviewed) as handler:
+        tables = stats.report(handler.db, days=5, now=_now)
+    retention = {row["max_interval"]: row for row in tables["retention"]}
+    assert (retention[1]["reviews"], retention[1]["retention"]) == (3, 0.6667)
+    assert (retention[4]["reviews"], retention[4]["retention"]) == (2, 0.0)
+    assert retention[2]["retention"] is None
+    assert [retention[b]["reviews"] for b in (14, 365, None)] == [1, 1, 1]
+    assert [row["due"] for row in tables["forecast"]] == [2, 0, 0, 1, 0]
+    assert tables["notes"] == [
+        {"nid": 2, "reviews": 3, "lapses": 2, "lapse_rate": 0.6667},
+        {"nid": 1, "reviews": 3, "lapses": 1, "lapse_rate": 0.3333},
+    ]
+
+
+def test_load_in_chunks(reviewed: Configuration) -> None:
+    """Tests reviews and cards read in several chunks are all read."""
+    with mgr.Handler(reviewed) as handler:
+        reviews = stats.load_reviews(handler.db, chunk=2)
+        cards = stats.load_cards(handler.db, chunk=2)
+    assert [tuple(row) for row in reviews] == [
+        (cid, max(ivl, 0), int(ease == 1))
+        for cid, ease, ivl, type_ in _reviews
+        if type_
+    ]
+    assert [tuple(row[:2]) for row in cards] == [(1, 1), (2, 2), (3, 3)]
+
+
+def test_load_rows_added_meanwhile(reviewed: Configuration) -> None:
+    """Tests rows added between counting and reading them are kept."""
+    with mgr.Handler(reviewed) as handler:
+        with handler.db.connection() as conn:
+            rows = stats._load(conn, "SELECT id FROM cards", "SELECT 1", 1, 2)
+    assert rows.tolist() == [[1], [2], [3]]
+
+
+def test_empty_deck(anki_pkg: Configuration) -> None:
+    """Tests a deck without reviews gives empty statistics."""
+    with mgr.Handler(anki_pkg) as handler:
+        with handler.db.transaction() as conn:
+            conn.execute("DELETE FROM cards")
+        tables = stats.report(handler.db, days=3, now=_now)
+    assert all(row["reviews"] == 0 for row in tables["retention"])
+    assert tables["notes"] == []
+
+
+def test_cli_csv(reviewed: Configuration, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests stats command writes a table as CSV, or all as JSON."""
+    from anki_lu import __main__, conf_mgr
+
+    app_conf = conf_mgr.get_config_obj().copy(update={"anki": reviewed})
+    monkeypatch.setattr(conf_mgr, "get_config_obj", lambda: app_conf)
+    result = CliRunner().invoke(
+        __main__.main, ["stats", "--format", "csv", "--table", "notes"]
+    )
+    assert result.exit_code == 0
+    assert result.output.splitlines()[0] == "nid,reviews,lapses,lapse_rate"
+    result = CliRunner().invoke(__main__.main, ["stats", "--days", "2"])
+    assert len(json.loads(result.output)["forecast"]) == 2
+
+
+def test_needs_numpy(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests stats name the extra to install, if numpy isn't installed."""
+    monkeypatch.setattr(stats, "np", None)
+    with pytest.raises(RuntimeError, match=r"anki-lu\[stats\]"):
+        stats.retention_curve([])
@@ -0,0 +1,97 @@
+"""Tests streaming export of deck tables."""
+import csv
+import json
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+
+from anki_lu.anki import mgr, tabular
+from anki_lu.anki.conf import Configuration
+from tests.conftest import words
+
+
+@pytest.mark.parametrize("fmt", ["csv", "jsonl"])
+def test_export_notes(anki_pkg: Configuration, tmp_path: Path, fmt: str) -> None:
+    """Tests notes are written in chunks, fields split into named columns.
+
+    GIVEN a deck with notes of one note type,
+    WHEN its notes are exported two rows at a time,
+    THEN every note is written, with a column per field, named after it.
+    """
+    dst: Path = tmp_path / f"notes.{fmt}"
+    with mgr.Handler(anki_pkg) as handler:
+        assert tabular.export_table(handler.db, "notes", dst, size=2) == len(words)
+    with open(dst, encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f]
+    assert [(r["Lëtzebuergesch"], r["English"]) for r in rows] == words
+    assert rows[0]["model"] == "Basic"
+    assert str(rows[2]["id"]) == "3"
+
+
+def test_notes_of_several_models(anki_pkg: Configuration) -> None:
+    """Tests notes of several note types get the union of their columns."""
+    with mgr.Handler(anki_pkg) as handler:
+        models = json.loads(handler.db.query("SELECT models FROM col")[0][0])
+        models["7"] = {"id": 7, "name": "Word", "flds": [{"name": "Plural", "ord": 0}]}
+        with handler.db.transaction() as conn:
+            conn.execute("UPDATE col SET models = ?", (json.dumps(models),))
+            conn.execute(
+                "INSERT INTO notes VALUES (9, 'g9', 7, 0, 0, '', 'Hënn', '', 0, 0, '')"
+            )
+        cols = tabular.columns(handler.db, "notes")
+        rows = [row for chunk in tabular.chunks(handler.db, "notes") for row in chunk]
+        word_rows = list(tabular.chunks(handler.db, "notes", model="Word"))
+        with pytest.raises(KeyError):
+            tabular.columns(handler.db, "notes", model="doesnt_exist")
+    assert cols.names[-3:] == ("Lëtzebuergesch", "English", "Plural")
+    assert rows[0][-3:] == ("Moien", "Hello", None)
+    assert rows[-1][-3:] == (None, None, "Hënn")
+    assert word_rows == [[(9, "g9", 7, "Word", 0, 0, "", "Hënn")]]
+
+
+def test_export_cards_cli(
+    anki_pkg: Configuration, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests dump command writes cards, and rejects unknown formats."""
+    from anki_lu import __main__, conf_mgr
+
+    app_conf = conf_mgr.get_config_obj().copy(update={"anki": anki_pkg})
+    monkeypatch.setattr(conf_mgr, "get_config_obj", lambda: app_conf)
+    dst: Path = tmp_path / "cards.txt"
+    result = CliRunner().invoke(
+        __main__.main, ["dump", "cards", str(dst), "--format", "csv"]
+    )
+    assert result.exit_code == 0
+    assert result.output == f"{len(words)} cards rows written to {dst}\n"
+    assert dst.read_text(encoding="utf-8").startswith("id,nid,did,ord,")
+    result = CliRunner().invoke(__main__.main, ["dump", "revlog", str(dst)])
+    assert isinstance(result.exception, ValueError)
+
+
+def test_export_errors(
+    anki_pkg: Configuration, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests unknown tables, and Parquet without pyarrow, are rejected."""
+    monkeypatch.setattr(tabular, "pyarrow", None)
+    with mgr.Handler(anki_pkg) as handler:
+        with pytest.raises(ValueError, match="unknown table col"):
+            tabular.export_table(handler.db, "col", tmp_path / "col.csv")
+        with pytest.raises(RuntimeError, match=r"anki-lu\[parquet\]"):
+            tabular.export_table(handler.db, "notes", tmp_path / "notes.parquet")
+
+
+def test_export_parquet(anki_pkg: Configuration, tmp_path: Path) -> None:
+    """Tests revlog written as Parquet, typed by column."""
+    parquet = pytest.importorskip("pyarrow.parquet")
+    dst: Path = tmp_path / "revlog.parquet"
+    with mgr.Handler(anki_pkg) as handler:
+        with handler.db.transaction() as conn:
+            conn.execute("INSERT INTO revlog VALUES (1, 1, 0, 3, 1, 0, 2500, 10, 1)")
+        assert tabular.export_table(handler.db, "revlog", dst) == 1
+    table = parquet.read_table(dst)
+    assert table.column("ease").to_pylist() == [3]
+    assert str(table.schema.field("id").type) == "int64"
@@ -0,0 +1,194 @@
+"""Tests integrity checks of Anki export files."""
+import json
+from pathlib import Path
+from zipfile import ZIP_STORED, ZipFile
+
+import pytest
+from click.testing import CliRunner
+
+from anki_lu.anki import mgr, zstd
+from anki_lu.anki.conf import Configuration
+from anki_lu.anki.verify import VerifyReport, verify
+
+_media: bytes = b"ID3" + bytes(256)  # content of member "0", see conftest
+_deck: str = "collection.anki21"
+
+
+def _corrupt(path: Path, data: bytes) -> None:
+    """Flips a byte in the (stored) data of a member, leaving its CRC as is."""
+    content: bytes = path.read_bytes()
+    at: int = content.index(data) + len(data) // 2
+    path.write_bytes(content[:at] + bytes([content[at] ^ 1]) + content[at + 1 :])
+
+
+def _encrypt(path: Path, name: str) -> None:
+    """Sets the encrypted flag of member in the central directory."""
+    content: bytes = path.read_bytes()
+    at: int = content.rindex(b"PK\x01\x02", 0, content.rindex(name.encode())) + 8
+    path.write_bytes(content[:at] + bytes([content[at] | 1]) + content[at + 1 :])
+
+
+@pytest.fixture()
+def broken(anki_pkg: Configuration) -> Configuration:
+    """Seeded package, with corrupt, missing, unlisted and unreferenced media.
+
+    Manifest lists "0" (corrupt, referenced), "1" (not in archive), "2" (a
+    template file), and "3" (unreferenced); member "7" isn't listed.
+
+    Args:
+        anki_pkg: conf of seeded package
+
+    Returns:
+        conf of package.
+    """
+    with mgr.Handler(anki_pkg) as handler:
+        with handler.db.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO notes VALUES (?, ?, 1, 0, 0, '', ?, '', 0, 0, '')",
+                [
+                    (10, "g10", "Moien [sound:moien.mp3]\x1f<img src='hond.jpg'>"),
+                    (11, "g11", '<IMG class="x" SRC="kaz&amp;co.jpg">\x1f'),
+                    (12, "g12", '<img src="https://example.org/remote.png">\x1f'),
+                ],
+            )
+        deck: bytes = handler.read(_deck)
+    manifest = {"0": "moien.mp3", "1": "hond.jpg", "2": "_lb.css", "3": "old.ogg"}
+    with ZipFile(anki_pkg.zip_path, "w", ZIP_STORED) as z:
+        z.writestr(_deck, deck)
+        z.writestr("media", json.dumps(manifest))
+        for name, data in (("0", _media), ("2", b"css"), ("3", b"ogg"), ("7", b"?")):
+            z.writestr(name, data)
+    _corrupt(anki_pkg.zip_path, _media)
+    return anki_pkg
+
+
+def test_verify_intact(anki_pkg: Configuration, tmp_path: Path) -> None:
+    """Tests an intact package passes, its unreferenced media reported.
+
+    The media store is left alone: verifying only reads the package.
+    """
+    anki_pkg.media_store = tmp_path / "media"
+    assert verify(anki_pkg, workers=2) == VerifyReport(
+        members=3, corrupt=[], deck_errors=[], missing=[], orphaned=["moien.mp3"]
+    )
+    assert not anki_pkg.media_store.exists()
+
+
+def test_verify_broken(broken: Configuration) -> None:
+    """Tests corrupt members, and missing and orphaned media, are reported.
+
+    GIVEN a package with a corrupt media member, media referenced by notes
+        but not in the package, and media no note references,
+    WHEN it's verified,
+    THEN
+        the corrupt member, missing and orphaned media are listed,
+        template files (_*) and remote references aren't,
+        the package isn't changed.
+    """
+    before: bytes = broken.zip_path.read_bytes()
+    report: VerifyReport = verify(broken)
+    assert report == VerifyReport(
+        members=6,
+        corrupt=["0"],
+        deck_errors=[],
+        missing=["hond.jpg", "kaz&co.jpg"],
+        orphaned=["7", "old.ogg"],
+    )
+    assert not report.ok
+    assert broken.zip_path.read_bytes() == before
+
+
+def test_verify_corrupt_deck(broken: Configuration) -> None:
+    """Tests a deck that can't be loaded is reported, with its member."""
+    with ZipFile(broken.zip_path) as z:
+        deck: bytes = z.read(_deck)
+    _corrupt(broken.zip_path, deck[-2048:])
+    report: VerifyReport = verify(broken, workers=1)
+    assert report.corrupt == ["0", _deck]
+    assert len(report.deck_errors) == 1
+    assert report.deck_errors[0].startswith("deck not loaded")
+
+
+def test_verify_encrypted_deck(anki_pkg: Configuration) -> None:
+    """Tests an encrypted deck is reported unreadable, not raised."""
+    _encrypt(anki_pkg.zip_path, _deck)
+    report: VerifyReport = verify(anki_pkg, workers=1)
+    assert report.corrupt == [_deck]
+    assert len(report.deck_errors) == 1
+    assert report.deck_errors[0].startswith("deck not loaded")
+    assert "encrypted" in report.deck_errors[0]
+
+
+def test_verify_zstd_deck_without_extra(
+    anki_pkg: Configuration, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests a zstd deck is reported unreadable if zstandard isn't installed."""
+    monkeypatch.setattr(zstd, "zstandard", None)
+    with ZipFile(anki_pkg.zip_path, "a") as z:
+        z.writestr(_deck + zstd.deck_suffix_flag, zstd._magic + bytes(8))
+    report: VerifyReport = verify(anki_pkg, workers=1)
+    assert report.corrupt == []
+    assert report.deck_errors == [
+        "deck not loaded: zstd packages need the zstd extra: anki-lu[zstd]"
+    ]
+
+
+def test_verify_unreadable_manifest(broken: Configuration) -> None:
+    """Tests a manifest that isn't valid JSON is reported corrupt.
+
+    Its media are then unlisted: members are reported orphaned, references
+    missing.
+    """
+    with ZipFile(broken.zip_path) as z:
+        members: dict[str, bytes] = {n: z.read(n) for n in z.namelist() if n != "0"}
+    with ZipFile(broken.zip_path, "w") as z:
+        for name, data in {**members, "0": _media, "media": b"{not json"}.items():
+            z.writestr(name, data)
+    report: VerifyReport = verify(broken, workers=1)
+    assert report.corrupt == ["media"]
+    assert report.orphaned == ["0", "2", "3", "7"]
+    assert "moien.mp3" in report.missing
+
+
+def test_verify_no_deck(anki_pkg: Configuration) -> None:
+    """Tests a package without deck (nor manifest) is reported, not raised."""
+    with ZipFile(anki_pkg.zip_path, "w") as z:
+        z.writestr("0", _media)
+    report: VerifyReport = verify(anki_pkg, workers=1)
+    assert report == VerifyReport(
+        members=1,
+        corrupt=[],
+        deck_errors=[f"deck not loaded: no {anki_pkg.deck_suffix} file"],
+        missing=[],
+        orphaned=["0"],
+    )
+
+
+def test_verify_not_a_deck(anki_pkg: Configuration) -> None:
+    """Tests an intact member that isn't an SQLite database is reported."""
+    with ZipFile(anki_pkg.zip_path, "w") as z:
+        z.writestr(_deck, b"not a deck" * 100)
+    report: VerifyReport = verify(anki_pkg, workers=1)
+    assert report.corrupt == []
+    assert report.deck_errors == ["file is not a database"]
+
+
+def test_verify_cli(broken: Configuration) -> None:
+    """Tests verify command lists problems, failing for broken packages."""
+    from anki_lu import __main__
+
+    result = CliRunner().invoke(__main__.main, ["verify", str(broken.zip_path)])
+    assert result.exit_code == 1
+    assert result.output.splitlines()[1:3] == [
+        "  corrupt: 0",
+        "  missing: hond.jpg, kaz&co.jpg",
+    ]
+
+
+def test_verify_cli_intact(anki_pkg: Configuration) -> None:
+    """Tests verify command succeeds for intact packages, listing orphans."""
+    from anki_lu import __main__
+
+    result = CliRunner().invoke(__main__.main, ["verify", str(anki_pkg.zip_path)])
+    assert result.exit_code == 0
+    assert result.output.splitlines()[1:] == ["  orphaned: moien.mp3"]
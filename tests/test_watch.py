@@ -0,0 +1,146 @@
+"""Tests refreshing handlers, and watching packages for rewrites."""
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+
+import pytest
+from click.testing import CliRunner
+
+from anki_lu import __main__, conf_mgr, watch
+from anki_lu.anki import mgr
+from anki_lu.anki.conf import Configuration
+from tests.conftest import work_areas
+
+
+def _rewrite(conf: Configuration, media: bytes = b"ID3 new") -> None:
+    """Rewrites package, as a new export would: a note removed, media changed."""
+    with mgr.Handler(conf) as handler:
+        with handler.db.transaction() as conn:
+            conn.execute("DELETE FROM notes WHERE id = 1")
+        handler.write("0", media)
+
+
+@pytest.mark.parametrize("work_area", work_areas)
+def test_refresh(anki_pkg: Configuration, work_area: str) -> None:
+    """Tests a handler catches up with its rewritten package.
+
+    GIVEN an open handler, with its deck connected and media member loaded,
+    WHEN the package is rewritten, and the handler refreshed,
+    THEN
+        the changed members are reported, and their new content is seen,
+        a refresh with no rewrite in between changes nothing.
+    """
+    conf: Configuration = anki_pkg.copy(update={"work_area": work_area})
+    handler: mgr.Handler = mgr.Handler(conf)
+    assert handler.db.query("SELECT count() FROM notes")[0][0] == 3
+    assert handler.read("0") == b"ID3" + bytes(256)
+
+    _rewrite(conf)
+    assert handler.refresh() == {"collection.anki21", "0"}
+    assert handler.db.query("SELECT count() FROM notes")[0][0] == 2
+    assert handler.read("0") == b"ID3 new"
+    assert handler.refresh() == set()
+    handler.close()
+
+
+def test_refresh_removed_member(anki_pkg: Configuration) -> None:
+    """Tests a handler is set up afresh when members were removed."""
+    handler: mgr.Handler = mgr.Handler(anki_pkg)
+    with mgr.Handler(anki_pkg) as other:
+        other.extract("0").unlink()
+    assert handler.refresh() == {"0"}
+    with pytest.raises(KeyError):
+        handler.read("0")
+    assert handler.db.query("SELECT count() FROM notes")[0][0] == 3
+    handler.close()
+
+
+def test_watch(anki_pkg: Configuration, tmp_path: Path) -> None:
+    """Tests watched packages are handled when opened, then when rewritten.
+
+    GIVEN a package, and a path with no package yet,
+    WHEN they're watched, and the package rewritten, the other one created,
+    THEN
+        the package is handled on opening, and after the rewrite with the
+            changed members re-read,
+        the invalid package gives a failed event.
+    """
+    missing: Path = tmp_path / "new.apkg"
+    events = watch.watch(
+        anki_pkg, [anki_pkg.zip_path, missing], interval=0.01, settle=0.05
+    )
+    event: watch.WatchEvent = next(events)
+    assert (event.path, event.ok) == (anki_pkg.zip_path, True)
+    assert event.changed == frozenset()
+    assert event.detail == "3 notes"
+
+    _rewrite(anki_pkg)
+    event = next(events)
+    assert event.ok and event.detail == "2 notes"
+    assert event.changed == {"collection.anki21", "0"}
+
+    missing.write_bytes(b"not a zip")
+    event = next(events)
+    assert (event.path, event.ok) == (missing, False)
+    assert event.detail.startswith("BadZipFile")
+    events.close()
+
+
+def _failing(handler: mgr.Handler) -> str:
+    """Task failing on an open package."""
+    raise ZeroDivisionError("no notes to share")
+
+
+def test_watch_failing_task(anki_pkg: Configuration) -> None:
+    """Tests a failing task gives a failed event, its handler closed."""
+    events = watch.watch(
+        anki_pkg, [anki_pkg.zip_path], task=_failing, interval=0.01, settle=0
+    )
+    event: watch.WatchEvent = next(events)
+    assert not event.ok
+    assert event.detail == "ZeroDivisionError: no notes to share"
+    events.close()
+
+
+def test_watch_cli(
+    anki_pkg: Configuration, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests watch command reports events until interrupted (Ctrl-C).
+
+    GIVEN the configured package, and an invalid one,
+    WHEN they're watched, and watching is interrupted after each is handled,
+    THEN both events are reported, the configured package's by default.
+    """
+    invalid: Path = tmp_path / "invalid.apkg"
+    invalid.write_bytes(b"not a zip")
+    app_conf = conf_mgr.get_config_obj().copy(update={"anki": anki_pkg})
+    monkeypatch.setattr(conf_mgr, "get_config_obj", lambda: app_conf)
+    watched: list[list[Path]] = []
+    watch_packages = watch.watch
+
+    def interrupted(
+        conf: Configuration, packages: list[Path], **kwargs: Any
+    ) -> Iterator[watch.WatchEvent]:
+        """Watches packages, interrupted once each was handled."""
+        watched.append(packages)
+        events = watch_packages(conf, packages, **kwargs)
+        for _ in packages:
+            yield next(events)
+        events.close()
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(watch, "watch", interrupted)
+    result = CliRunner().invoke(__main__.main, ["watch", "--settle", "0"])
+    assert result.exit_code == 0
+    assert result.output.startswith(f"ok     {anki_pkg.zip_path} (")
+    assert result.output.endswith(", opened): 3 notes\n")
+
+    result = CliRunner().invoke(
+        __main__.main,
+        ["watch", "--settle", "0", str(anki_pkg.zip_path), str(invalid)],
+    )
+    assert result.exit_code == 0
+    ok, failed = result.output.splitlines()
+    assert ok.startswith("ok     ")
+    assert failed.startswith(f"FAILED {invalid} (") and "BadZipFile" in failed
+    assert watched == [[anki_pkg.zip_path], [anki_pkg.zip_path, invalid]]
@@ -0,0 +1,119 @@
+"""Tests support for zstd-compressed (Anki 2.1.50+) packages."""
+import shutil
+from collections.abc import Iterator
+from pathlib import Path
+from tempfile import mkdtemp
+from zipfile import ZIP_STORED, ZipFile
+
+import pytest
+
+from anki_lu.anki import mgr, zstd
+from anki_lu.anki.conf import Configuration
+from tests.conftest import make_collection, note_ids, work_areas
+
+pytest.importorskip("zstandard")
+
+
+@pytest.fixture()
+def anki21b_pkg() -> Iterator[Configuration]:
+    """Creates newer-format Anki export: zstd deck, media map and media.
+
+    Yields:
+        conf object, pointing to the export.
+    """
+    w_dir: Path = Path(mkdtemp())
+    deck: Path = w_dir / "collection.anki21b"
+    make_collection(deck)
+    zip_pkg: Path = w_dir / "test.apkg"
+    with ZipFile(zip_pkg, mode="w") as z:
+        z.writestr("collection.anki2", b"legacy placeholder")
+        z.writestr(deck.name, zstd.compress(deck.read_bytes()))
+        z.writestr("media", zstd.media_map({"0": "moien.mp3"}))
+        z.writestr("0", zstd.compress(b"ID3" + bytes(256)))
+    deck.unlink()
+    yield Configuration.parse_obj({"zip_path": zip_pkg, "deck_suffix": "anki21"})
+    shutil.rmtree(w_dir)
+
+
+def test_media_map_round_trip() -> None:
+    """Tests media maps read back, members by position or legacy zip name."""
+    names: dict[str, str] = {"0": "moien.mp3", "1": "äddi.jpg", "7": "hond.png"}
+    assert zstd.media_names(zstd.media_map(names)) == names
+    with pytest.raises(ValueError):
+        zstd.media_names(b"not zstd")
+
+
+def test_media_map_fields() -> None:
+    """Tests fields of other types are skipped, invalid messages rejected.
+
+    GIVEN media maps with fixed-size fields, and an entry whose name is a
+        number, then a truncated one, and one with a group field,
+    WHEN their names are read,
+    THEN the other fields and the unnamed entry are skipped, the invalid maps
+        raise ValueError.
+    """
+    entry: bytes = (
+        zstd._length_field(zstd._name_field, b"moien.mp3")
+        + b"\x15"  # field 2, fixed32
+        + bytes(4)
+        + b"\x19"  # field 3, fixed64
+        + bytes(8)
+    )
+    message: bytes = zstd._length_field(zstd._entries_field, entry)
+    message += zstd._length_field(zstd._entries_field, zstd._varint_field(1, 7))
+    assert zstd.media_names(zstd.compress(message)) == {"0": "moien.mp3"}
+    with pytest.raises(ValueError, match="truncated"):
+        zstd.media_names(zstd.compress(b"\x0a\x01\x80"))
+    with pytest.raises(ValueError, match="wire type 3"):
+        zstd.media_names(zstd.compress(b"\x0b"))
+
+
+def test_decompress_frames() -> None:
+    """Tests all concatenated frames are decompressed, not only the first."""
+    data: bytes = zstd.compress(b"Moien" * 200) + zstd.compress(b"Addi" * 250)
+    assert zstd.decompress(data) == b"Moien" * 200 + b"Addi" * 250
+    names: dict[str, str] = {"0": "moien.mp3", "1": "hond.png"}
+    message: bytes = zstd.decompress(zstd.media_map(names))
+    frames: bytes = zstd.compress(message[:9]) + zstd.compress(message[9:])
+    assert zstd.media_names(frames) == names
+
+
+@pytest.mark.parametrize("work_area", work_areas)
+def test_anki21b_round_trip(
+    anki21b_pkg: Configuration, work_area: str, tmp_path: Path
+) -> None:
+    """Tests zstd deck is decompressed for use, and re-compressed on export.
+
+    GIVEN a newer-format package (disk or memory work area),
+    WHEN the handler deletes a note and shuts down,
+    THEN
+        the deck is exported zstd-compressed (and zip stored),
+        it decompresses to the changed collection,
+        other members are kept as they were.
+    """
+    anki21b_pkg.work_area = work_area  # type: ignore[assignment]
+    with ZipFile(anki21b_pkg.zip_path) as old:
+        media: bytes = old.read("0")
+    handler: mgr.Handler = mgr.Handler(anki21b_pkg)
+    assert handler._deck_name == "collection.anki21b"
+    with handler.db.transaction() as conn:
+        conn.execute("DELETE FROM notes WHERE id = 1")
+    handler.__del__()
+
+    with ZipFile(anki21b_pkg.zip_path) as new:
+        assert new.getinfo("collection.anki21b").compress_type == ZIP_STORED
+        data: bytes = new.read("collection.anki21b")
+        assert new.read("0") == media
+        assert new.read("collection.anki2") == b"legacy placeholder"
+    assert zstd.is_zstd(data)
+    assert note_ids(zstd.decompress(data), tmp_path) == [2, 3]
+
+
+def test_anki21b_unchanged(anki21b_pkg: Configuration) -> None:
+    """Tests reading a zstd deck doesn't count as a change."""
+    timestamp: float = anki21b_pkg.zip_path.stat().st_mtime
+    handler: mgr.Handler = mgr.Handler(anki21b_pkg)
+    assert len(handler.db.notes(handler.db.note(1)["mid"])) == 3  # type: ignore
+    handler.__del__()
+    assert anki21b_pkg.zip_path.stat().st_mtime == timestamp
+    assert not list(anki21b_pkg.zip_path.parent.glob(f"*{mgr._orig_pkg_flag}*"))